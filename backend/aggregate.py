@@ -0,0 +1,185 @@
+import re
+
+import numpy as np
+
+from building_store import NUMERIC_ATTRS, STRING_ATTRS
+
+# Per-building ratios computed from the numeric columns on first use
+DERIVED_ATTRS = {
+    # Assessed value per square metre of lot
+    "value_per_sm": ("assessed_value", "land_size_sm"),
+}
+
+GROUP_ATTRS = tuple(a for a in STRING_ATTRS if a != "address")
+METRIC_ATTRS = NUMERIC_ATTRS + tuple(DERIVED_ATTRS)
+
+# "count", or "<agg>:<attr>" with agg one of these or pNN (percentile 0-100)
+AGGREGATIONS = ("sum", "mean", "min", "max", "median")
+DEFAULT_METRICS = ("count", "sum:assessed_value", "mean:assessed_value", "mean:value_per_sm")
+
+
+class AggregateError(ValueError):
+    pass
+
+
+def parse_metrics(metrics):
+    """
+    Validate metric names; returns them as (name, agg, attr, percentile)
+    tuples with agg None for "count".
+    """
+    parsed = []
+    for name in metrics:
+        if name == "count":
+            parsed.append((name, None, None, None))
+            continue
+        agg, _, attr = str(name).partition(":")
+        if attr not in METRIC_ATTRS:
+            raise AggregateError(f"Unknown metric attribute in {name!r} (use {', '.join(METRIC_ATTRS)})")
+        if agg == "median":
+            parsed.append((name, "pct", attr, 50.0))
+        elif re.fullmatch(r"p\d{1,2}(?:\.\d+)?|p100", agg):
+            parsed.append((name, "pct", attr, float(agg[1:])))
+        elif agg in AGGREGATIONS:
+            parsed.append((name, agg, attr, None))
+        else:
+            raise AggregateError(f"Unknown aggregation in {name!r} (use count, {', '.join(AGGREGATIONS)} or pNN)")
+    return parsed
+
+
+def metric_order(store, attr):
+    """
+    (column, rows with a value in ascending value order) for a metric
+    attribute. Numeric attributes reuse the store's sorted index; derived
+    ratios are computed and sorted once per store.
+    """
+    if attr in store.numeric:
+        return store.numeric[attr], store.sorted_rows[attr]
+    derived = getattr(store, "derived", None)
+    if derived is None:
+        derived = store.derived = {}
+    if attr not in derived:
+        num, den = DERIVED_ATTRS[attr]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            col = store.numeric[num] / store.numeric[den]
+        col[~np.isfinite(col)] = np.nan
+        rows = np.flatnonzero(~np.isnan(col))
+        derived[attr] = col, rows[np.argsort(col[rows], kind="stable")]
+    return derived[attr]
+
+
+def _grouped_stats(g, v, n_groups, aggs):
+    """
+    Per-group aggregates of the values `v` (ascending, no missing values) in
+    groups `g`: sum/mean by bincount, min/max/percentiles by position after
+    a stable sort on the group number, which keeps each group's values in
+    ascending order.
+    """
+    n = np.bincount(g, minlength=n_groups)
+    out = {}
+
+    sums = np.bincount(g, weights=v, minlength=n_groups)
+    for name, agg, pct in aggs:
+        if agg == "sum":
+            out[name] = sums
+        elif agg == "mean":
+            out[name] = np.where(n > 0, sums / np.maximum(n, 1), np.nan)
+
+    if not any(agg in ("min", "max", "pct") for _, agg, _ in aggs):
+        return out
+
+    if n_groups > 1:
+        # Small non-negative keys: the stable sort is a linear-time radix sort
+        key = g.astype(np.uint16) if n_groups <= np.iinfo(np.uint16).max else g
+        v = v[np.argsort(key, kind="stable")]
+    v = np.append(v, np.nan)  # empty groups index this slot
+    empty = n == 0
+    start = np.where(empty, len(v) - 1, np.concatenate(([0], np.cumsum(n)[:-1])))
+    for name, agg, pct in aggs:
+        if agg == "min":
+            out[name] = v[start]
+        elif agg == "max":
+            out[name] = v[np.where(empty, start, start + n - 1)]
+        elif agg == "pct":
+            # Linear interpolation between closest ranks, like np.percentile
+            pos = pct / 100.0 * np.maximum(n - 1, 0)
+            lo = np.floor(pos).astype(np.int64)
+            hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+            a = v[np.where(empty, start, start + lo)]
+            b = v[np.where(empty, start, start + hi)]
+            out[name] = a + (b - a) * (pos - lo)
+    return out
+
+
+def _json_number(x):
+    x = float(x)
+    if np.isnan(x):
+        return None
+    return int(x) if x.is_integer() and abs(x) < 2 ** 53 else round(x, 4)
+
+
+def aggregate(store, rows, group_by=None, metrics=DEFAULT_METRICS):
+    """
+    Metrics over the buildings in `rows`, overall and (optionally) per value
+    of a categorical attribute. Groups are the attribute's precomputed value
+    codes, so grouping is a gather + bincount rather than a dict per row;
+    rows without a value form a group keyed None.
+    """
+    parsed = parse_metrics(metrics)
+    if group_by is not None and group_by not in GROUP_ATTRS:
+        raise AggregateError(f"group_by must be one of {', '.join(GROUP_ATTRS)}")
+
+    if group_by is None:
+        row_groups = np.zeros(len(store), dtype=np.int64)
+        n_groups = 1
+    else:
+        # Codes are -1 for missing: shift so that group 0 is "no value"
+        row_groups = store.codes[group_by].astype(np.int64) + 1
+        n_groups = len(store.categories[group_by]) + 1
+    groups = row_groups[rows]
+
+    selected = np.zeros(len(store), dtype=bool)
+    selected[rows] = True
+
+    columns = {}
+    counts = np.bincount(groups, minlength=n_groups)
+    by_attr = {}
+    for name, agg, attr, pct in parsed:
+        if agg is not None:
+            by_attr.setdefault(attr, []).append((name, agg, pct))
+    for attr, aggs in by_attr.items():
+        # Selected rows with a value, already in value order
+        col, order = metric_order(store, attr)
+        order = order[selected[order]]
+        v = col[order]
+        columns.update(_grouped_stats(row_groups[order], v, n_groups, aggs))
+        if group_by is not None:
+            total = _grouped_stats(np.zeros(len(v), dtype=np.int64), v, 1, aggs)
+            columns.update({("total", k): x for k, x in total.items()})
+
+    def metrics_of(g, total=False):
+        out = {}
+        for name, agg, _, _ in parsed:
+            if agg is None:
+                out[name] = int(counts.sum() if total else counts[g])
+            else:
+                col = columns[("total", name)] if total else columns[name]
+                out[name] = _json_number(col[0] if total else col[g])
+        return out
+
+    if group_by is None:
+        return {"count": len(rows), "total": metrics_of(0)}
+
+    # Largest groups first; each keyed by its value's original spelling,
+    # read off the group's first row
+    present, first = np.unique(groups, return_index=True)
+    order = np.lexsort((present, -counts[present]))
+    result_groups = [
+        {"key": None if g == 0 else store.buildings[int(rows[i])].get(group_by), **metrics_of(g)}
+        for g, i in zip(present[order].tolist(), first[order].tolist())
+    ]
+    return {
+        "group_by": group_by,
+        "count": len(rows),
+        "total": metrics_of(None, total=True),
+        "groups": result_groups,
+    }
@@ -1,10 +1,23 @@
 import os
+import base64
+import hmac
 import json
+import math
 import re
-import requests
+import time
+import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from data_loader import load_buildings
+from aggregate import DEFAULT_METRICS, GROUP_ATTRS, AggregateError, aggregate, parse_metrics
+from building_store import NUMERIC_ATTRS
+from dataset import PAYLOAD_FORMATS, DatasetManager
+from llm_client import LLMClient, LLMError
+from lod import MAX_LOD, building_at
+from payload import json_payload
+from query_cache import TTLCache, canonical_filter_key, normalize_query_text
+from query_parser import MIN_CONFIDENCE, ParseStats
+from query_planner import BOOLEAN_KEYS, FilterError, validate_filter
+from spatial_index import tile_bounds
 from dotenv import load_dotenv
 
 # -------------------------------------
@@ -12,105 +25,225 @@ from dotenv import load_dotenv
 # -------------------------------------
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+# How long a request waits on the LLM before answering from the fallback parser
+LLM_WAIT_SECONDS = float(os.getenv("LLM_WAIT_SECONDS", "10"))
+# Local parses at or above this confidence skip the LLM
+LOCAL_PARSE_MIN_CONFIDENCE = float(os.getenv("LOCAL_PARSE_MIN_CONFIDENCE", str(MIN_CONFIDENCE)))
+
+# Enables POST /api/admin/reload; poll interval (s) for dataset file changes
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+DATASET_WATCH_SECONDS = float(os.getenv("DATASET_WATCH_SECONDS", "0"))
+
+# /api/query pagination: page size when only order_by/fields/cursor is given,
+# and the largest page a client may ask for
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+QUERY_MAX_LIMIT = int(os.getenv("QUERY_MAX_LIMIT", "10000"))
+# Most queries one /api/query/batch request may carry
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "50"))
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Load buildings once at startup
-buildings = load_buildings()
+# Query caches: raw query text -> parsed filter JSON (skips the LLM call),
+# and (dataset version, canonical filter JSON) -> matching ids (skips the
+# filter evaluation). The version keeps a request still finishing on an old
+# snapshot from caching its result for the new one.
+parse_cache = TTLCache(
+    maxsize=int(os.getenv("PARSE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PARSE_CACHE_TTL", "86400")),
+)
+result_cache = TTLCache(
+    maxsize=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+)
 
-# Which attributes are numeric / string
-NUMERIC_ATTRS = {"height", "assessed_value", "land_size_sm"}
-STRING_ATTRS = {
-    "stage",
-    "land_use_designation",
-    "community",
-    "property_type",
-    "address",
-}
+# Pre-serialized tile payloads keyed by "v<version>:z/x/y@lod" (no expiry; cleared on reload)
+MAX_TILE_ZOOM = 20
+tile_cache = TTLCache(maxsize=int(os.getenv("TILE_CACHE_SIZE", "512")), ttl=0)
+
+
+def invalidate_caches(ds):
+    parse_cache.clear()
+    result_cache.clear()
+    tile_cache.clear()
+
+
+# Where parses came from (cache / local compiler / LLM / fallback)
+parse_stats = ParseStats()
+
+# Load buildings once at startup (columnar store for filtering + building
+# dicts); reloads build a new snapshot and swap it in, see dataset.py
+datasets = DatasetManager(on_swap=invalidate_caches)
 
 
 # -------------------------------------
 # LLM INTEGRATION (GROQ)
 # -------------------------------------
-def query_llm(prompt: str) -> str:
-    if not GROQ_API_KEY:
-        print("⚠️ No GROQ_API_KEY found – using fallback parser")
-        return parse_query_fallback(prompt)
-
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
+# Queries are turned into filter JSON by the LLM; the client pools
+# connections and coalesces identical in-flight queries (see llm_client.py)
+SYSTEM_PROMPT = (
+    "You ONLY output JSON. No explanations. No markdown.\n"
+    "Your job is to convert natural language queries into filter JSON.\n\n"
+
+    "SUPPORTED ATTRIBUTES:\n"
+    "- \"height\" (meters)\n"
+    "- \"assessed_value\" (CAD)\n"
+    "- \"land_size_sm\" (square metres)\n"
+    "- \"land_use_designation\" (e.g., R-CG, C-COR, etc.)\n"
+    "- \"community\" (neighbourhood name)\n"
+    "- \"property_type\" (e.g., LI, LO, etc.)\n"
+    "- \"address\" (string)\n"
+    "- \"stage\" (string)\n"
+    "- \"location\" (spatial, see below)\n\n"
+
+    "SUPPORTED OPERATORS:\n"
+    "- numeric: \">\", \"<\", \">=\", \"<=\", \"=\", \"max\", \"min\"\n"
+    "- string: \"=\", \"contains\" (case-insensitive)\n"
+    "- both: \"in\" (list of values); numeric: \"between\" ([low, high], inclusive), "
+    "\"top_k\" (value k, \"order\": \"desc\" or \"asc\")\n\n"
+
+    "SINGLE FILTER FORMAT:\n"
+    "{\"attribute\": \"height\", \"operator\": \">\", \"value\": 20}\n\n"
+
+    "MULTI-FILTER FORMAT (AND):\n"
+    "{\"filters\": [\n"
+    "  {\"attribute\": \"assessed_value\", \"operator\": \">\", \"value\": 1000000},\n"
+    "  {\"attribute\": \"height\", \"operator\": \">\", \"value\": 30}\n"
+    "]}\n\n"
+
+    "NESTED LOGIC (and / or / not, any depth):\n"
+    "{\"and\": [\n"
+    "  {\"or\": [\n"
+    "    {\"attribute\": \"community\", \"operator\": \"=\", \"value\": \"BELTLINE\"},\n"
+    "    {\"attribute\": \"community\", \"operator\": \"=\", \"value\": \"DOWNTOWN COMMERCIAL CORE\"}\n"
+    "  ]},\n"
+    "  {\"not\": {\"attribute\": \"property_type\", \"operator\": \"=\", \"value\": \"LO\"}}\n"
+    "]}\n\n"
+
+    "LISTS, RANGES AND TOP-K:\n"
+    "{\"attribute\": \"land_use_designation\", \"operator\": \"in\", \"value\": [\"CC-X\", \"CC-MH\"]}\n"
+    "{\"attribute\": \"height\", \"operator\": \"between\", \"value\": [20, 50]}\n"
+    "\"10 tallest buildings\" -> "
+    "{\"attribute\": \"height\", \"operator\": \"top_k\", \"value\": 10, \"order\": \"desc\"}\n\n"
+
+    "SPATIAL (attribute \"location\"; a point is {\"address\": \"800 3 ST SE\"}, "
+    "{\"lon\": -114.06, \"lat\": 51.04} or {\"building\": id}; distances in metres):\n"
+    "\"within 300m of 800 3 St SE\" -> "
+    "{\"attribute\": \"location\", \"operator\": \"within_radius\", "
+    "\"value\": {\"center\": {\"address\": \"800 3 ST SE\"}, \"radius\": 300}}\n"
+    "\"5 closest buildings to 201 10 Av SE\" -> "
+    "{\"attribute\": \"location\", \"operator\": \"nearest_k\", "
+    "\"value\": {\"center\": {\"address\": \"201 10 AV SE\"}, \"k\": 5}}\n"
+    "Inside a polygon: {\"attribute\": \"location\", \"operator\": \"within_polygon\", "
+    "\"value\": [{\"lon\": ..., \"lat\": ...}, ...]}\n\n"
+
+    "SUPERLATIVES:\n"
+    "\"most expensive property\" -> "
+    "{\"attribute\": \"assessed_value\", \"operator\": \"max\", \"value\": 0}\n"
+    "\"cheapest\" -> "
+    "{\"attribute\": \"assessed_value\", \"operator\": \"min\", \"value\": 0}\n"
+    "\"largest lot\" -> "
+    "{\"attribute\": \"land_size_sm\", \"operator\": \"max\", \"value\": 0}\n"
+    "\"smallest lot\" -> "
+    "{\"attribute\": \"land_size_sm\", \"operator\": \"min\", \"value\": 0}\n\n"
+
+    "ALWAYS output valid JSON only."
+)
+
+llm = LLMClient(
+    GROQ_API_KEY,
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    read_timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+)
+
+
+def _cache_llm_reply(cache_key, version):
+    """
+    Done-callback for an LLM call: cache its parsed filter, so a reply that
+    arrives after the request gave up on it still serves the next one.
+    Dropped if the dataset was reloaded since `version` (the parse cache was
+    cleared for the new snapshot and the reply was built for the old one).
+    """
+    def done(future):
+        if datasets.current.version != version:
+            return
+        if future.exception() is None:
+            filt = extract_json_block(future.result())
+            if filt:
+                parse_cache.put(cache_key, filt)
+    return done
 
-    # -------------------------------
-    # UPDATED SYSTEM PROMPT (IMPORTANT)
-    # -------------------------------
-    SYSTEM_PROMPT = (
-        "You ONLY output JSON. No explanations. No markdown.\n"
-        "Your job is to convert natural language queries into filter JSON.\n\n"
-
-        "SUPPORTED ATTRIBUTES:\n"
-        "- \"height\" (meters)\n"
-        "- \"assessed_value\" (CAD)\n"
-        "- \"land_size_sm\" (square metres)\n"
-        "- \"land_use_designation\" (e.g., R-CG, C-COR, etc.)\n"
-        "- \"community\" (neighbourhood name)\n"
-        "- \"property_type\" (e.g., LI, LO, etc.)\n"
-        "- \"address\" (string)\n"
-        "- \"stage\" (string)\n\n"
-
-        "SUPPORTED OPERATORS:\n"
-        "- numeric: \">\", \"<\", \">=\", \"<=\", \"=\", \"max\", \"min\"\n"
-        "- string: \"=\", \"contains\" (case-insensitive)\n\n"
-
-        "SINGLE FILTER FORMAT:\n"
-        "{\"attribute\": \"height\", \"operator\": \">\", \"value\": 20}\n\n"
-
-        "MULTI-FILTER FORMAT (AND):\n"
-        "{\"filters\": [\n"
-        "  {\"attribute\": \"assessed_value\", \"operator\": \">\", \"value\": 1000000},\n"
-        "  {\"attribute\": \"height\", \"operator\": \">\", \"value\": 30}\n"
-        "]}\n\n"
-
-        "SUPERLATIVES:\n"
-        "\"most expensive property\" -> "
-        "{\"attribute\": \"assessed_value\", \"operator\": \"max\", \"value\": 0}\n"
-        "\"cheapest\" -> "
-        "{\"attribute\": \"assessed_value\", \"operator\": \"min\", \"value\": 0}\n"
-        "\"largest lot\" -> "
-        "{\"attribute\": \"land_size_sm\", \"operator\": \"max\", \"value\": 0}\n"
-        "\"smallest lot\" -> "
-        "{\"attribute\": \"land_size_sm\", \"operator\": \"min\", \"value\": 0}\n\n"
-
-        "ALWAYS output valid JSON only."
-    )
-
-    payload = {
-        "model": "llama-3.3-70b-versatile",
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.15,
-        "max_tokens": 300,
-    }
 
-    try:
+def parse_query(user_query, ds):
+    """
+    Filter JSON for a natural-language query: parse cache, then the local
+    compiler of the dataset snapshot, then the LLM (only when the local parse
+    is unsure; waiting at most LLM_WAIT_SECONDS), then the fallback parser.
+    Fallback results are only cached when no LLM is configured, so a slow or
+    failed LLM call is retried on the next request.
+    """
+    return parse_queries([user_query], ds)[0]
+
+
+def parse_queries(user_queries, ds):
+    """
+    parse_query for several queries at once: every query that needs the LLM
+    is submitted before any is waited on, so their calls run concurrently
+    and share one LLM_WAIT_SECONDS deadline.
+    """
+    filters = [None] * len(user_queries)
+    pending = []
+
+    for i, user_query in enumerate(user_queries):
+        cache_key = normalize_query_text(user_query)
+        filt = parse_cache.get(cache_key)
+        if filt is not None:
+            parse_stats.record("cache")
+            filters[i] = filt
+            continue
+
+        local = ds.compiler.compile(user_query)
+        if local.filter and (local.confidence >= LOCAL_PARSE_MIN_CONFIDENCE or not llm.enabled):
+            print(f"⚡ Parsed locally (confidence {local.confidence:g})")
+            parse_stats.record("local")
+            parse_cache.put(cache_key, local.filter)
+            filters[i] = local.filter
+            continue
+
+        prompt = f"Convert this query into JSON.\nQuery: \"{user_query}\"\nJSON:"
+        if not llm.enabled:
+            print("⚠️ No GROQ_API_KEY found – using fallback parser")
+            parse_stats.record("fallback")
+            filt = extract_json_block(parse_query_fallback(prompt))
+            if filt:
+                parse_cache.put(cache_key, filt)
+            filters[i] = filt
+            continue
+
         print("📡 Calling Groq API…")
-        r = requests.post(url, headers=headers, json=payload, timeout=30)
-        if r.status_code != 200:
-            print(f"❌ Groq error {r.status_code}: {r.text}")
-            return parse_query_fallback(prompt)
+        future = llm.submit(cache_key, SYSTEM_PROMPT, prompt, on_done=_cache_llm_reply(cache_key, ds.version))
+        pending.append((i, prompt, local, future))
 
-        result = r.json()["choices"][0]["message"]["content"]
-        print(f"✅ Groq response: {result[:150]}...")
-        return result
+    deadline = time.monotonic() + LLM_WAIT_SECONDS
+    for i, prompt, local, future in pending:
+        try:
+            result = llm.wait(future, max(deadline - time.monotonic(), 0))
+            print(f"✅ Groq response: {result[:150]}...")
+        except LLMError as e:
+            print(f"❌ Groq API error: {e}")
+            parse_stats.record("fallback")
+            filters[i] = local.filter or extract_json_block(parse_query_fallback(prompt))
+            continue
+        filt = extract_json_block(result)
+        if filt:
+            parse_stats.record("llm")
+            filters[i] = filt
+        else:
+            # Reply without usable JSON: same fallback as a failed call
+            parse_stats.record("fallback")
+            filters[i] = local.filter or extract_json_block(parse_query_fallback(prompt))
 
-    except Exception as e:
-        print(f"❌ Groq API exception: {e}")
-        return parse_query_fallback(prompt)
+    return filters
 
 
 # -------------------------------------
@@ -187,162 +320,176 @@ def extract_json_block(text: str):
 # -------------------------------------
 # FILTER HELPERS
 # -------------------------------------
-def coerce_number(v):
-    if isinstance(v, (int, float)):
-        return float(v)
-    if isinstance(v, str):
-        try:
-            return float(v)
-        except:
-            return v
-    return v
+def handle_superlative(store, attribute, operator):
+    winners, best = store.superlative(attribute, operator)
 
+    if best is None:
+        return _result(winners[:0])
 
-def apply_numeric(building, attr, op, val):
-    raw = building.get(attr)
-    if raw is None:
-        return False
+    return {
+        **_result(winners),
+        "filter": {"attribute": attribute, "operator": operator, "value": best}
+    }
 
-    try:
-        b_val = float(raw)
-    except:
-        return False  # drop missing vals
 
-    val = coerce_number(val)
-    if op == ">": return b_val > val
-    if op == "<": return b_val < val
-    if op == ">=": return b_val >= val
-    if op == "<=": return b_val <= val
-    if op in ["=", "=="]: return abs(b_val - val) < 1e-6
-    return False
+def _result(rows):
+    """
+    Result of one filter evaluation: matching rows in dataset order (read-only,
+    shared through the result cache) and their count.
+    """
+    rows = np.sort(rows)
+    rows.flags.writeable = False
+    return {"rows": rows, "count": len(rows)}
 
 
-def apply_string(building, attr, op, val):
-    raw = building.get(attr)
-    if raw is None:
-        return False
-    field = str(raw).lower()
-    val = str(val).lower()
+def handle_filter(filt, ds, memo=None):
+    """
+    Evaluate a parsed filter JSON against one dataset snapshot, through the
+    result cache. Flat and compound filters as well as nested and/or/not,
+    in, between and top_k are planned by query_planner.QueryPlanner; `memo`
+    shares predicate lookups across a batch. Raises FilterError for
+    malformed filter JSON. Returned dicts (matching rows, count and the
+    superlative's filter) are shared with the cache and must not be mutated.
+    """
+    validate_filter(filt)
+    key = (ds.version, canonical_filter_key(filt))
+    result = result_cache.get(key)
+    if result is not None:
+        return result
 
-    if op in ["=", "=="]:
-        return field == val
-    if op == "contains":
-        return val in field
-    return False
+    op = str(filt.get("operator", "")).lower()
+    if "attribute" in filt and op in ["max", "min"] and not any(k in filt for k in BOOLEAN_KEYS):
+        # Lone superlative: also reports the winning value. Boolean keys take
+        # priority over the leaf fields (as in the planner and the cache key)
+        result = handle_superlative(ds.store, filt["attribute"], op)
+    else:
+        result = _result(ds.planner.execute(filt, memo))
 
+    result_cache.put(key, result)
+    return result
 
-def apply_single_filter(building, attribute, operator, value):
-    if attribute in NUMERIC_ATTRS:
-        return apply_numeric(building, attribute, operator, value)
-    if attribute in STRING_ATTRS:
-        return apply_string(building, attribute, operator, value)
-    return False
 
+# -------------------------------------
+# PAGINATION + PROJECTION
+# -------------------------------------
+class QueryArgsError(ValueError):
+    pass
 
-def handle_compound_query(filters):
-    """
-    Supports:
-    - normal filters
-    - superlatives (max/min) INSIDE compound filters
-    """
 
-    # Separate superlative filters from normal filters
-    normal_filters = []
-    superlatives = []
+def _encode_cursor(ds, order_by, descending, after):
+    # Opaque to clients; pins the snapshot and ordering the position refers to
+    if order_by is not None:
+        key, row = after
+        after = [None if math.isinf(key) else key, row]
+    raw = json.dumps([ds.version, order_by, descending, after], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
-    for f in filters:
-        op = f.get("operator", "").lower()
-        if op in ["max", "min"]:
-            superlatives.append(f)
-        else:
-            normal_filters.append(f)
-
-    # STEP 1 — apply all normal filters
-    candidates = []
-    for b in buildings:
-        ok = True
-        for f in normal_filters:
-            if not apply_single_filter(b, f["attribute"], f["operator"], f["value"]):
-                ok = False
-                break
-        if ok:
-            candidates.append(b)
-
-    # If no superlatives → return normal results
-    if not superlatives:
-        return jsonify({
-            "ids": [b["id"] for b in candidates],
-            "count": len(candidates),
-            "filters": filters
-        })
-
-    # STEP 2 — apply superlatives on filtered candidates
-    final_ids = set(b["id"] for b in candidates)
-
-    for f in superlatives:
-        attr = f["attribute"]
-        op = f["operator"]
-
-        # Extract numeric values
-        pairs = []
-        for b in candidates:
-            raw = b.get(attr)
-            if raw is None: 
-                continue
-            try:
-                v = float(raw)
-                pairs.append((b["id"], v))
-            except:
-                continue
-
-        if not pairs:
-            continue
 
-        # max/min selection
-        if op == "max":
-            best_val = max(v for _, v in pairs)
+def _decode_cursor(cursor, ds, order_by, descending):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, c_order_by, c_descending, after = json.loads(raw)
+        if order_by is not None:
+            key, row = after
+            after = (math.inf if key is None else float(key), int(row))
         else:
-            best_val = min(v for _, v in pairs)
+            after = int(after)
+    except (ValueError, TypeError):
+        raise QueryArgsError("Invalid cursor")
+    if version != ds.version:
+        raise QueryArgsError("Cursor expired: the dataset was reloaded, start again without a cursor")
+    if (c_order_by, c_descending) != (order_by, descending):
+        raise QueryArgsError("Cursor was issued for a different order_by")
+    return after
 
-        # keep only those matching the superlative
-        final_ids = {
-            bid for (bid, v) in pairs
-            if abs(v - best_val) < 1e-6
-        }
 
-        # reduce candidates list for next superlative (if multiple)
-        candidates = [b for b in candidates if b["id"] in final_ids]
+def _page_args(data):
+    """
+    Pagination/projection options of an /api/query body, or None when the
+    client asked for none of them (then every matching id is returned).
+    """
+    if not any(k in data for k in ("limit", "cursor", "order_by", "fields")):
+        return None
 
-    return jsonify({
-        "ids": list(final_ids),
-        "count": len(final_ids),
-        "filters": filters
-    })
+    limit = data.get("limit", QUERY_PAGE_SIZE)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= QUERY_MAX_LIMIT:
+        raise QueryArgsError(f"limit must be an integer between 1 and {QUERY_MAX_LIMIT}")
+
+    # "-height" (or order: "desc") sorts descending
+    order_by = data.get("order_by")
+    descending = str(data.get("order", "asc")).lower() == "desc"
+    if isinstance(order_by, str) and order_by.startswith("-"):
+        order_by, descending = order_by[1:], True
+    if order_by is not None and order_by not in NUMERIC_ATTRS:
+        raise QueryArgsError(f"order_by must be one of {', '.join(NUMERIC_ATTRS)}")
+    if order_by is None:
+        descending = False
+
+    fields = data.get("fields")
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+        raise QueryArgsError("fields must be a list of attribute names")
+
+    return {
+        "limit": limit,
+        "order_by": order_by,
+        "descending": descending,
+        "cursor": data.get("cursor"),
+        "fields": fields,
+    }
 
 
-def handle_superlative(attribute, operator):
-    values = []
-    for b in buildings:
-        raw = b.get(attribute)
-        if raw is None:
-            continue
-        try:
-            v = float(raw)
-            values.append((b["id"], v))
-        except:
-            continue
+def _explicit_filter(data):
+    """
+    Filter JSON given directly in a request body: "filters" (list, as in a
+    compound query), "filter" (any filter object), or a bare and/or/not or
+    {attribute, operator, value} node. None if the body has none.
+    """
+    if data.get("filters") is not None:
+        filt = {"filters": data["filters"]}
+    elif data.get("filter") is not None:
+        filt = data["filter"]
+    elif any(k in data for k in ("and", "or", "not")):
+        filt = {k: data[k] for k in ("and", "or", "not") if k in data}
+    elif "attribute" in data:
+        filt = {k: data[k] for k in ("attribute", "operator", "value", "order") if k in data}
+    else:
+        return None
 
-    if not values:
-        return jsonify({"ids": [], "count": 0})
+    try:
+        validate_filter(filt)
+    except FilterError as e:
+        raise QueryArgsError(str(e))
+    return filt
 
-    best = max(v for _, v in values) if operator == "max" else min(v for _, v in values)
-    ids = [bid for bid, v in values if abs(v - best) < 1e-6]
 
-    return jsonify({
+def paginate(result, ds, args):
+    """
+    One page of a filter result: ids (and projected rows if fields were
+    asked for) in the requested order, the total count and the cursor of
+    the next page (None on the last one).
+    """
+    after = None
+    if args["cursor"]:
+        after = _decode_cursor(args["cursor"], ds, args["order_by"], args["descending"])
+
+    rows, last = ds.store.page(result["rows"], args["limit"], args["order_by"],
+                               args["descending"], after)
+    ids = ds.store.ids[rows].tolist()
+    page = {
         "ids": ids,
-        "count": len(ids),
-        "filter": {"attribute": attribute, "operator": operator, "value": best}
-    })
+        "count": result["count"],
+        "next_cursor": None if last is None else _encode_cursor(
+            ds, args["order_by"], args["descending"], last),
+    }
+    if args["fields"] is not None:
+        buildings = ds.buildings
+        page["rows"] = [
+            {"id": i, **{f: buildings[r].get(f) for f in args["fields"]}}
+            for i, r in zip(ids, rows.tolist())
+        ]
+    return page
 
 
 # -------------------------------------
@@ -350,33 +497,198 @@ def handle_superlative(attribute, operator):
 # -------------------------------------
 @app.route("/api/query", methods=["POST"])
 def api_query():
+    """
+    Natural-language query -> matching building ids. Optional body fields
+    page the result instead of returning every id: limit, order_by (a numeric
+    attribute, "-attr" or order: "desc" for descending), fields (attributes to
+    return per building) and cursor (next_cursor of the previous page).
+    Filter JSON may be given instead of the query (see _explicit_filter);
+    "explain": true adds the planner's access path per predicate ("plan").
+    """
+    ds = datasets.current
     data = request.get_json(force=True, silent=True) or {}
-    user_query = (data.get("query") or "").strip()
+    user_query = (data.get("query") or "").strip() if isinstance(data.get("query"), str) else ""
+
+    try:
+        page_args = _page_args(data)
+        filt = _explicit_filter(data)
+    except QueryArgsError as e:
+        return jsonify({"ids": [], "count": 0, "error": str(e)}), 400
+
+    if filt is None:
+        if not user_query:
+            return jsonify({"ids": [], "count": 0, "error": "Empty query"})
+        filt = parse_query(user_query, ds)
+        if not filt:
+            return jsonify({"ids": [], "count": 0, "error": "Query parsing failed"})
 
-    if not user_query:
-        return jsonify({"ids": [], "count": 0, "error": "Empty query"})
+    try:
+        response = query_response(filt, handle_filter(filt, ds), ds, page_args)
+    except FilterError as e:
+        return jsonify({"ids": [], "count": 0, "error": f"Invalid filter: {e}"})
+    except QueryArgsError as e:
+        return jsonify({"ids": [], "count": 0, "error": str(e)}), 400
+
+    if data.get("explain"):
+        # Re-run uncached and without memo, so every leaf shows up
+        trace = []
+        ds.planner.execute(filt, trace=trace)
+        response["plan"] = trace
+    return jsonify(response)
 
-    prompt = f"Convert this query into JSON.\nQuery: \"{user_query}\"\nJSON:"
-    llm_output = query_llm(prompt)
-    filt = extract_json_block(llm_output)
 
-    if not filt:
-        return jsonify({"ids": [], "count": 0, "error": "Query parsing failed"})
+def query_response(filt, result, ds, page_args=None):
+    """
+    /api/query response body for an evaluated filter: every matching id, or
+    one page of them, plus the filter(s) the query ran as.
+    """
+    if page_args is None:
+        response = {"ids": ds.store.ids[result["rows"]].tolist(), "count": result["count"]}
+    else:
+        response = paginate(result, ds, page_args)
 
-    # Multi-filter
+    # Echo the filter(s) this request parsed to; superlatives report their own
     if "filters" in filt:
-        return handle_compound_query(filt["filters"])
+        return {**response, "filters": filt["filters"]}
+    return {**response, "filter": result.get("filter", filt)}
+
+
+@app.route("/api/query/batch", methods=["POST"])
+def api_query_batch():
+    """
+    Several queries in one round-trip (e.g. the highlighted layers of a
+    saved view). Body: {"queries": [...]}, each item a natural-language
+    string, {"query": ...}, or filter JSON ({"filters": [...]}, {"filter":
+    ...} or a bare and/or/not or {attribute, operator, value} node); object
+    items accept the /api/query paging fields. Returns {"results": [...]}
+    in the same order, each shaped like an /api/query response, or {"error"}
+    for that item.
+
+    Queries needing the LLM are parsed concurrently, and every distinct
+    predicate across the batch is looked up in the indexes only once.
+    """
+    ds = datasets.current
+    data = request.get_json(force=True, silent=True) or {}
+    items = data.get("queries")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "queries must be a non-empty list"}), 400
+    if len(items) > QUERY_BATCH_MAX:
+        return jsonify({"error": f"At most {QUERY_BATCH_MAX} queries per batch"}), 400
+
+    # Pass 1: validate, collect filter JSON and the NL queries to parse
+    filters = [None] * len(items)
+    page_args = [None] * len(items)
+    errors = {}
+    to_parse = {}
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict):
+            errors[i] = "Each query must be a string or an object"
+            continue
+        try:
+            page_args[i] = _page_args(item)
+            filters[i] = _explicit_filter(item)
+        except QueryArgsError as e:
+            errors[i] = str(e)
+            continue
+        if filters[i] is None:
+            text = (item.get("query") or "").strip() if isinstance(item.get("query"), str) else ""
+            if not text:
+                errors[i] = "Empty query"
+            else:
+                to_parse[i] = text
+
+    # Pass 2: parse (LLM calls concurrently)
+    parsed = parse_queries(list(to_parse.values()), ds)
+    for i, filt in zip(to_parse, parsed):
+        if filt:
+            filters[i] = filt
+        else:
+            errors[i] = "Query parsing failed"
+
+    # Pass 3: evaluate with a predicate memo shared by the whole batch
+    memo = {}
+    results = []
+    for i, filt in enumerate(filters):
+        if i in errors:
+            results.append({"ids": [], "count": 0, "error": errors[i]})
+            continue
+        try:
+            results.append(query_response(filt, handle_filter(filt, ds, memo), ds, page_args[i]))
+        except FilterError as e:
+            results.append({"ids": [], "count": 0, "error": f"Invalid filter: {e}"})
+        except QueryArgsError as e:
+            results.append({"ids": [], "count": 0, "error": str(e)})
 
-    # Single filter
-    attr = filt.get("attribute")
-    op = (filt.get("operator") or "").lower()
-    val = filt.get("value")
+    return jsonify({"results": results})
 
-    if op in ["max", "min"]:
-        return handle_superlative(attr, op)
 
-    matches = [b["id"] for b in buildings if apply_single_filter(b, attr, op, val)]
-    return jsonify({"ids": matches, "count": len(matches), "filter": filt})
+# -------------------------------------
+# API: AGGREGATE
+# -------------------------------------
+def _filter_arg(data, ds):
+    """
+    Filter JSON of an /api/aggregate body: filter JSON (see _explicit_filter)
+    or a natural-language "query". None selects every building.
+    """
+    filt = _explicit_filter(data)
+    query = data.get("query")
+    if query is not None and not isinstance(query, str):
+        raise QueryArgsError("query must be a string")
+    if filt is None and (query or "").strip():
+        filt = parse_query(query.strip(), ds)
+        if not filt:
+            raise QueryArgsError("Query parsing failed")
+    return filt
+
+
+@app.route("/api/aggregate", methods=["GET", "POST"])
+def api_aggregate():
+    """
+    Dashboard statistics over the buildings matching a filter, overall and
+    grouped by a categorical attribute, computed server-side and cached per
+    (dataset version, filter, group_by, metrics).
+
+    POST {"filters" | "filter" | "query", "group_by", "metrics"}; GET takes
+    ?group_by= and ?metrics=a,b over all buildings. Metrics are "count" or
+    "<agg>:<attr>" with agg sum/mean/min/max/median/pNN and attr a numeric
+    attribute or value_per_sm.
+    """
+    ds = datasets.current
+    if request.method == "POST":
+        data = request.get_json(force=True, silent=True) or {}
+    else:
+        data = {"group_by": request.args.get("group_by")}
+        if request.args.get("metrics"):
+            data["metrics"] = request.args["metrics"].split(",")
+
+    group_by = data.get("group_by") or None
+    metrics = data.get("metrics") or list(DEFAULT_METRICS)
+    if isinstance(metrics, str):
+        metrics = metrics.split(",")
+    if not isinstance(metrics, list):
+        return jsonify({"error": "metrics must be a list"}), 400
+    metrics = [str(m).strip() for m in metrics]
+
+    # Validate before the inputs become part of the cache key
+    if group_by is not None and group_by not in GROUP_ATTRS:
+        return jsonify({"error": f"group_by must be one of {', '.join(GROUP_ATTRS)}"}), 400
+    try:
+        parse_metrics(metrics)
+        filt = _filter_arg(data, ds)
+        key = (ds.version, "aggregate", filt and canonical_filter_key(filt), group_by, tuple(metrics))
+        result = result_cache.get(key)
+        if result is None:
+            rows = ds.store.all_rows() if filt is None else handle_filter(filt, ds)["rows"]
+            result = aggregate(ds.store, rows, group_by, metrics)
+            result_cache.put(key, result)
+    except (AggregateError, FilterError, QueryArgsError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if filt is None:
+        return jsonify(result)
+    return jsonify({**result, "filter": filt})
 
 
 # -------------------------------------
@@ -384,7 +696,111 @@ def api_query():
 # -------------------------------------
 @app.route("/api/buildings")
 def api_buildings():
-    return jsonify(buildings)
+    """
+    Full dataset, serialized and compressed once at load time.
+    ?format=binary returns the compact vertex-buffer layout from payload.py,
+    ?lod=1..MAX_LOD returns simplified footprints.
+    """
+    fmt = request.args.get("format", "json")
+    if fmt not in PAYLOAD_FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    return datasets.current.payload(fmt, _lod_arg()).serve()
+
+
+# -------------------------------------
+# API: SPATIAL WINDOWS
+# -------------------------------------
+def _lod_arg():
+    lod = request.args.get("lod", 0, type=int)
+    return min(max(lod, 0), MAX_LOD)
+
+
+def _float_args(*names):
+    try:
+        return [float(request.args[n]) for n in names]
+    except (KeyError, ValueError):
+        return None
+
+
+@app.route("/api/buildings/bbox")
+def api_buildings_bbox():
+    """
+    Buildings whose footprint bounds intersect ?minx=&miny=&maxx=&maxy=
+    (footprint / scene coordinates, metres). Accepts ?lod= like /api/buildings.
+    """
+    window = _float_args("minx", "miny", "maxx", "maxy")
+    if window is None or any(math.isnan(v) for v in window):
+        return jsonify({"error": "minx, miny, maxx and maxy are required numbers"}), 400
+    minx, miny, maxx, maxy = window
+    if minx > maxx or miny > maxy:
+        return jsonify({"error": "minx must not exceed maxx, nor miny maxy"}), 400
+
+    ds = datasets.current
+    lod = _lod_arg()
+    rows = ds.store.rows_in_bbox(*window)
+    return jsonify([building_at(ds.buildings[i], lod) for i in rows])
+
+
+@app.route("/api/tiles")
+def api_tiles():
+    """
+    Tiling scheme for /api/tiles/<z>/<x>/<y>: tile 0/0/0 is the square
+    around this extent and every zoom level splits tiles into four.
+    """
+    return jsonify({
+        "extent": list(datasets.current.store.spatial.extent),
+        "max_zoom": MAX_TILE_ZOOM,
+        "max_lod": MAX_LOD,
+        "url": "/api/tiles/{z}/{x}/{y}",
+    })
+
+
+@app.route("/api/tiles/<int:z>/<int:x>/<int:y>")
+def api_tile(z, x, y):
+    """
+    Buildings intersecting one quadtree tile. A building crossing a tile edge
+    is returned by every tile it touches, so clients should dedupe by id.
+    Accepts ?lod= like /api/buildings.
+    """
+    if z > MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": f"Tile {z}/{x}/{y} out of range"}), 400
+
+    ds = datasets.current
+    lod = _lod_arg()
+    key = f"v{ds.version}:{z}/{x}/{y}@{lod}"
+    payload = tile_cache.get(key)
+    if payload is None:
+        rows = ds.store.rows_in_bbox(*tile_bounds(ds.store.spatial.extent, z, x, y))
+        payload = json_payload([building_at(ds.buildings[i], lod) for i in rows])
+        tile_cache.put(key, payload)
+    return payload.serve()
+
+
+# -------------------------------------
+# ADMIN: DATASET RELOAD
+# -------------------------------------
+@app.route("/api/admin/reload", methods=["POST"])
+def api_admin_reload():
+    """
+    Reload the dataset from disk without a restart: the new snapshot is
+    built in the background while this one keeps serving, then swapped in
+    and every cache cleared. Needs ADMIN_TOKEN (X-Admin-Token header or
+    Bearer). ?wait=1 answers once the new snapshot is live.
+
+    Only reaches the worker that handles the request; with several gunicorn
+    workers use DATASET_WATCH_SECONDS, which every worker runs.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin API disabled (ADMIN_TOKEN not set)"}), 403
+
+    auth = request.headers.get("Authorization", "")
+    token = request.headers.get("X-Admin-Token") or auth.removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Invalid admin token"}), 401
+
+    wait = request.args.get("wait", "0").lower() in ("1", "true", "yes")
+    started = datasets.reload(wait=wait)
+    return jsonify({"started": started, **datasets.status()}), 200 if wait else 202
 
 
 # -------------------------------------
@@ -394,9 +810,17 @@ def api_buildings():
 def health():
     return jsonify({
         "status": "ok",
-        "buildings_loaded": len(buildings),
+        "buildings_loaded": len(datasets.current.buildings),
+        "dataset": datasets.status(),
         "llm_available": bool(GROQ_API_KEY),
         "provider": "Groq" if GROQ_API_KEY else "Fallback",
+        "llm": llm.stats(),
+        "query_parser": parse_stats.stats(),
+        "cache": {
+            "parse": parse_cache.stats(),
+            "result": result_cache.stats(),
+            "tiles": tile_cache.stats(),
+        },
     })
 
 
@@ -406,5 +830,6 @@ def health():
 if __name__ == "__main__":
     # Local development mode only
     print("🏙️ URBAN 3D DASHBOARD BACKEND (LOCAL DEV)")
-    print(f"📊 Loaded: {len(buildings)} buildings")
+    print(f"📊 Loaded: {len(datasets.current.buildings)} buildings")
+    datasets.watch(DATASET_WATCH_SECONDS)
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
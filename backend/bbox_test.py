@@ -18,21 +18,25 @@
 # print("\nFootprint coords:")
 # print(coords)
 
-import json
+import math
+import os
 
-path = "backend/data/raw/3D_Buildings_-_Citywide_20251205.geojson"
+from geojson_stream import iter_features
 
-with open(path) as f:
-    data = json.load(f)
+path = os.path.join(os.path.dirname(__file__), "data", "raw", "3D_Buildings_-_Citywide_20251205.geojson")
 
-features = data["features"]
+min_lon = min_lat = math.inf
+max_lon = max_lat = -math.inf
 
-min_lon = min(pt[0] for f in features for pt in f["geometry"]["coordinates"][0])
-max_lon = max(pt[0] for f in features for pt in f["geometry"]["coordinates"][0])
-min_lat = min(pt[1] for f in features for pt in f["geometry"]["coordinates"][0])
-max_lat = max(pt[1] for f in features for pt in f["geometry"]["coordinates"][0])
+# One feature at a time, so the citywide file never sits in memory whole
+for f in iter_features(path):
+    for pt in f["geometry"]["coordinates"][0]:
+        min_lon = min(min_lon, pt[0])
+        max_lon = max(max_lon, pt[0])
+        min_lat = min(min_lat, pt[1])
+        max_lat = max(max_lat, pt[1])
 
 print("min_lon =", min_lon)
 print("max_lon =", max_lon)
 print("min_lat =", min_lat)
-print("max_lat =", max_lat)
\ No newline at end of file
+print("max_lat =", max_lat)
@@ -0,0 +1,114 @@
+"""
+Peak RSS and wall time of json.load vs the streaming GeoJSON reader.
+
+Writes a synthetic parcel-like FeatureCollection, then reads it in a fresh
+subprocess per approach (so each peak RSS is measured in isolation), doing
+the same bbox filter preprocess_parcels.py does.
+
+    python bench_geojson_stream.py
+    python bench_geojson_stream.py --features 50000 200000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from profiling import peak_rss_mb
+
+BBOX = (-114.07, 51.04, -114.05, 51.05)
+
+
+def write_synthetic(path, count, seed=0):
+    rnd = random.Random(seed)
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "features": [')
+        for i in range(count):
+            lon = rnd.uniform(-114.3, -113.9)
+            lat = rnd.uniform(50.85, 51.2)
+            ring = [
+                [lon + 0.0002 * dx, lat + 0.0001 * dy]
+                for dx, dy in [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
+            ]
+            feat = {
+                "type": "Feature",
+                "properties": {
+                    "roll_number": str(100000000 + i),
+                    "address": f"{rnd.randint(1, 9999)} {rnd.randint(1, 99)} ST SW",
+                    "assessed_value": str(rnd.randint(200_000, 5_000_000)),
+                    "comm_name": rnd.choice(["BELTLINE", "DOWNTOWN EAST VILLAGE", "MISSION"]),
+                    "land_use_designation": rnd.choice(["R-CG", "CC-X", "M-H1"]),
+                },
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+            f.write(("," if i else "") + json.dumps(feat))
+        f.write("]}")
+
+
+def in_bbox(feat):
+    ring = feat["geometry"]["coordinates"][0]
+    return any(BBOX[0] <= x <= BBOX[2] and BBOX[1] <= y <= BBOX[3] for x, y in ring)
+
+
+def run(mode, path):
+    """
+    Child-process side: read + filter, print a JSON result line.
+    """
+    t0 = time.perf_counter()
+    if mode == "json.load":
+        with open(path) as f:
+            features = json.load(f)["features"]
+        kept = sum(1 for feat in features if in_bbox(feat))
+    else:
+        import geojson_stream
+        if mode == "stream-builtin":
+            geojson_stream.ijson = None
+        kept = sum(1 for feat in geojson_stream.iter_features(path) if in_bbox(feat))
+    print(json.dumps({
+        "mode": mode,
+        "kept": kept,
+        "seconds": time.perf_counter() - t0,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", type=int, nargs="+", default=[20_000, 100_000, 300_000])
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(*args.run)
+        return
+
+    import geojson_stream
+    modes = ["json.load", "stream-builtin"]
+    if geojson_stream.ijson is not None:
+        modes.append("stream-ijson")
+
+    print(f"{'features':>9} {'file MiB':>9}  {'mode':<15} {'seconds':>8} {'peak RSS MiB':>13} {'kept':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.features:
+            path = os.path.join(tmp, f"parcels_{count}.geojson")
+            write_synthetic(path, count)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+            for mode in modes:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--run", mode, path],
+                    capture_output=True, text=True, check=True,
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                )
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(
+                    f"{count:>9} {size_mb:>9.1f}  {mode:<15} {r['seconds']:>8.2f} "
+                    f"{r['peak_rss_mb']:>13.1f} {r['kept']:>6}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Query latency vs dataset size: per-building Python scan vs the indexed
+BuildingStore.
+
+Synthetic citywide-sized datasets are made by cloning the demo extract in
+data/buildings.json with jittered numbers and renumbered addresses.
+
+    python bench_query_index.py
+    python bench_query_index.py --sizes 1000 10000 100000 --repeat 5
+"""
+import argparse
+import random
+import time
+
+from building_store import BuildingStore, NUMERIC_ATTRS
+from data_loader import load_buildings
+
+QUERIES = {
+    "height > 20": [
+        {"attribute": "height", "operator": ">", "value": 20},
+    ],
+    "land_use = cc-x": [
+        {"attribute": "land_use_designation", "operator": "=", "value": "CC-X"},
+    ],
+    "address contains 4 st": [
+        {"attribute": "address", "operator": "contains", "value": "4 ST"},
+    ],
+    "commercial in east village": [
+        {"attribute": "community", "operator": "contains", "value": "east village"},
+        {"attribute": "land_use_designation", "operator": "contains", "value": "c-"},
+    ],
+    "most expensive": [
+        {"attribute": "assessed_value", "operator": "max", "value": 0},
+    ],
+}
+
+
+# ----------------------------------------
+# SYNTHETIC DATA
+# ----------------------------------------
+def synthesize(base, size, seed=0):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(size):
+        b = dict(base[i % len(base)])
+        b["id"] = i
+        for attr in NUMERIC_ATTRS:
+            if b.get(attr) is not None:
+                b[attr] = round(b[attr] * rnd.uniform(0.5, 1.5), 2)
+        if b.get("address"):
+            number, _, street = b["address"].partition(" ")
+            b["address"] = f"{rnd.randint(1, 9999)} {street}"
+        out.append(b)
+    return out
+
+
+# ----------------------------------------
+# BASELINE: per-building Python scan (pre-index behaviour)
+# ----------------------------------------
+def scan_match(b, f):
+    raw = b.get(f["attribute"])
+    if raw is None:
+        return False
+    op, val = f["operator"], f["value"]
+    if f["attribute"] in NUMERIC_ATTRS:
+        v = float(raw)
+        return v > val if op == ">" else v < val
+    field, val = str(raw).lower(), str(val).lower()
+    return field == val if op == "=" else val in field
+
+
+def scan_query(buildings, filters):
+    normal = [f for f in filters if f["operator"] not in ("max", "min")]
+    sup = [f for f in filters if f["operator"] in ("max", "min")]
+    hits = [b for b in buildings if all(scan_match(b, f) for f in normal)]
+    for f in sup:
+        pairs = [(b["id"], float(b[f["attribute"]])) for b in hits if b.get(f["attribute"]) is not None]
+        best = max(v for _, v in pairs)
+        winners = {i for i, v in pairs if abs(v - best) < 1e-6}
+        hits = [b for b in hits if b["id"] in winners]
+    return [b["id"] for b in hits]
+
+
+def store_query(store, filters):
+    normal = [f for f in filters if f["operator"] not in ("max", "min")]
+    sup = [f for f in filters if f["operator"] in ("max", "min")]
+    rows = store.intersect([store.rows(f["attribute"], f["operator"], f["value"]) for f in normal])
+    for f in sup:
+        rows, _ = store.superlative(f["attribute"], f["operator"], None if not normal else rows)
+    return store.ids_for(rows)
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, result
+
+
+# ----------------------------------------
+# MAIN
+# ----------------------------------------
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 300_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    base = load_buildings()
+
+    print(f"{'size':>8}  {'query':<28} {'scan ms':>9} {'index ms':>9} {'speedup':>8} {'hits':>7}")
+    for size in args.sizes:
+        buildings = synthesize(base, size)
+
+        t0 = time.perf_counter()
+        store = BuildingStore(buildings)
+        build_ms = (time.perf_counter() - t0) * 1000
+        print(f"{size:>8}  {'(index build)':<28} {'':>9} {build_ms:>9.1f}")
+
+        for name, filters in QUERIES.items():
+            scan_ms, expected = best_of(lambda: scan_query(buildings, filters), args.repeat)
+            index_ms, got = best_of(lambda: store_query(store, filters), args.repeat)
+            assert sorted(expected) == got, f"mismatch on {name!r} at size {size}"
+            print(
+                f"{size:>8}  {name:<28} {scan_ms:>9.2f} {index_ms:>9.3f} "
+                f"{scan_ms / max(index_ms, 1e-6):>7.0f}x {len(got):>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
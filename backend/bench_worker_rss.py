@@ -0,0 +1,143 @@
+"""
+Per-worker memory under gunicorn, with and without the shared preloaded
+dataset (Linux only: reads /proc/<pid>/smaps_rollup).
+
+For each mode a gunicorn server is started, warmed up with a few requests,
+and every worker's RSS / PSS / USS is read:
+  RSS  resident pages, shared ones included
+  PSS  shared pages split evenly between the processes mapping them
+  USS  pages private to the worker (what each extra worker really costs)
+
+    python bench_worker_rss.py
+    python bench_worker_rss.py --size 100000 --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {
+    # before: every worker parses buildings.json into its own dicts
+    "json, per worker": {"USE_COLUMNS": "0", "GUNICORN_PRELOAD": "0"},
+    "json, preloaded": {"USE_COLUMNS": "0", "GUNICORN_PRELOAD": "1"},
+    # after: loaded once in the master as mmap'd columns, gc-frozen, forked
+    "columns, preloaded": {"USE_COLUMNS": "1", "GUNICORN_PRELOAD": "1"},
+}
+
+WARMUP = [
+    ("GET", "/api/buildings", None),
+    ("GET", "/api/buildings?format=binary", None),
+    ("POST", "/api/query", {"query": "buildings over 20m"}),
+    ("POST", "/api/query", {"query": "most expensive property"}),
+]
+
+
+def smaps_mb(pid):
+    """
+    (rss, pss, uss) of a process in MiB.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":"):
+                fields[parts[0][:-1]] = int(parts[1])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields["Rss"] / 1024, fields["Pss"] / 1024, uss / 1024
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure(env, workers, timeout=300):
+    port = free_port()
+    env = {
+        **os.environ,
+        **env,
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(workers),
+        "GROQ_API_KEY": "",  # keep the benchmark offline
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                requests.get(base + "/api/health", timeout=5)
+                if len(children(server.pid)) >= workers:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError("gunicorn did not come up")
+            time.sleep(0.2)
+
+        # Several rounds so every worker serves some traffic
+        for _ in range(3 * workers):
+            for method, path, body in WARMUP:
+                requests.request(method, base + path, json=body, timeout=60)
+
+        master = smaps_mb(server.pid)
+        per_worker = [smaps_mb(pid) for pid in children(server.pid)]
+        return master, per_worker
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def synthesize_dataset(size, out_dir):
+    """
+    A `size`-building dataset (cloned from the demo extract), as JSON.
+    """
+    import bench_query_index
+    from data_loader import load_buildings
+
+    path = os.path.join(out_dir, "buildings.json")
+    with open(path, "w") as f:
+        json.dump(bench_query_index.synthesize(load_buildings(), size), f)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--size", type=int, help="synthetic dataset size (default: data/buildings.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"BUILDINGS_COLUMNS_PATH": os.path.join(tmp, "columns")}
+        if args.size:
+            env["BUILDINGS_PATH"] = synthesize_dataset(args.size, tmp)
+
+        print(f"{'mode':<20} {'master RSS':>10} {'worker RSS':>10} {'worker PSS':>10} "
+              f"{'worker USS':>10} {'total PSS':>10}   (MiB, {args.workers} workers)")
+        for name, mode_env in MODES.items():
+            master, per_worker = measure({**env, **mode_env}, args.workers)
+            n = len(per_worker)
+            rss, pss, uss = (sum(w[k] for w in per_worker) / n for k in range(3))
+            total_pss = master[1] + sum(w[1] for w in per_worker)
+            print(f"{name:<20} {master[0]:>10.1f} {rss:>10.1f} {pss:>10.1f} {uss:>10.1f} {total_pss:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
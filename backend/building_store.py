@@ -0,0 +1,767 @@
+import numpy as np
+
+from spatial_index import GridIndex, RingSet, footprint_bounds, footprint_centroids, polygon_area
+
+# Which attributes are numeric / string
+NUMERIC_ATTRS = ("height", "assessed_value", "land_size_sm")
+STRING_ATTRS = (
+    "stage",
+    "land_use_designation",
+    "community",
+    "property_type",
+    "address",
+)
+
+# String attributes that also get a trigram index for "contains"
+TRIGRAM_ATTRS = ("address", "community")
+NGRAM = 3
+
+# Above this many matching distinct values, "contains" switches from a union of
+# posting lists to a vectorized membership test over the per-row value codes
+MAX_POSTINGS_UNION = 64
+
+# Same tolerance the list-based filters used for "=" and superlative ties
+EPSILON = 1e-6
+
+# Spatial filters use this pseudo-attribute and match on footprint centroids
+# (footprint coordinates are metres)
+SPATIAL_ATTR = "location"
+SPATIAL_OPS = ("within_radius", "within_polygon", "nearest_k")
+
+
+def coerce_number(v):
+    if isinstance(v, (int, float)):
+        return float(v)
+    if isinstance(v, str):
+        try:
+            return float(v)
+        except ValueError:
+            return v
+    return v
+
+
+def as_list(value):
+    """
+    Operand of an "in" filter as a list (a lone value is a one-item list).
+    """
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def as_bounds(value):
+    """
+    Operand of a "between" filter as (lo, hi) floats, or None if malformed.
+    """
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        return None
+    lo, hi = coerce_number(value[0]), coerce_number(value[1])
+    if not isinstance(lo, float) or not isinstance(hi, float):
+        return None
+    return lo, hi
+
+
+def as_point(value):
+    """
+    Point operand of a spatial filter as a tagged tuple, or None if malformed:
+    [x, y] in footprint metres, {"lon", "lat"}, {"building": id} or
+    {"address": text}.
+    """
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        x, y = coerce_number(value[0]), coerce_number(value[1])
+        if isinstance(x, float) and isinstance(y, float) and np.isfinite([x, y]).all():
+            return ("xy", x, y)
+        return None
+    if not isinstance(value, dict):
+        return None
+    if "lon" in value and "lat" in value:
+        lon, lat = coerce_number(value["lon"]), coerce_number(value["lat"])
+        if isinstance(lon, float) and isinstance(lat, float) and np.isfinite([lon, lat]).all():
+            return ("lonlat", lon, lat)
+        return None
+    if "building" in value:
+        building = coerce_number(value["building"])
+        return ("building", int(building)) if isinstance(building, float) and building.is_integer() else None
+    if isinstance(value.get("address"), str) and value["address"].strip():
+        return ("address", value["address"].strip().lower())
+    return None
+
+
+def as_spatial(op, value):
+    """
+    Operand of a spatial filter as a dict, or None if malformed:
+      within_radius   {"center": point, "radius": metres}
+      within_polygon  [point, point, point, ...] (open or closed ring)
+      nearest_k       {"center": point, "k": n}
+    """
+    if op == "within_polygon":
+        if not isinstance(value, (list, tuple)) or len(value) < 3:
+            return None
+        ring = [as_point(p) for p in value]
+        return None if None in ring else {"ring": ring}
+    if not isinstance(value, dict):
+        return None
+    center = as_point(value.get("center"))
+    if center is None:
+        return None
+    if op == "within_radius":
+        radius = coerce_number(value.get("radius"))
+        if not isinstance(radius, float) or not 0 <= radius < np.inf:
+            return None
+        return {"center": center, "radius": radius}
+    if op == "nearest_k":
+        k = coerce_number(value.get("k"))
+        if not isinstance(k, float) or k < 1 or not k.is_integer():
+            return None
+        return {"center": center, "k": int(k)}
+    return None
+
+
+def _float_column(buildings, attr):
+    """
+    float64 column for `attr`, NaN wherever the value is missing or not numeric.
+    """
+    col = np.full(len(buildings), np.nan, dtype=np.float64)
+    for i, b in enumerate(buildings):
+        raw = b.get(attr)
+        if raw is None:
+            continue
+        try:
+            col[i] = float(raw)
+        except (TypeError, ValueError):
+            pass
+    return col
+
+
+def _string_column(buildings, attr):
+    """
+    Pre-lowered unicode column for `attr` plus a mask of rows that have a value.
+    Missing values are stored as "" and excluded through the mask.
+    """
+    present = np.zeros(len(buildings), dtype=bool)
+    values = []
+    for i, b in enumerate(buildings):
+        raw = b.get(attr)
+        if raw is None:
+            values.append("")
+            continue
+        present[i] = True
+        values.append(str(raw).lower())
+    return np.array(values, dtype=str), present
+
+
+def _lonlat_fit(buildings, centroids):
+    """
+    (3, 2) affine map from [lon, lat, 1] to footprint metres, least-squares
+    fitted on each building's centroid_lon/lat against its footprint centroid.
+    None without at least three georeferenced buildings.
+    """
+    lonlat = np.column_stack([
+        _float_column(buildings, "centroid_lon"), _float_column(buildings, "centroid_lat")
+    ])
+    ok = ~np.isnan(lonlat).any(axis=1) & ~np.isnan(centroids).any(axis=1)
+    if ok.sum() < 3:
+        return None
+    design = np.column_stack([lonlat[ok], np.ones(int(ok.sum()))])
+    fit, *_ = np.linalg.lstsq(design, centroids[ok], rcond=None)
+    return fit
+
+
+def _footprint_arrays(buildings):
+    """
+    All footprints as one flat (m, 2) float64 coordinate array plus (n + 1)
+    offsets, so footprint i is coords[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.array([len(b.get("footprint") or []) for b in buildings], dtype=np.int64)
+    offsets = np.zeros(len(buildings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    coords = np.array(
+        [pt[:2] for b in buildings for pt in (b.get("footprint") or [])], dtype=np.float64
+    ).reshape(-1, 2)
+    return coords, offsets
+
+
+class Postings:
+    """
+    Inverted index stored CSR-style: sorted keys, and for key k the items
+    items[start[k]:start[k + 1]]. Only flat arrays, so it can be saved and
+    memory-mapped like any other column.
+    """
+
+    def __init__(self, keys, start, items):
+        self.keys = keys
+        self.start = start
+        self.items = items
+
+    @classmethod
+    def build(cls, keys, owners, items):
+        """
+        From parallel arrays: item i is posted under keys[owners[i]]. `keys`
+        must be sorted; items keep their given order within each key.
+        """
+        order = np.argsort(owners, kind="stable")
+        start = np.searchsorted(owners[order], np.arange(len(keys) + 1))
+        return cls(keys, start, items[order])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def at(self, k):
+        """
+        Items of the k-th key.
+        """
+        return self.items[self.start[k]:self.start[k + 1]]
+
+    def code(self, key):
+        """
+        Position of `key` in the sorted keys, or -1.
+        """
+        k = int(np.searchsorted(self.keys, key))
+        if k < len(self.keys) and self.keys[k] == key:
+            return k
+        return -1
+
+    def get(self, key, default=None):
+        k = self.code(key)
+        return self.at(k) if k >= 0 else default
+
+    def __getitem__(self, key):
+        k = self.code(key)
+        if k < 0:
+            raise KeyError(key)
+        return self.at(k)
+
+
+def _value_index(col, present):
+    """
+    Inverted index for exact matches over the distinct values of a column.
+
+    Returns (categories, codes, postings): the sorted distinct values, a
+    per-row code into them (-1 where missing), and value -> sorted row array.
+    """
+    rows = np.flatnonzero(present)
+    categories, inverse = np.unique(col[rows], return_inverse=True)
+
+    codes = np.full(len(col), -1, dtype=np.int64)
+    codes[rows] = inverse
+
+    return categories, codes, Postings.build(categories, inverse, rows)
+
+
+def _trigrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _trigram_index(categories):
+    """
+    Inverted index for substring matches: trigram -> sorted array of category
+    codes. Built over distinct values, so repeated communities cost nothing.
+    """
+    grams, codes = [], []
+    for code, value in enumerate(categories.tolist()):
+        for gram in _trigrams(value):
+            grams.append(gram)
+            codes.append(code)
+
+    keys, owners = np.unique(np.array(grams, dtype=str), return_inverse=True)
+    return Postings.build(keys, owners, np.array(codes, dtype=np.int64))
+
+
+def _intersect_sorted(arrays):
+    arrays = sorted(arrays, key=len)
+    result = arrays[0]
+    for other in arrays[1:]:
+        result = np.intersect1d(result, other, assume_unique=True)
+    return result
+
+
+def _numeric_test(col, op, value):
+    """
+    Boolean mask of a numeric predicate over column values, matching the
+    binary searches in BuildingStore.numeric_rows (NaN never matches).
+    """
+    if op == "between":
+        bounds = as_bounds(value)
+        if bounds is None:
+            return np.zeros(len(col), dtype=bool)
+        return (col >= bounds[0]) & (col <= bounds[1])
+    if op == "in":
+        keep = np.zeros(len(col), dtype=bool)
+        for v in as_list(value):
+            keep |= _numeric_test(col, "=", v)
+        return keep
+
+    value = coerce_number(value)
+    if not isinstance(value, float):
+        return np.zeros(len(col), dtype=bool)
+    if op == ">": return col > value
+    if op == ">=": return col >= value
+    if op == "<": return col < value
+    if op == "<=": return col <= value
+    if op in ["=", "=="]:
+        return (col > value - EPSILON) & (col < value + EPSILON)
+    return np.zeros(len(col), dtype=bool)
+
+
+class BuildingStore:
+    """
+    Columnar view over the buildings list used by the query engine.
+
+    Numeric attributes are float64 arrays (NaN = missing) and string attributes
+    are pre-lowered unicode arrays, so every filter operator is evaluated as a
+    vectorized boolean mask instead of a Python loop over dicts.
+
+    Numeric columns also get a sorted index built once at startup, so range
+    predicates are binary searches and global max/min are O(1) lookups. String
+    columns get exact-value and trigram inverted indexes, so "=" and "contains"
+    resolve by set intersection instead of a full scan. Footprint bounds sit
+    in a uniform grid index for bbox and tile lookups, footprint centroids in
+    another for the spatial filters.
+    """
+
+    def __init__(self, buildings):
+        self.buildings = buildings
+        self.size = len(buildings)
+        self.ids = np.array([b["id"] for b in buildings], dtype=np.int64)
+
+        self.numeric = {attr: _float_column(buildings, attr) for attr in NUMERIC_ATTRS}
+
+        # Sorted indexes: rows with a value, ordered by that value
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        for attr, col in self.numeric.items():
+            rows = np.flatnonzero(~np.isnan(col))
+            rows = rows[np.argsort(col[rows], kind="stable")]
+            self.sorted_rows[attr] = rows
+            self.sorted_values[attr] = col[rows]
+
+        self.strings = {}
+        self.present = {}
+        for attr in STRING_ATTRS:
+            self.strings[attr], self.present[attr] = _string_column(buildings, attr)
+
+        # Inverted indexes: exact value -> rows, and trigram -> values for "contains"
+        self.categories = {}
+        self.codes = {}
+        self.value_index = {}
+        for attr in STRING_ATTRS:
+            self.categories[attr], self.codes[attr], self.value_index[attr] = _value_index(
+                self.strings[attr], self.present[attr]
+            )
+        self.trigram_index = {
+            attr: _trigram_index(self.categories[attr]) for attr in TRIGRAM_ATTRS
+        }
+
+        # Footprint geometry + grid index over footprint bounds for bbox/tile queries
+        self.coords, self.offsets = _footprint_arrays(buildings)
+        self.bounds = footprint_bounds(self.coords, self.offsets)
+        self.spatial = GridIndex(self.bounds)
+
+        # Footprint centroids (NaN without a footprint) + their grid index for
+        # within_radius / within_polygon / nearest_k, and a lon/lat -> metres map
+        self.centroids = footprint_centroids(self.coords, self.offsets)
+        self.centroid_index = GridIndex(np.hstack([self.centroids, self.centroids]))
+        self.lonlat_fit = _lonlat_fit(buildings, self.centroids)
+
+    def __len__(self):
+        return self.size
+
+    # -------------------------------------
+    # MASKS
+    # -------------------------------------
+    def empty_mask(self):
+        return np.zeros(self.size, dtype=bool)
+
+    def full_mask(self):
+        return np.ones(self.size, dtype=bool)
+
+    def numeric_mask(self, attr, op, value):
+        mask = self.empty_mask()
+        mask[self.numeric_rows(attr, op, value)] = True
+        return mask
+
+    def string_mask(self, attr, op, value):
+        mask = self.empty_mask()
+        mask[self.string_rows(attr, op, value)] = True
+        return mask
+
+    def mask(self, attr, op, value):
+        """
+        Boolean mask of rows matching a single {attribute, operator, value} filter.
+        Unknown attributes or operators match nothing.
+        """
+        op = (op or "").lower()
+        if attr in self.numeric:
+            return self.numeric_mask(attr, op, value)
+        if attr in self.strings:
+            return self.string_mask(attr, op, value)
+        mask = self.empty_mask()
+        if attr == SPATIAL_ATTR:
+            mask[self.spatial_rows(op, value)] = True
+        return mask
+
+    # -------------------------------------
+    # ROW SETS
+    # -------------------------------------
+    def all_rows(self):
+        return np.arange(self.size)
+
+    def numeric_rows(self, attr, op, value):
+        """
+        Rows matching a numeric range predicate, found by binary search over the
+        sorted index. NaN rows are never in the index, so missing values drop out.
+        """
+        rows = self.sorted_rows[attr]
+        values = self.sorted_values[attr]
+
+        if op == "between":
+            bounds = as_bounds(value)
+            if bounds is None:
+                return rows[:0]
+            lo, hi = bounds
+            return rows[np.searchsorted(values, lo, side="left"):np.searchsorted(values, hi, side="right")]
+        if op == "in":
+            parts = [self.numeric_rows(attr, "=", v) for v in as_list(value)]
+            return np.unique(np.concatenate(parts)) if parts else rows[:0]
+
+        value = coerce_number(value)
+        if not isinstance(value, float):
+            return rows[:0]
+
+        if op == ">": return rows[np.searchsorted(values, value, side="right"):]
+        if op == ">=": return rows[np.searchsorted(values, value, side="left"):]
+        if op == "<": return rows[:np.searchsorted(values, value, side="left")]
+        if op == "<=": return rows[:np.searchsorted(values, value, side="right")]
+        if op in ["=", "=="]:
+            lo = np.searchsorted(values, value - EPSILON, side="right")
+            hi = np.searchsorted(values, value + EPSILON, side="left")
+            return rows[lo:hi]
+        return rows[:0]
+
+    def matching_codes(self, attr, op, value):
+        """
+        Codes of the distinct values of a string column that satisfy "=",
+        "in" or "contains". For "contains" the trigram postings of the needle
+        give the candidate values, so only those are checked; needles shorter
+        than a trigram, or columns without a trigram index, check every
+        distinct value instead of every row.
+        """
+        postings = self.value_index[attr]
+        if op in ["=", "=="]:
+            value = [value]
+            op = "in"
+        if op == "in":
+            codes = [postings.code(str(v).lower()) for v in as_list(value)]
+            return np.unique(np.array([k for k in codes if k >= 0], dtype=np.int64))
+        if op != "contains":
+            return np.zeros(0, dtype=np.int64)
+
+        value = str(value).lower()
+        categories = self.categories[attr]
+        grams = self.trigram_index.get(attr)
+        if grams is None or len(value) < NGRAM:
+            candidates = np.arange(len(categories))
+        else:
+            code_sets = []
+            for gram in _trigrams(value):
+                codes = grams.get(gram)
+                if codes is None:
+                    return np.zeros(0, dtype=np.int64)
+                code_sets.append(codes)
+            candidates = _intersect_sorted(code_sets)
+
+        return candidates[np.char.find(categories[candidates], value) >= 0]
+
+    def string_rows(self, attr, op, value):
+        """
+        Rows matching a string predicate. "=" is a single inverted-index
+        lookup; "in" and "contains" union the row postings of the matching
+        distinct values (see matching_codes).
+        """
+        postings = self.value_index[attr]
+
+        if op in ["=", "=="]:
+            return postings.get(str(value).lower(), self.all_rows()[:0])
+
+        matches = self.matching_codes(attr, op, value)
+        if not len(matches):
+            return self.all_rows()[:0]
+        if len(matches) <= MAX_POSTINGS_UNION:
+            return np.concatenate([postings.at(k) for k in matches])
+
+        # Many matching values (e.g. a street name across unique addresses):
+        # one vectorized membership test over the row codes beats the union
+        # (missing rows have code -1, which lands on the always-False padding slot)
+        member = np.zeros(len(self.categories[attr]) + 1, dtype=bool)
+        member[matches] = True
+        return np.flatnonzero(member[self.codes[attr]])
+
+    def rows(self, attr, op, value):
+        """
+        Row indices (unordered) matching a single filter.
+        Unknown attributes or operators match nothing.
+        """
+        op = (op or "").lower()
+        if attr in self.numeric:
+            return self.numeric_rows(attr, op, value)
+        if attr in self.strings:
+            return self.string_rows(attr, op, value)
+        if attr == SPATIAL_ATTR:
+            return self.spatial_rows(op, value)
+        return self.all_rows()[:0]
+
+    def rows_among(self, attr, op, value, rows=None):
+        """
+        The rows of `rows` (every row if None) matching a single filter,
+        tested directly on their column values instead of through an index.
+        Same semantics as rows(); keeps the order of `rows`.
+        """
+        op = (op or "").lower()
+        if attr in self.numeric:
+            col = self.numeric[attr] if rows is None else self.numeric[attr][rows]
+            keep = _numeric_test(col, op, value)
+        elif attr in self.strings:
+            codes = self.codes[attr] if rows is None else self.codes[attr][rows]
+            member = np.zeros(len(self.categories[attr]) + 1, dtype=bool)
+            member[self.matching_codes(attr, op, value)] = True
+            keep = member[codes]
+        elif attr == SPATIAL_ATTR:
+            return self.spatial_rows(op, value, self.all_rows() if rows is None else rows)
+        else:
+            return self.all_rows()[:0]
+        return np.flatnonzero(keep) if rows is None else rows[keep]
+
+    def intersect(self, row_sets):
+        """
+        Intersect candidate row sets, smallest first so each step only probes
+        as many rows as the running result holds. No sets means every row.
+        """
+        if not row_sets:
+            return self.all_rows()
+
+        row_sets = sorted(row_sets, key=len)
+        result = row_sets[0]
+        for other in row_sets[1:]:
+            if not len(result):
+                break
+            member = self.empty_mask()
+            member[other] = True
+            result = result[member[result]]
+        return result
+
+    # -------------------------------------
+    # SUPERLATIVES
+    # -------------------------------------
+    def superlative(self, attr, op, rows=None):
+        """
+        Rows holding the max/min of `attr` (among `rows` if given), plus the
+        winning value. Returns (no rows, None) if nothing has a value.
+
+        Over the whole dataset this is an O(1) lookup at either end of the
+        sorted index; within a candidate set it only looks at those rows.
+        """
+        if attr not in self.numeric:
+            return self.all_rows()[:0], None
+
+        if rows is None:
+            order = self.sorted_rows[attr]
+            values = self.sorted_values[attr]
+            if not len(order):
+                return order, None
+            if op == "max":
+                best = float(values[-1])
+                return order[np.searchsorted(values, best - EPSILON, side="right"):], best
+            best = float(values[0])
+            return order[:np.searchsorted(values, best + EPSILON, side="left")], best
+
+        col = self.numeric[attr][rows]
+        valid = ~np.isnan(col)
+        if not valid.any():
+            return rows[:0], None
+
+        best = float(col[valid].max() if op == "max" else col[valid].min())
+        return rows[np.abs(col - best) < EPSILON], best
+
+    # -------------------------------------
+    # PAGINATION
+    # -------------------------------------
+    def sort_keys(self, attr, rows, descending=False):
+        """
+        Ascending sort keys of `rows` by `attr`: the value, negated when
+        descending, with missing values (NaN) mapped to +inf so they sort last.
+        """
+        keys = self.numeric[attr][rows]
+        if descending:
+            keys = -keys
+        return np.where(np.isnan(keys), np.inf, keys)
+
+    def page(self, rows, limit, order_by=None, descending=False, after=None):
+        """
+        Up to `limit` of the (sorted) candidate `rows`, in dataset order or by
+        a numeric attribute with ties broken by row, starting after the
+        position `after` returned for the previous page (keyset pagination).
+        Returns (page rows, position of the last row or None if no more).
+
+        Ordering is a partial sort: one O(n) partition around the limit-th
+        key, then only the rows in front of it are fully sorted.
+        """
+        if order_by is None:
+            if after is not None:
+                rows = rows[np.searchsorted(rows, after, side="right"):]
+            page = rows[:limit]
+            more = len(rows) > limit
+            return page, (int(page[-1]) if more else None)
+
+        keys = self.sort_keys(order_by, rows, descending)
+        if after is not None:
+            key, row = after
+            keep = (keys > key) | ((keys == key) & (rows > row))
+            rows, keys = rows[keep], keys[keep]
+        more = len(rows) > limit
+        if more:
+            kth = np.partition(keys, limit - 1)[limit - 1]
+            # Everything up to the kth key; only ties at kth can overshoot the limit
+            front = keys <= kth
+            rows, keys = rows[front], keys[front]
+        order = np.lexsort((rows, keys))[:limit]
+        page = rows[order]
+        return page, ((float(keys[order[-1]]), int(page[-1])) if more else None)
+
+    # -------------------------------------
+    # SPATIAL
+    # -------------------------------------
+    def rows_in_bbox(self, minx, miny, maxx, maxy):
+        """
+        Rows whose footprint bounds intersect the window, in dataset order.
+        """
+        return self.spatial.query(minx, miny, maxx, maxy)
+
+    def resolve_point(self, point):
+        """
+        Footprint-metre (x, y) of an as_point() point, or None if it names no
+        building or can't be georeferenced. Buildings and addresses resolve
+        to the centroid of the first matching building (exact address first,
+        then the first address containing the text).
+        """
+        kind = point[0]
+        if kind == "xy":
+            return point[1], point[2]
+        if kind == "lonlat":
+            if self.lonlat_fit is None:
+                return None
+            x, y = np.array([point[1], point[2], 1.0]) @ self.lonlat_fit
+            return float(x), float(y)
+
+        if kind == "building":
+            rows = np.flatnonzero(self.ids == point[1])
+        else:
+            rows = self.string_rows("address", "=", point[1])
+            if not len(rows):
+                rows = self.string_rows("address", "contains", point[1])
+        rows = rows[~np.isnan(self.centroids[rows, 0])]
+        if not len(rows):
+            return None
+        x, y = self.centroids[rows.min()]
+        return float(x), float(y)
+
+    def spatial_region(self, op, value):
+        """
+        (window, coverage, test) for a within_radius / within_polygon filter:
+        the bounding window of the region, the share of the window the region
+        covers, and a vectorized test of (x, y) arrays against the region.
+        None if the operand is malformed or doesn't resolve.
+        """
+        spatial = as_spatial(op, value)
+        if spatial is None or op == "nearest_k":
+            return None
+
+        if op == "within_radius":
+            center = self.resolve_point(spatial["center"])
+            if center is None:
+                return None
+            (cx, cy), r = center, spatial["radius"]
+
+            def test(x, y):
+                return (x - cx) ** 2 + (y - cy) ** 2 <= r * r
+            return (cx - r, cy - r, cx + r, cy + r), np.pi / 4, test
+
+        ring = [self.resolve_point(p) for p in spatial["ring"]]
+        if None in ring:
+            return None
+        ring = np.array(ring, dtype=np.float64)
+        minx, miny = ring.min(axis=0)
+        maxx, maxy = ring.max(axis=0)
+        box_area = (maxx - minx) * (maxy - miny)
+        polygon = RingSet([ring])
+
+        def test(x, y):
+            return polygon.contains(x, y, np.zeros(len(x), dtype=np.int64))
+        return (minx, miny, maxx, maxy), polygon_area(ring) / box_area if box_area > 0 else 0.0, test
+
+    def spatial_rows(self, op, value, rows=None):
+        """
+        Rows whose centroid lies within the radius / inside the polygon. With
+        `rows`, only those are tested (order kept); otherwise candidates come
+        from the centroid grid, sorted.
+        """
+        region = self.spatial_region(op, value)
+        if region is None:
+            return self.all_rows()[:0]
+        window, _, test = region
+        if rows is None:
+            rows = self.centroid_index.query(*window)
+        return rows[test(self.centroids[rows, 0], self.centroids[rows, 1])]
+
+    def spatial_estimate(self, op, value):
+        """
+        Rows expected to match a spatial filter: the centroids in its window,
+        scaled by the share of the window the region covers.
+        """
+        if op == "nearest_k":
+            spatial = as_spatial(op, value)
+            return 0 if spatial is None else min(spatial["k"], len(self.centroid_index))
+        region = self.spatial_region(op, value)
+        if region is None:
+            return 0
+        window, coverage, _ = region
+        return int(np.ceil(len(self.centroid_index.query(*window)) * coverage))
+
+    def nearest(self, value, rows=None):
+        """
+        The k rows (of `rows`, else of all) with centroids closest to a
+        nearest_k point, nearest first, ties by row. Over all rows, a window
+        on the centroid grid doubles until it holds k centroids; the k-th
+        nearest of those bounds the search circle for the exact answer.
+        """
+        spatial = as_spatial("nearest_k", value)
+        center = None if spatial is None else self.resolve_point(spatial["center"])
+        if center is None:
+            return self.all_rows()[:0]
+        (x, y), k = center, spatial["k"]
+        centroids = self.centroids
+
+        if rows is None:
+            index = self.centroid_index
+            k = min(k, len(index))
+            if not k:
+                return self.all_rows()[:0]
+            half = max(index.cell_w, index.cell_h)
+            while True:
+                rows = index.query(x - half, y - half, x + half, y + half)
+                if len(rows) >= k:
+                    break
+                half *= 2
+            dist = np.hypot(centroids[rows, 0] - x, centroids[rows, 1] - y)
+            # Widened a little: far from the data, distances round coarsely and
+            # the exact circle could lose rows tied at the k-th distance
+            reach = float(np.partition(dist, k - 1)[k - 1]) * (1 + 1e-9) + 1e-9
+            rows = index.query(x - reach, y - reach, x + reach, y + reach)
+        else:
+            rows = rows[~np.isnan(centroids[rows, 0])]
+
+        dist = np.hypot(centroids[rows, 0] - x, centroids[rows, 1] - y)
+        return rows[np.lexsort((rows, dist))[:k]]
+
+    def ids_for(self, rows):
+        """
+        Building ids for a row set, in dataset order.
+        """
+        return self.ids[np.sort(rows)].tolist()
@@ -0,0 +1,395 @@
+"""
+Columnar on-disk form of the buildings dataset: every record field and every
+BuildingStore index as a flat .npy array, loaded with mmap so startup is
+near-instant and every worker process shares the same page-cache copy.
+
+    data/buildings_columns/
+      schema.json          layout version, record count, field specs,
+                           store scalars, source buildings.json signature
+      rec.<field>.*.npy    record columns (see _encode_field)
+      rec.layout.npy       per record, which key layout (field order) it has
+      idx.<name>.npy       BuildingStore arrays
+"""
+import json
+import os
+import shutil
+from collections.abc import Sequence
+
+import numpy as np
+
+from building_store import BuildingStore, Postings
+from spatial_index import GridIndex
+
+FORMAT_VERSION = 2
+
+
+# -------------------------------------
+# RECORD COLUMNS
+# -------------------------------------
+def _is_coords(v):
+    return isinstance(v, list) and all(
+        isinstance(pt, list) and len(pt) == 2
+        and all(isinstance(c, float) for c in pt)
+        for pt in v
+    )
+
+
+def _field_kind(values):
+    """
+    Storage kind for one field, chosen so decoding gives back exactly the
+    same JSON values:
+      int      int64, no missing values
+      float    float64 with a null mask
+      str      category codes (-1 = null) into a sorted string table
+      coords   [[x, y], ...] as flat (m, 2) float64 + offsets
+      lods     fixed-length list of coords, one coords column per level
+      json     anything else, as codes into a table of JSON texts
+    """
+    present = [v for v in values if v is not None]
+    if present and all(type(v) is int for v in values):
+        return "int"
+    if present and all(type(v) is float for v in present):
+        return "float"
+    if present and all(type(v) is str for v in present):
+        return "str"
+    if present and len(present) == len(values) and all(_is_coords(v) for v in values):
+        return "coords"
+    if (
+        present and len(present) == len(values)
+        and all(isinstance(v, list) for v in values)
+        and len({len(v) for v in values}) == 1
+        and all(_is_coords(level) for v in values for level in v)
+    ):
+        return "lods"
+    return "json"
+
+
+def _coords_arrays(rings):
+    lengths = np.array([len(r) for r in rings], dtype=np.int64)
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    coords = np.array([pt for r in rings for pt in r], dtype=np.float64).reshape(-1, 2)
+    return coords, offsets
+
+
+def _categorical(values):
+    present = np.array([v is not None for v in values], dtype=bool)
+    table, inverse = np.unique(
+        np.array([v for v in values if v is not None], dtype=str), return_inverse=True
+    )
+    codes = np.full(len(values), -1, dtype=np.int32)
+    codes[present] = inverse
+    return table, codes
+
+
+def _encode_field(values):
+    """
+    (kind, {part: array}) for one field's values across all records.
+    """
+    kind = _field_kind(values)
+    if kind == "int":
+        return kind, {"values": np.array(values, dtype=np.int64)}
+    if kind == "float":
+        return kind, {
+            "values": np.array([np.nan if v is None else v for v in values], dtype=np.float64),
+            "null": np.array([v is None for v in values], dtype=bool),
+        }
+    if kind == "str":
+        table, codes = _categorical(values)
+        return kind, {"table": table, "codes": codes}
+    if kind == "coords":
+        coords, offsets = _coords_arrays(values)
+        return kind, {"coords": coords, "offsets": offsets}
+    if kind == "lods":
+        parts = {}
+        for level in range(len(values[0])):
+            coords, offsets = _coords_arrays([v[level] for v in values])
+            parts[f"coords{level}"] = coords
+            parts[f"offsets{level}"] = offsets
+        return kind, parts
+    table, codes = _categorical([None if v is None else json.dumps(v) for v in values])
+    return kind, {"table": table, "codes": codes}
+
+
+class RecordView(Sequence):
+    """
+    Read-only list of building dicts decoded on demand from record columns.
+    Nothing per-building is kept in memory; each access builds a fresh dict
+    with the same keys (in the same order) and values as buildings.json.
+    """
+
+    def __init__(self, count, fields, parts, layouts, layout_codes):
+        self.count = count
+        self.fields = fields
+        self.parts = parts
+        self.layouts = [[fields[k] for k in layout] for layout in layouts]
+        self.layout_codes = layout_codes
+        # Tables are small (distinct values only): decode them once
+        self.tables = {
+            f["name"]: parts[f["name"]]["table"].tolist()
+            for f in fields if f["kind"] in ("str", "json")
+        }
+
+    def __len__(self):
+        return self.count
+
+    def _value(self, field, i):
+        name, kind = field["name"], field["kind"]
+        cols = self.parts[name]
+        if kind == "int":
+            return int(cols["values"][i])
+        if kind == "float":
+            return None if cols["null"][i] else float(cols["values"][i])
+        if kind in ("str", "json"):
+            code = int(cols["codes"][i])
+            if code < 0:
+                return None
+            text = self.tables[name][code]
+            return text if kind == "str" else json.loads(text)
+        if kind == "coords":
+            return cols["coords"][cols["offsets"][i]:cols["offsets"][i + 1]].tolist()
+        return [
+            cols[f"coords{level}"][cols[f"offsets{level}"][i]:cols[f"offsets{level}"][i + 1]].tolist()
+            for level in range(field["levels"])
+        ]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        i = int(i)
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+
+        return {
+            field["name"]: self._value(field, i)
+            for field in self.layouts[self.layout_codes[i]]
+        }
+
+
+# -------------------------------------
+# WRITE
+# -------------------------------------
+def _store_arrays(store):
+    """
+    Every array behind a BuildingStore, flattened to {name: array}, plus the
+    scalars needed to rebuild it.
+    """
+    arrays = {
+        "ids": store.ids,
+        "coords": store.coords,
+        "offsets": store.offsets,
+        "bounds": store.bounds,
+        "grid.cell_start": store.spatial.cell_start,
+        "grid.cell_items": store.spatial.cell_items,
+        "centroids": store.centroids,
+        "centroid_grid.bounds": store.centroid_index.bounds,
+        "centroid_grid.cell_start": store.centroid_index.cell_start,
+        "centroid_grid.cell_items": store.centroid_index.cell_items,
+    }
+    for attr in store.numeric:
+        arrays[f"numeric.{attr}"] = store.numeric[attr]
+        arrays[f"sorted_rows.{attr}"] = store.sorted_rows[attr]
+        arrays[f"sorted_values.{attr}"] = store.sorted_values[attr]
+    for attr in store.strings:
+        arrays[f"strings.{attr}"] = store.strings[attr]
+        arrays[f"present.{attr}"] = store.present[attr]
+        arrays[f"codes.{attr}"] = store.codes[attr]
+        # categories double as the value index keys
+        arrays[f"categories.{attr}"] = store.categories[attr]
+        arrays[f"value_index.{attr}.start"] = store.value_index[attr].start
+        arrays[f"value_index.{attr}.items"] = store.value_index[attr].items
+    for attr, grams in store.trigram_index.items():
+        arrays[f"trigram_index.{attr}.keys"] = grams.keys
+        arrays[f"trigram_index.{attr}.start"] = grams.start
+        arrays[f"trigram_index.{attr}.items"] = grams.items
+
+    scalars = {
+        "size": store.size,
+        "numeric": list(store.numeric),
+        "strings": list(store.strings),
+        "trigram": list(store.trigram_index),
+        "grid": _grid_scalars(store.spatial),
+        "centroid_grid": _grid_scalars(store.centroid_index),
+        "lonlat_fit": None if store.lonlat_fit is None else store.lonlat_fit.tolist(),
+    }
+    return arrays, scalars
+
+
+def _grid_scalars(grid):
+    return {
+        "extent": list(grid.extent),
+        "nx": grid.nx,
+        "ny": grid.ny,
+        "cell_w": grid.cell_w,
+        "cell_h": grid.cell_h,
+    }
+
+
+def source_signature(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def write_columns(store, path, source=None):
+    """
+    Write a BuildingStore (records + indexes) as a columnar directory.
+    `source` is the buildings.json it came from, recorded so loaders can
+    tell when the columns are stale. Swapped into place in one rename.
+    """
+    buildings = store.buildings
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    # Records differ in which keys they have and in what order (unmatched
+    # buildings get their placeholders appended), so each one points at a
+    # layout: a list of field positions
+    names = list(dict.fromkeys(k for b in buildings for k in b))
+    position = {name: k for k, name in enumerate(names)}
+    layouts = {}
+    layout_codes = np.array([
+        layouts.setdefault(tuple(position[k] for k in b), len(layouts)) for b in buildings
+    ], dtype=np.int32)
+    np.save(os.path.join(tmp, "rec.layout.npy"), layout_codes)
+
+    fields = []
+    for name in names:
+        values = [b.get(name) for b in buildings]
+        kind, parts = _encode_field(values)
+
+        field = {"name": name, "kind": kind, "parts": sorted(parts)}
+        if kind == "lods":
+            field["levels"] = len(values[0])
+        fields.append(field)
+        for part, arr in parts.items():
+            np.save(os.path.join(tmp, f"rec.{name}.{part}.npy"), arr)
+
+    arrays, scalars = _store_arrays(store)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"idx.{name}.npy"), np.asarray(arr))
+
+    schema = {
+        "version": FORMAT_VERSION,
+        "count": len(buildings),
+        "fields": fields,
+        "layouts": [list(layout) for layout in layouts],
+        "store": scalars,
+        "source": source_signature(source) if source else None,
+    }
+    with open(os.path.join(tmp, "schema.json"), "w") as f:
+        json.dump(schema, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process put its copy in place first
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"[columnar] Wrote {len(buildings)} buildings, {len(fields)} fields → {path}")
+    return schema
+
+
+# -------------------------------------
+# READ
+# -------------------------------------
+def read_schema(path):
+    schema_path = os.path.join(path, "schema.json")
+    if not os.path.exists(schema_path):
+        return None
+    with open(schema_path) as f:
+        schema = json.load(f)
+    return schema if schema.get("version") == FORMAT_VERSION else None
+
+
+def columns_fresh(path, source):
+    """
+    True if `path` holds current-format columns built from `source` as it
+    is now (or `source` doesn't exist, so the columns are all there is).
+    """
+    schema = read_schema(path)
+    if schema is None:
+        return False
+    if not os.path.exists(source):
+        return True
+    return schema["source"] == source_signature(source)
+
+
+def load_columns(path, mmap_mode="r"):
+    """
+    BuildingStore backed entirely by memory-mapped arrays; store.buildings
+    is a RecordView decoding building dicts on demand.
+    """
+    schema = read_schema(path)
+    if schema is None:
+        raise FileNotFoundError(f"[columnar] No current-format columns in {path}")
+
+    def load(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    parts = {
+        f["name"]: {part: load(f"rec.{f['name']}.{part}") for part in f["parts"]}
+        for f in schema["fields"]
+    }
+    scalars = schema["store"]
+
+    store = object.__new__(BuildingStore)
+    store.buildings = RecordView(
+        schema["count"], schema["fields"], parts, schema["layouts"], load("rec.layout")
+    )
+    store.size = scalars["size"]
+    store.ids = load("idx.ids")
+
+    store.numeric = {a: load(f"idx.numeric.{a}") for a in scalars["numeric"]}
+    store.sorted_rows = {a: load(f"idx.sorted_rows.{a}") for a in scalars["numeric"]}
+    store.sorted_values = {a: load(f"idx.sorted_values.{a}") for a in scalars["numeric"]}
+
+    store.strings = {a: load(f"idx.strings.{a}") for a in scalars["strings"]}
+    store.present = {a: load(f"idx.present.{a}") for a in scalars["strings"]}
+    store.codes = {a: load(f"idx.codes.{a}") for a in scalars["strings"]}
+    store.categories = {a: load(f"idx.categories.{a}") for a in scalars["strings"]}
+    store.value_index = {
+        a: Postings(
+            store.categories[a],
+            load(f"idx.value_index.{a}.start"),
+            load(f"idx.value_index.{a}.items"),
+        )
+        for a in scalars["strings"]
+    }
+    store.trigram_index = {
+        a: Postings(
+            load(f"idx.trigram_index.{a}.keys"),
+            load(f"idx.trigram_index.{a}.start"),
+            load(f"idx.trigram_index.{a}.items"),
+        )
+        for a in scalars["trigram"]
+    }
+
+    store.coords = load("idx.coords")
+    store.offsets = load("idx.offsets")
+    store.bounds = load("idx.bounds")
+
+    store.spatial = _load_grid(scalars["grid"], store.bounds,
+                               load("idx.grid.cell_start"), load("idx.grid.cell_items"))
+
+    store.centroids = load("idx.centroids")
+    store.centroid_index = _load_grid(
+        scalars["centroid_grid"], load("idx.centroid_grid.bounds"),
+        load("idx.centroid_grid.cell_start"), load("idx.centroid_grid.cell_items"),
+    )
+    fit = scalars["lonlat_fit"]
+    store.lonlat_fit = None if fit is None else np.array(fit, dtype=np.float64)
+
+    print(f"[columnar] Memory-mapped {store.size} buildings from {path}")
+    return store
+
+
+def _load_grid(scalars, bounds, cell_start, cell_items):
+    grid = object.__new__(GridIndex)
+    grid.__dict__.update(scalars)
+    grid.extent = tuple(grid.extent)
+    grid.bounds = bounds
+    grid.cell_start = cell_start
+    grid.cell_items = cell_items
+    return grid
@@ -1,23 +1,37 @@
 import os
 import json
 
+try:
+    import fcntl  # Unix only
+except ImportError:
+    fcntl = None
+
+from building_store import BuildingStore
+from columnar import columns_fresh, load_columns, write_columns
+from lod import build_lods
+
 BASE_DIR = os.path.dirname(__file__)
-DATA_PATH = os.path.join(BASE_DIR, "data", "buildings.json")
+DATA_PATH = os.getenv("BUILDINGS_PATH", os.path.join(BASE_DIR, "data", "buildings.json"))
+COLUMNS_PATH = os.getenv(
+    "BUILDINGS_COLUMNS_PATH", os.path.join(BASE_DIR, "data", "buildings_columns")
+)
+
+# USE_COLUMNS=0 forces the plain JSON load (e.g. to compare memory use)
+USE_COLUMNS = os.getenv("USE_COLUMNS", "1") != "0"
 
 
 def load_buildings():
     """
     Load the preprocessed + joined buildings dataset.
 
-    Run in this order before starting app.py:
-      1) python preprocess_osm.py
-      2) python preprocess_parcels.py
-      3) python preprocess_join.py
+    Build it before starting app.py with:
+      python pipeline.py
+    which runs the parcel filter and the spatial join in dependency order.
     """
     if not os.path.exists(DATA_PATH):
         raise FileNotFoundError(
             f"[data_loader] ERROR: {DATA_PATH} not found.\n"
-            "Run preprocess_osm.py, preprocess_parcels.py, and preprocess_join.py first."
+            "Run python pipeline.py first."
         )
 
     with open(DATA_PATH) as f:
@@ -27,6 +41,70 @@ def load_buildings():
     for b in buildings:
         b.setdefault("stage", "Unknown")
         # height should already be numeric from preprocessing
+        # LODs come from preprocess_join.py; older datasets get them here
+        if "footprint_lods" not in b:
+            b["footprint_lods"] = build_lods(b["footprint"])
 
     print(f"[data_loader] Loaded {len(buildings)} buildings from {DATA_PATH}")
-    return buildings
\ No newline at end of file
+    return buildings
+
+
+def load_store():
+    """
+    The BuildingStore the query engine filters against. Memory-mapped from
+    the columnar dataset (see build_columns) when it is up to date with
+    buildings.json; otherwise parsed from buildings.json. Either way the
+    building dicts are available as store.buildings.
+    """
+    if USE_COLUMNS and columns_fresh(COLUMNS_PATH, DATA_PATH):
+        return load_columns(COLUMNS_PATH)
+    if USE_COLUMNS and os.path.exists(COLUMNS_PATH):
+        print(f"[data_loader] {COLUMNS_PATH} is stale, loading JSON (run python data_loader.py)")
+    return BuildingStore(load_buildings())
+
+
+def build_columns():
+    """
+    Write the columnar (memory-mappable) form of buildings.json, indexes included.
+    """
+    store = BuildingStore(load_buildings())
+    return write_columns(store, COLUMNS_PATH, source=DATA_PATH)
+
+
+def ensure_columns():
+    """
+    Build the columns if they're missing or stale. Called by the gunicorn
+    master before preloading, so forked workers share memory-mapped arrays
+    rather than each touching (and copying) a heap of building dicts. A
+    read-only data dir just means falling back to JSON.
+    """
+    if not USE_COLUMNS or columns_fresh(COLUMNS_PATH, DATA_PATH):
+        return
+    try:
+        with open(COLUMNS_PATH + ".lock", "w") as lock:
+            # Several workers reloading at once: one builds, the rest wait
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not columns_fresh(COLUMNS_PATH, DATA_PATH):
+                build_columns()
+    except OSError as e:
+        print(f"[data_loader] WARNING: could not write {COLUMNS_PATH}: {e}")
+
+
+def dataset_signature():
+    """
+    (size, mtime) of buildings.json and of the columns' schema, for noticing
+    that the dataset changed on disk. None for a missing file.
+    """
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime)
+
+    return stat(DATA_PATH), stat(os.path.join(COLUMNS_PATH, "schema.json"))
+
+
+if __name__ == "__main__":
+    build_columns()
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+
+from data_loader import dataset_signature, ensure_columns, load_store
+from lod import building_at
+from payload import binary_payload, json_payload
+from query_parser import QueryCompiler
+from query_planner import QueryPlanner
+
+PAYLOAD_FORMATS = {"json": json_payload, "binary": binary_payload}
+
+
+class Dataset:
+    """
+    One immutable snapshot of the buildings: store + indexes, the query
+    compiler over its vocabulary, the filter planner over its column
+    statistics and pre-serialized /api/buildings payloads. A request grabs
+    the current snapshot once and uses only that, so a reload never changes
+    the data under it.
+    """
+
+    def __init__(self, store, version):
+        self.store = store
+        self.buildings = store.buildings
+        self.compiler = QueryCompiler(store)
+        self.planner = QueryPlanner(store)
+        self.version = version
+        self.loaded_at = time.time()
+        self.payloads = {}
+
+    @classmethod
+    def load(cls, version):
+        """
+        Load the store and pre-serialize the full-resolution payloads.
+        """
+        ds = cls(load_store(), version)
+        for fmt in PAYLOAD_FORMATS:
+            ds.payload(fmt, 0)
+        return ds
+
+    def payload(self, fmt, lod):
+        """
+        Pre-serialized /api/buildings payload for one format + level of detail.
+        Full resolution is built at load time, coarser levels on first request.
+        """
+        key = (fmt, lod)
+        payload = self.payloads.get(key)
+        if payload is None:
+            payload = PAYLOAD_FORMATS[fmt]([building_at(b, lod) for b in self.buildings])
+            self.payloads[key] = payload
+        return payload
+
+
+class DatasetManager:
+    """
+    Holds the current Dataset and replaces it on reload. A reload builds the
+    new snapshot (store, indexes, payloads) on a background thread while the
+    old one keeps serving, then swaps the reference in one assignment and
+    calls `on_swap` (cache invalidation). One reload runs at a time.
+    """
+
+    def __init__(self, on_swap=None):
+        self.on_swap = on_swap
+        self.signature = dataset_signature()
+        self.current = Dataset.load(version=1)
+        self.reloading = False
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self._watcher_pid = None
+
+    def reload(self, wait=False):
+        """
+        Start a background reload. False if one is already running. With
+        wait=True, block until it has finished (or failed).
+        """
+        with self._lock:
+            if self.reloading:
+                started = False
+            else:
+                started = True
+                self.reloading = True
+                self._done.clear()
+                threading.Thread(target=self._reload, name="dataset-reload", daemon=True).start()
+        if wait:
+            self._done.wait()
+        return started
+
+    def _reload(self):
+        signature = None
+        try:
+            t0 = time.perf_counter()
+            ensure_columns()
+            # After ensure_columns, whose own writes aren't a change to react to
+            signature = dataset_signature()
+            new = Dataset.load(version=self.current.version + 1)
+
+            self.current = new
+            self.last_error = None
+            if self.on_swap:
+                self.on_swap(new)
+            print(f"[dataset] Reloaded v{new.version}: {len(new.buildings)} buildings "
+                  f"in {time.perf_counter() - t0:.2f}s")
+        except Exception as e:
+            # Keep serving the old snapshot
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[dataset] Reload failed, keeping v{self.current.version}: {self.last_error}")
+        finally:
+            # Also on failure, so the watcher waits for the next change
+            # instead of retrying the same broken file
+            self.signature = signature or dataset_signature()
+            with self._lock:
+                self.reloading = False
+                self._done.set()
+
+    def watch(self, interval):
+        """
+        Poll the dataset files every `interval` seconds and reload when they
+        change. A change is only acted on once it has held still for a full
+        interval, so a file that is still being written isn't picked up.
+        Idempotent per process (a forked worker starts its own watcher);
+        interval <= 0 disables watching.
+        """
+        if interval <= 0 or self._watcher_pid == os.getpid():
+            return
+
+        def loop():
+            pending = None
+            while True:
+                time.sleep(interval)
+                signature = dataset_signature()
+                if signature == self.signature:
+                    pending = None
+                elif signature == pending:
+                    pending = None
+                    self.reload(wait=True)
+                else:
+                    pending = signature
+
+        threading.Thread(target=loop, name="dataset-watch", daemon=True).start()
+        self._watcher_pid = os.getpid()
+        print(f"[dataset] Watching dataset files every {interval:g}s")
+
+    def status(self):
+        return {
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at,
+            "reloading": self.reloading,
+            "last_error": self.last_error,
+            "watching": self._watcher_pid == os.getpid(),
+        }
@@ -0,0 +1,139 @@
+import json
+import os
+
+try:
+    import ijson  # optional: pip install ijson (C backend, faster)
+except ImportError:
+    ijson = None
+
+READ_CHUNK = 1 << 20  # 1 MiB
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """
+    Sliding text buffer over a file for incremental raw_decode calls.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Read another chunk (dropping consumed text). False once at EOF.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip(self, chars=_WHITESPACE):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"[geojson_stream] expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next complete JSON value, reading more text until it fits.
+        """
+        self.skip()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number can't be known complete until something follows it
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_features_builtin(f):
+    """
+    Hand-rolled streaming reader: walks the top-level object key by key,
+    skips everything that isn't "features", and yields that array's items
+    one at a time with raw_decode.
+    """
+    reader = _Reader(f)
+    reader.expect("{")
+    while reader.peek() not in ("}", ""):
+        key = reader.value()
+        reader.expect(":")
+        if key != "features":
+            reader.value()
+        else:
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.value()
+                reader.skip()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            reader.expect("]")
+        if reader.peek() == ",":
+            reader.pos += 1
+
+
+def iter_features(path):
+    """
+    Yield the features of a GeoJSON FeatureCollection one at a time, without
+    ever holding the whole collection in memory.
+    """
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "features.item", use_float=True)
+        return
+
+    with open(path, "r") as f:
+        yield from _iter_features_builtin(f)
+
+
+def write_json_array(path, items):
+    """
+    Write an iterable as a JSON array one item at a time. Output is
+    byte-identical to json.dump(list(items), f). Returns the item count.
+
+    Streams into `path`.tmp and renames it over `path` at the end, so an
+    interrupted run never leaves a truncated file for the next run or the
+    dataset watcher to pick up.
+    """
+    tmp = f"{path}.tmp"
+    count = 0
+    try:
+        with open(tmp, "w") as f:
+            f.write("[")
+            for item in items:
+                if count:
+                    f.write(", ")
+                f.write(json.dumps(item))
+                count += 1
+            f.write("]")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return count
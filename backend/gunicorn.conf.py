@@ -0,0 +1,47 @@
+"""
+gunicorn settings: `gunicorn app:app` picks this file up from backend/.
+
+The dataset is loaded once in the master (preload_app) and workers are
+forked from it, so they share its memory pages copy-on-write. Two things
+keep those pages from being copied anyway:
+  - the dataset is memory-mapped flat arrays (data_loader.ensure_columns),
+    not millions of small dicts/lists whose refcounts workers would write;
+  - everything alive at fork time is moved out of the GC's reach
+    (gc.freeze), so collections in a worker don't touch the master's objects.
+
+GUNICORN_PRELOAD=0 restores one independent load per worker.
+
+Each worker serves GUNICORN_THREADS requests at once (gthread), so requests
+waiting on the LLM don't block the rest of the API.
+
+With DATASET_WATCH_SECONDS set, each worker watches the dataset files and
+hot-reloads its own snapshot when they change (see dataset.py).
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+if preload_app:
+    import data_loader
+
+    data_loader.ensure_columns()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded, before the first fork
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Dataset preloaded, {gc.get_freeze_count()} objects frozen for forked workers")
+
+
+def post_worker_init(worker):
+    # Threads don't survive fork, so the watcher is started per worker
+    import app
+
+    app.datasets.watch(app.DATASET_WATCH_SECONDS)
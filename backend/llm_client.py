@@ -0,0 +1,130 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+class LLMError(Exception):
+    """
+    The LLM call failed (HTTP error, timeout, malformed response).
+    """
+
+
+class LLMClient:
+    """
+    Chat-completion client for Groq built for concurrent callers:
+      - one pooled keep-alive Session (no TCP/TLS handshake per query),
+      - calls run on a bounded thread pool, so a caller can stop waiting
+        after a deadline without abandoning the call,
+      - single-flight: concurrent submits with the same key share one
+        in-flight call instead of each hitting the API.
+    """
+
+    def __init__(self, api_key, model=GROQ_MODEL, url=GROQ_URL,
+                 max_concurrency=8, connect_timeout=3.05, read_timeout=30):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+        # Retry rate limits / transient upstream errors once, honouring Retry-After
+        retry = Retry(total=1, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+                      allowed_methods=["POST"], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def complete(self, system, prompt, temperature=0.15, max_tokens=300):
+        """
+        Blocking chat completion; returns the reply text or raises LLMError.
+        """
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        try:
+            r = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+        if r.status_code != 200:
+            raise LLMError(f"HTTP {r.status_code}: {r.text[:200]}")
+        try:
+            return r.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMError(f"Malformed response: {e}") from e
+
+    def submit(self, key, system, prompt, on_done=None):
+        """
+        Future for complete(system, prompt), shared by every caller that
+        submits the same key while the first call is still in flight.
+        `on_done(future)` runs once when a new call finishes, even if no
+        caller is still waiting for it.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            self.calls += 1
+            future = self.executor.submit(self.complete, system, prompt)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def wait(self, future, timeout=None):
+        """
+        Reply text of a submitted call, waiting at most `timeout` seconds.
+        Raises LLMError on failure or timeout; a timed-out call keeps running.
+        """
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise LLMError(f"No reply within {timeout:g}s")
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.exception() is not None:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._inflight),
+            }
@@ -0,0 +1,136 @@
+import numpy as np
+
+# Douglas–Peucker tolerance (metres, footprint coordinates) per level of detail.
+# Level 0 is always the full-resolution footprint.
+LOD_TOLERANCES = (0.0, 0.5, 2.0, 5.0)
+MAX_LOD = len(LOD_TOLERANCES) - 1
+
+# Footprints whose bounding box diagonal is below this many tolerances
+# collapse to their bounding box at that level
+TINY_FACTOR = 4.0
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Simplify an open polyline (n, 2) array, keeping both end points.
+    Iterative, so long rings don't hit the recursion limit.
+    """
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a = points[start]
+        ab = points[end] - a
+        seg = points[start + 1:end] - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            dist = np.hypot(seg[:, 0], seg[:, 1])
+        else:
+            dist = np.abs(ab[0] * seg[:, 1] - ab[1] * seg[:, 0]) / length
+
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+
+    return points[keep]
+
+
+def convex_hull(points):
+    """
+    Monotone-chain convex hull, counter-clockwise, without repeated first point.
+    """
+    pts = sorted(set(map(tuple, points)))
+    if len(pts) < 3:
+        return np.array(pts, dtype=np.float64)
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1], dtype=np.float64)
+
+
+def _round(ring):
+    return [[round(float(x), 3), round(float(y), 3)] for x, y in ring]
+
+
+def simplify_footprint(footprint, tolerance):
+    """
+    Simplified footprint ring for one tolerance:
+      - tiny buildings (bbox diagonal < TINY_FACTOR * tolerance) -> bounding box
+      - otherwise Douglas–Peucker on the ring, split at the vertex farthest
+        from the start so both halves simplify independently
+      - if that degenerates below a triangle -> convex hull
+    Closed input rings stay closed.
+    """
+    pts = np.asarray(footprint, dtype=np.float64)[:, :2]
+    if len(pts) < 4 or tolerance <= 0:
+        return footprint
+
+    closed = bool(np.all(pts[0] == pts[-1]))
+    ring = pts[:-1] if closed else pts
+
+    minx, miny = ring.min(axis=0)
+    maxx, maxy = ring.max(axis=0)
+    if np.hypot(maxx - minx, maxy - miny) < TINY_FACTOR * tolerance:
+        simplified = np.array([[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy]])
+    else:
+        far = int(np.argmax(np.hypot(*(ring - ring[0]).T)))
+        first = douglas_peucker(ring[:far + 1], tolerance)
+        second = douglas_peucker(np.vstack([ring[far:], ring[:1]]), tolerance)
+        simplified = np.vstack([first, second[1:-1]])
+        if len(simplified) < 3:
+            simplified = convex_hull(ring)
+
+    if len(simplified) >= len(ring):
+        return footprint
+    if closed:
+        simplified = np.vstack([simplified, simplified[:1]])
+    return _round(simplified)
+
+
+def build_lods(footprint):
+    """
+    Simplified footprints for levels 1..MAX_LOD (level 0 is the footprint itself).
+    """
+    return [simplify_footprint(footprint, tol) for tol in LOD_TOLERANCES[1:]]
+
+
+def footprint_at(building, lod):
+    """
+    Footprint of `building` at a level of detail, falling back to full
+    resolution when the level is 0 or wasn't precomputed.
+    """
+    lods = building.get("footprint_lods")
+    if lod <= 0 or not lods:
+        return building["footprint"]
+    return lods[min(lod, len(lods)) - 1]
+
+
+def building_at(building, lod):
+    """
+    Client-facing copy of `building`: footprint at `lod`, LOD table dropped.
+    """
+    view = {k: v for k, v in building.items() if k != "footprint_lods"}
+    view["footprint"] = footprint_at(building, lod)
+    return view
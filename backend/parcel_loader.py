@@ -2,10 +2,17 @@
 
 import os
 import json
+import mmap
+import shutil
+import threading
 from typing import List, Dict, Tuple, Optional
 
+import numpy as np
+import shapely
 from shapely.geometry import shape, Polygon, MultiPolygon  # pip install shapely
 
+from geojson_stream import iter_features
+
 
 # Path to your parcel assessment GeoJSON
 # 👉 Rename your downloaded file to this, or update the path below.
@@ -16,6 +23,11 @@ PARCEL_GEOJSON_PATH = os.path.join(
     "Current_Year_Property_Assessments_(Parcel)_20251206.geojson",
 )
 
+# One-time binary build of the parcel file (see build_parcel_store)
+PARCEL_STORE_DIR = os.path.join(os.path.dirname(__file__), "data", "parcel_store")
+STORE_VERSION = 1
+NODE_SIZE = 16  # parcels per STR-tree node
+
 
 def _to_float(props: Dict, key: str) -> Optional[float]:
     val = props.get(key)
@@ -27,25 +39,233 @@ def _to_float(props: Dict, key: str) -> Optional[float]:
         return None
 
 
-def _geom_intersects_bbox(geom_bounds: Tuple[float, float, float, float],
-                          bbox: Tuple[float, float, float, float]) -> bool:
+def _parcel_record(idx: int, geom, props: Dict) -> Dict:
+    """
+    Parcel attributes kept alongside each geometry (everything but "geom").
+    """
+    assessed_value = _to_float(props, "assessed_value") or 0.0
+    # You can still use parcels with 0 value (parks, roads, etc.), but they
+    # won't contribute money to buildings.
+
+    return {
+        "id": idx,
+        "area": float(geom.area),
+        "assessed_value": assessed_value,
+        "roll_number": props.get("roll_number"),
+        "address": props.get("address"),
+        "assessment_class": props.get("assessment_class"),
+        "assessment_class_description": props.get("assessment_class_description"),
+        "land_use_designation": props.get("land_use_designation"),
+        "property_type": props.get("property_type"),
+        "land_size_sm": _to_float(props, "land_size_sm"),
+        "land_size_ac": _to_float(props, "land_size_ac"),
+        "comm_name": props.get("comm_name"),
+        "year_of_construction": props.get("year_of_construction"),
+    }
+
+
+# -------------------------------------
+# PARCEL STORE (build once, memory-map on load)
+# -------------------------------------
+def _str_order(bounds: np.ndarray, node_size: int) -> np.ndarray:
+    """
+    Sort-Tile-Recursive packing order: sort box centres by x into vertical
+    slices, then each slice by y, so every run of `node_size` boxes is
+    spatially compact.
+    """
+    n = len(bounds)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    leaves = int(np.ceil(n / node_size))
+    slice_size = int(np.ceil(np.sqrt(leaves))) * node_size
+
+    by_x = np.argsort(cx, kind="stable")
+    order = [
+        chunk[np.argsort(cy[chunk], kind="stable")]
+        for chunk in np.array_split(by_x, range(slice_size, n, slice_size))
+    ]
+    return np.concatenate(order)
+
+
+def _source_signature(path: str) -> Dict:
+    st = os.stat(path)
+    return {"source": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+
+def build_parcel_store(src: Optional[str] = None, out_dir: Optional[str] = None) -> Dict:
+    """
+    Stream the parcel GeoJSON once and write a binary store:
+      geoms.wkb     every geometry as WKB, concatenated
+      attrs.jsonl   one JSON object of attributes per parcel
+      offsets.npy   (n + 1, 2) int64 byte offsets into geoms.wkb / attrs.jsonl
+      bounds.npy    (n, 4) float64 parcel bounds, in STR order
+      order.npy     (n,) record index of each STR-ordered box
+      nodes.npy     (ceil(n / NODE_SIZE), 4) bounds of each STR node
+      meta.json     source signature, counts, layout version
+    Defaults to PARCEL_GEOJSON_PATH -> PARCEL_STORE_DIR. Returns the meta dict.
+
+    Written to a temp directory and swapped into place, so files an open
+    ParcelStore still has memory-mapped are unlinked rather than truncated
+    (truncating a mapped file can SIGBUS its readers).
+    """
+    src = src or PARCEL_GEOJSON_PATH
+    final_dir = out_dir or PARCEL_STORE_DIR
+    out_dir = f"{final_dir}.tmp{os.getpid()}"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    bounds = []
+    offsets = [(0, 0)]
+    with open(os.path.join(out_dir, "geoms.wkb"), "wb") as gf, \
+            open(os.path.join(out_dir, "attrs.jsonl"), "wb") as af:
+        for idx, feat in enumerate(iter_features(src)):
+            geom = shape(feat.get("geometry"))
+            if geom.is_empty:
+                continue
+
+            record = _parcel_record(idx, geom, feat.get("properties", {}))
+            gf.write(shapely.to_wkb(geom))
+            af.write(json.dumps(record).encode("utf-8") + b"\n")
+            bounds.append(geom.bounds)
+            offsets.append((gf.tell(), af.tell()))
+
+    bounds = np.array(bounds, dtype=np.float64).reshape(-1, 4)
+    order = _str_order(bounds, NODE_SIZE)
+    leaf_bounds = bounds[order]
+
+    nodes = np.array([
+        [g[:, 0].min(), g[:, 1].min(), g[:, 2].max(), g[:, 3].max()]
+        for g in (leaf_bounds[i:i + NODE_SIZE] for i in range(0, len(order), NODE_SIZE))
+    ], dtype=np.float64).reshape(-1, 4)
+
+    np.save(os.path.join(out_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(out_dir, "bounds.npy"), leaf_bounds)
+    np.save(os.path.join(out_dir, "order.npy"), order)
+    np.save(os.path.join(out_dir, "nodes.npy"), nodes)
+
+    meta = {
+        **_source_signature(src),
+        "version": STORE_VERSION,
+        "count": len(order),
+        "node_size": NODE_SIZE,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    try:
+        os.replace(out_dir, final_dir)
+    except OSError:
+        # Another process put its copy in place first
+        shutil.rmtree(out_dir, ignore_errors=True)
+    print(f"[parcel_loader] Built parcel store with {len(order)} parcels → {final_dir}")
+    return meta
+
+
+def _intersects(b: np.ndarray, bbox: Tuple[float, float, float, float]) -> np.ndarray:
     """
-    Cheap bbox intersection test:
-    geom_bounds = (minx, miny, maxx, maxy)
-    bbox        = (min_lon, min_lat, max_lon, max_lat)
+    Bounds-vs-bbox overlap test over an (n, 4) bounds array.
     """
-    minx, miny, maxx, maxy = geom_bounds
     bminx, bminy, bmaxx, bmaxy = bbox
+    return (b[:, 2] >= bminx) & (b[:, 0] <= bmaxx) & (b[:, 3] >= bminy) & (b[:, 1] <= bmaxy)
+
+
+class ParcelStore:
+    """
+    Read side of the parcel store. Every array and both blob files are
+    memory-mapped, so opening is instant and pages are only touched for the
+    parcels a query actually returns.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        path = path or PARCEL_STORE_DIR
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.offsets = load("offsets.npy")
+        self.bounds = load("bounds.npy")
+        self.order = load("order.npy")
+        self.nodes = load("nodes.npy")
+        self.node_size = self.meta["node_size"]
+        self.geoms = self._map(os.path.join(path, "geoms.wkb"))
+        self.attrs = self._map(os.path.join(path, "attrs.jsonl"))
+
+    @staticmethod
+    def _map(path: str):
+        if os.path.getsize(path) == 0:
+            return b""
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def query(self, bbox: Tuple[float, float, float, float]) -> np.ndarray:
+        """
+        Sorted record indices of parcels whose bounds intersect the bbox:
+        node bounds first, then only the leaves under the nodes that hit.
+        """
+        hit_nodes = np.flatnonzero(_intersects(self.nodes, bbox))
+        if not len(hit_nodes):
+            return np.zeros(0, dtype=np.int64)
+
+        leaves = (hit_nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+        leaves = leaves[leaves < len(self.order)]
+        leaves = leaves[_intersects(self.bounds[leaves], bbox)]
+        return np.sort(self.order[leaves])
 
-    if maxx < bminx:
-        return False
-    if minx > bmaxx:
-        return False
-    if maxy < bminy:
-        return False
-    if miny > bmaxy:
-        return False
-    return True
+    def parcels(self, records: np.ndarray) -> List[Dict]:
+        geoms = shapely.from_wkb([
+            self.geoms[self.offsets[r, 0]:self.offsets[r + 1, 0]] for r in records
+        ])
+        out = []
+        for r, geom in zip(records, geoms):
+            parcel = json.loads(self.attrs[self.offsets[r, 1]:self.offsets[r + 1, 1]])
+            parcel["geom"] = geom
+            out.append(parcel)
+        return out
+
+
+_store: Optional[ParcelStore] = None
+_store_lock = threading.Lock()
+
+
+def open_parcel_store() -> Optional[ParcelStore]:
+    """
+    Process-wide ParcelStore, built on first use and rebuilt whenever the
+    source GeoJSON changes. None if there is no parcel file at all.
+    """
+    global _store
+
+    with _store_lock:
+        if not os.path.exists(PARCEL_GEOJSON_PATH):
+            return None
+        signature = _source_signature(PARCEL_GEOJSON_PATH)
+
+        if _store is not None and all(_store.meta.get(k) == v for k, v in signature.items()):
+            return _store
+
+        meta_path = os.path.join(PARCEL_STORE_DIR, "meta.json")
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        fresh = (
+            meta is not None
+            and meta.get("version") == STORE_VERSION
+            and all(meta.get(k) == v for k, v in signature.items())
+        )
+        if not fresh:
+            build_parcel_store()
+
+        _store = ParcelStore()
+        return _store
 
 
 def load_parcels_in_bbox(
@@ -57,6 +277,9 @@ def load_parcels_in_bbox(
     """
     Load parcel assessment polygons that intersect the given bounding box.
 
+    Served from the memory-mapped parcel store, which is built from the
+    GeoJSON once (and again only when that file changes).
+
     Returns a list of dicts with:
       - id
       - geom (shapely geometry)
@@ -66,49 +289,16 @@ def load_parcels_in_bbox(
     """
     bbox = (min_lon, min_lat, max_lon, max_lat)
 
-    if not os.path.exists(PARCEL_GEOJSON_PATH):
+    store = open_parcel_store()
+    if store is None:
         print(f"[parcel_loader] WARNING: Parcel file not found: {PARCEL_GEOJSON_PATH}")
         return []
 
-    with open(PARCEL_GEOJSON_PATH, "r") as f:
-        data = json.load(f)
-
-    features = data.get("features", [])
-    parcels: List[Dict] = []
-
-    for idx, feat in enumerate(features):
-        geom = shape(feat.get("geometry"))
-        if geom.is_empty:
-            continue
-
-        # Quick bbox filter
-        if not _geom_intersects_bbox(geom.bounds, bbox):
-            continue
-
-        props = feat.get("properties", {})
-
-        assessed_value = _to_float(props, "assessed_value") or 0.0
-        # You can still use parcels with 0 value (parks, roads, etc.), but they
-        # won't contribute money to buildings.
-
-        parcel = {
-            "id": idx,
-            "geom": geom,
-            "area": float(geom.area),
-            "assessed_value": assessed_value,
-            "roll_number": props.get("roll_number"),
-            "address": props.get("address"),
-            "assessment_class": props.get("assessment_class"),
-            "assessment_class_description": props.get("assessment_class_description"),
-            "land_use_designation": props.get("land_use_designation"),
-            "property_type": props.get("property_type"),
-            "land_size_sm": _to_float(props, "land_size_sm"),
-            "land_size_ac": _to_float(props, "land_size_ac"),
-            "comm_name": props.get("comm_name"),
-            "year_of_construction": props.get("year_of_construction"),
-        }
-
-        parcels.append(parcel)
+    parcels = store.parcels(store.query(bbox))
 
     print(f"[parcel_loader] Loaded {len(parcels)} parcels in bbox {bbox}")
-    return parcels
\ No newline at end of file
+    return parcels
+
+
+if __name__ == "__main__":
+    build_parcel_store()
@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import json
+import struct
+
+import numpy as np
+from flask import Response, request
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+BINARY_MAGIC = b"UB3D"
+BINARY_VERSION = 1
+
+
+class Payload:
+    """
+    Response body serialized and compressed once, served many times.
+
+    The ETag is a hash of the uncompressed body, so it only changes when the
+    dataset does and repeat visitors get a 304 instead of the full payload.
+    Each encoding gets its own tag ("<hash>-br", "<hash>-gz", "<hash>"):
+    strong validators must be byte-specific, or a cache could answer a gzip
+    request with a 304 for its brotli copy.
+    """
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzip = gzip.compress(body, compresslevel=9)
+        self.br = brotli.compress(body) if brotli is not None else None
+
+    def _variant(self):
+        """
+        (body, Content-Encoding or None, ETag) for the current request.
+        """
+        encodings = request.accept_encodings
+        if self.br is not None and encodings["br"]:
+            return self.br, "br", f"{self.etag}-br"
+        if encodings["gzip"]:
+            return self.gzip, "gzip", f"{self.etag}-gz"
+        return self.body, None, self.etag
+
+    def serve(self):
+        body, encoding, etag = self._variant()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=self.mimetype)
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+def json_payload(data):
+    return Payload(json.dumps(data, separators=(",", ":")).encode("utf-8"), "application/json")
+
+
+# -------------------------------------
+# COMPACT BINARY BUILDINGS FORMAT
+# -------------------------------------
+def encode_buildings_binary(buildings):
+    """
+    Pack buildings into a flat little-endian buffer that maps straight onto
+    typed arrays for a Three.js BufferGeometry:
+
+      header      "UB3D", uint32 version, uint32 count,
+                  uint32 vertex_count, uint32 table_bytes
+      offsets     Uint32[count + 1]    first vertex of each footprint
+      heights     Float32[count]
+      vertices    Float32[vertex_count * 2]   x, y pairs
+      table       UTF-8 JSON array of the remaining attributes per building
+
+    Every section before the table is 4-byte aligned.
+    """
+    lengths = np.array([len(b["footprint"]) for b in buildings], dtype=np.uint32)
+    offsets = np.zeros(len(buildings) + 1, dtype=np.uint32)
+    np.cumsum(lengths, out=offsets[1:])
+
+    vertices = np.array(
+        [pt[:2] for b in buildings for pt in b["footprint"]], dtype="<f4"
+    ).reshape(-1)
+    heights = np.array([b.get("height") or 0.0 for b in buildings], dtype="<f4")
+
+    table = json.dumps(
+        [{k: v for k, v in b.items() if k not in ("footprint", "height")} for b in buildings],
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    header = BINARY_MAGIC + struct.pack(
+        "<IIII", BINARY_VERSION, len(buildings), int(offsets[-1]), len(table)
+    )
+    return b"".join([
+        header,
+        offsets.astype("<u4").tobytes(),
+        heights.tobytes(),
+        vertices.tobytes(),
+        table,
+    ])
+
+
+def binary_payload(buildings):
+    return Payload(encode_buildings_binary(buildings), "application/octet-stream")
@@ -0,0 +1,546 @@
+"""
+Single entry point for the preprocessing pipeline. Stages form a DAG
+(parcels -> join -> columns by default) and run in dependency order, fanned out over a
+process pool. Produces the same parcels.json / buildings.json as running
+preprocess_parcels.py and preprocess_join.py one after the other.
+
+Input and output hashes of every stage are recorded in a manifest; a stage
+whose inputs and outputs are unchanged is skipped, and when only parcel
+attributes changed the join re-merges just the affected buildings.
+
+Every run prints (and with --report, writes as JSON) wall time, CPU time,
+peak RSS and record counts per stage.
+
+    python pipeline.py
+    python pipeline.py join columns --no-deps --workers 16
+    python pipeline.py --force --report pipeline_report.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import data_loader
+import preprocess_buildings
+import preprocess_join as join
+import preprocess_osm
+import preprocess_parcels as parcels_step
+from geojson_stream import iter_features, write_json_array
+from lod import build_lods
+from profiling import cpu_seconds, peak_rss_mb
+from spatial_index import GridIndex
+
+# Raw parcel features handed to a worker at a time
+PARCEL_BATCH = 5_000
+
+# Spatial chunks per worker for the join (more chunks = better balancing)
+CHUNKS_PER_WORKER = 4
+
+# Manifest + per-parcel digests from the last successful run
+STATE_DIR = os.path.join(join.BASE_DIR, "data", "pipeline_state")
+MANIFEST_PATH = os.path.join(STATE_DIR, "manifest.json")
+PARCEL_GEOM_DIGESTS = os.path.join(STATE_DIR, "parcel_geom.npy")
+PARCEL_ATTR_DIGESTS = os.path.join(STATE_DIR, "parcel_attr.npy")
+BUILDING_MATCH = os.path.join(STATE_DIR, "match.npy")
+
+# Parcel fields that decide which parcel a building matches
+PARCEL_GEOM_FIELDS = ("polygons", "min_lon", "max_lon", "min_lat", "max_lat")
+
+HASH_CHUNK = 1 << 20
+
+
+# -------------------------------------
+# MANIFEST
+# -------------------------------------
+def file_hash(path):
+    """
+    sha256 of a file's contents, or None if it doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def hash_files(paths):
+    return {os.path.relpath(p, join.BASE_DIR): file_hash(p) for p in paths}
+
+
+def stage_fresh(manifest, stage, inputs, outputs):
+    """
+    True if the stage last ran on exactly these inputs and its outputs are
+    still the ones it wrote.
+    """
+    entry = manifest.get(stage)
+    return (
+        entry is not None
+        and entry["inputs"] == hash_files(inputs)
+        and entry["outputs"] == hash_files(outputs)
+    )
+
+
+def record_stage(manifest, stage, inputs, outputs):
+    manifest[stage] = {"inputs": hash_files(inputs), "outputs": hash_files(outputs)}
+    save_manifest(manifest)
+
+
+def parcel_digests(parcels):
+    """
+    Per-parcel (geometry, attributes) digests. Parcel ids are positional and
+    get renumbered on every run, so they're left out.
+    """
+    geom, attr = [], []
+    for p in parcels:
+        g = {k: p.get(k) for k in PARCEL_GEOM_FIELDS}
+        a = {k: v for k, v in p.items() if k != "id" and k not in PARCEL_GEOM_FIELDS}
+        geom.append(hashlib.blake2b(json.dumps(g).encode(), digest_size=16).digest())
+        attr.append(hashlib.blake2b(json.dumps(a, sort_keys=True).encode(), digest_size=16).digest())
+    return np.array(geom, dtype="S16"), np.array(attr, dtype="S16")
+
+
+# -------------------------------------
+# PARCELS
+# -------------------------------------
+def _parcel_batch(features, bbox):
+    stats = {"raw": 0}
+    return list(parcels_step.iter_parcels(features, bbox, stats)), stats["raw"]
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ordered_map(pool, fn, batches, *args, window):
+    """
+    pool.map that keeps at most `window` batches in flight, so a streamed
+    input is never pulled into memory all at once. Results come back in
+    submission order.
+    """
+    pending = deque()
+    for batch in batches:
+        pending.append(pool.submit(fn, batch, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_parcels(workers, manifest, force=False):
+    if not os.path.exists(parcels_step.RAW_PARCEL_PATH):
+        raise FileNotFoundError(f"[parcels] {parcels_step.RAW_PARCEL_PATH} not found")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return filter_parcels(pool, workers)
+
+
+def filter_parcels(pool, workers):
+    bbox = parcels_step.load_osm_bbox()
+    print(f"[pipeline] Filtering parcels on {workers} workers…")
+
+    stats = {"raw": 0}
+
+    def merged():
+        # Batches number their parcels from 0; renumber in input order
+        next_id = 0
+        results = _ordered_map(
+            pool, _parcel_batch,
+            _batches(iter_features(parcels_step.RAW_PARCEL_PATH), PARCEL_BATCH),
+            bbox, window=2 * workers,
+        )
+        for batch, raw in results:
+            stats["raw"] += raw
+            for parcel in batch:
+                parcel["id"] = next_id
+                next_id += 1
+                yield parcel
+
+    kept = write_json_array(parcels_step.OUT_PARCELS_PATH, merged())
+    print(f"[parcels] Total raw parcels: {stats['raw']}")
+    print(f"[parcels] Kept {kept} parcels after bbox filtering")
+    print(f"[✓] Saved simplified parcels → {parcels_step.OUT_PARCELS_PATH}")
+    return {"raw": stats["raw"], "kept": kept}
+
+
+# -------------------------------------
+# JOIN
+# -------------------------------------
+_worker_index = None
+
+
+def _init_join_worker(index_dir):
+    global _worker_index
+    _worker_index = join.load_parcel_index(index_dir)
+
+
+def _join_chunk(lons, lats, footprints):
+    """
+    Parcel match and LOD footprints for one spatial chunk of buildings.
+    """
+    match = join.match_parcels(lons, lats, _worker_index)
+    return match, [build_lods(fp) for fp in footprints]
+
+
+def spatial_chunks(lons, lats, count):
+    """
+    Split building indices into `count` spatially compact chunks: sort by
+    centroid longitude into strips, then by latitude within each strip.
+    Buildings without a centroid go to the last chunk.
+    """
+    finite = np.isfinite(lons) & np.isfinite(lats)
+    located = np.flatnonzero(finite)
+    located = located[np.argsort(lons[located], kind="stable")]
+
+    strips = max(int(np.sqrt(count)), 1)
+    chunks = []
+    for strip in np.array_split(located, strips):
+        strip = strip[np.argsort(lats[strip], kind="stable")]
+        chunks.extend(np.array_split(strip, max(count // strips, 1)))
+
+    chunks.append(np.flatnonzero(~finite))
+    return [c for c in chunks if len(c)]
+
+
+def full_join(buildings, parcels, lons, lats, workers):
+    """
+    Match and simplify every building, chunked across the pool.
+    """
+    chunks = spatial_chunks(lons, lats, workers * CHUNKS_PER_WORKER)
+
+    match = np.full(len(buildings), -1, dtype=np.int64)
+    lods = [None] * len(buildings)
+
+    index_dir = tempfile.mkdtemp(prefix="parcel_index_")
+    try:
+        join.save_parcel_index(join.build_parcel_index(parcels), index_dir)
+        print(f"[pipeline] Joining {len(chunks)} spatial chunks on {workers} workers…")
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_join_worker, initargs=(index_dir,)
+        ) as pool:
+            futures = [
+                pool.submit(_join_chunk, lons[c], lats[c], [buildings[i]["footprint"] for i in c])
+                for c in chunks
+            ]
+            # Scatter each chunk back to its buildings' original positions
+            for c, future in zip(chunks, futures):
+                chunk_match, chunk_lods = future.result()
+                match[c] = chunk_match
+                for i, fp_lods in zip(c, chunk_lods):
+                    lods[i] = fp_lods
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    enriched = [
+        join.enrich_building(b, parcels[m] if m >= 0 else None, fp_lods)
+        for b, m, fp_lods in zip(buildings, match, lods)
+    ]
+    join.save_buildings(enriched, int((match >= 0).sum()))
+    return match
+
+
+def incremental_join(buildings, parcels, lons, lats, changed, match):
+    """
+    Re-merge only the buildings a parcel attribute change can affect: those
+    whose centroid lies in the bbox of a changed parcel (assessed_value
+    breaks ties between overlapping parcels, so the match itself is
+    recomputed, against just the parcels around those centroids). Everyone
+    else, LOD footprints included, is reused from the previous buildings.json.
+    `match` (parcel per building from the last run) is updated in place.
+    """
+    with open(join.OUT_BUILDINGS_PATH) as f:
+        previous = json.load(f)
+
+    bounds = np.array(
+        [[p["min_lon"], p["min_lat"], p["max_lon"], p["max_lat"]] for p in parcels],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+
+    affected, _ = GridIndex(bounds[changed]).point_candidates(lons, lats)
+    affected = np.unique(affected)
+
+    if len(affected):
+        # Only parcels whose bbox holds an affected centroid can match it;
+        # kept in file order so ties still go to the earlier parcel
+        _, nearby = GridIndex(bounds).point_candidates(lons[affected], lats[affected])
+        nearby = np.unique(nearby)
+        index = join.build_parcel_index([parcels[k] for k in nearby])
+        local = join.match_parcels(lons[affected], lats[affected], index)
+
+        match[affected] = np.where(local >= 0, nearby[np.maximum(local, 0)], -1)
+        for i in affected:
+            parcel = parcels[match[i]] if match[i] >= 0 else None
+            previous[i] = join.enrich_building(buildings[i], parcel, previous[i]["footprint_lods"])
+
+    print(f"[pipeline] {len(changed)} parcels changed → re-joined {len(affected)} buildings")
+    join.save_buildings(previous, int((match >= 0).sum()))
+    return match, len(affected)
+
+
+def run_join(workers, manifest, force=False):
+    inputs, outputs = STAGES["join"]["inputs"](), STAGES["join"]["outputs"]()
+    for path in inputs:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"[join] {path} not found")
+
+    with open(join.OSM_BUILDINGS_PATH) as f:
+        buildings = json.load(f)
+    with open(join.PARCELS_PATH) as f:
+        parcels = json.load(f)
+    print(f"[join] OSM buildings: {len(buildings)}, parcels: {len(parcels)}")
+
+    lons, lats = join.building_centroids(buildings)
+    geom, attr = parcel_digests(parcels)
+
+    # Incremental only if the buildings and every parcel geometry are the
+    # same as last time and buildings.json is still the one we wrote
+    entry = manifest.get("join")
+    osm_key, out_key = (os.path.relpath(p, join.BASE_DIR) for p in (inputs[0], outputs[0]))
+    incremental = (
+        not force
+        and entry is not None
+        and entry["inputs"].get(osm_key) == file_hash(inputs[0])
+        and entry["outputs"].get(out_key) == file_hash(outputs[0])
+        and os.path.exists(PARCEL_GEOM_DIGESTS)
+        and os.path.exists(PARCEL_ATTR_DIGESTS)
+        and os.path.exists(BUILDING_MATCH)
+    )
+    if incremental:
+        old_geom = np.load(PARCEL_GEOM_DIGESTS)
+        incremental = len(old_geom) == len(geom) and bool((old_geom == geom).all())
+
+    if incremental:
+        changed = np.flatnonzero(np.load(PARCEL_ATTR_DIGESTS) != attr)
+        match, rejoined = incremental_join(
+            buildings, parcels, lons, lats, changed, np.load(BUILDING_MATCH)
+        )
+    else:
+        match = full_join(buildings, parcels, lons, lats, workers)
+        rejoined = len(buildings)
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    np.save(BUILDING_MATCH, match)
+    np.save(PARCEL_GEOM_DIGESTS, geom)
+    np.save(PARCEL_ATTR_DIGESTS, attr)
+    return {
+        "buildings": len(buildings),
+        "parcels": len(parcels),
+        "matched": int((match >= 0).sum()),
+        "rejoined": rejoined,
+    }
+
+
+# -------------------------------------
+# COLUMNS
+# -------------------------------------
+def run_columns(workers, manifest, force=False):
+    schema = data_loader.build_columns()
+    return {"buildings": schema["count"], "fields": len(schema["fields"])}
+
+
+# -------------------------------------
+# STANDALONE BUILDERS
+# -------------------------------------
+def run_osm(workers, manifest, force=False):
+    return preprocess_osm.main()
+
+
+def run_citywide(workers, manifest, force=False):
+    return preprocess_buildings.preprocess()
+
+
+# -------------------------------------
+# STAGE GRAPH
+# -------------------------------------
+# Each stage: the stages it depends on, its input/output files (looked up
+# at run time), and a runner returning record counts. "osm" and "citywide"
+# are alternative single-step builders of buildings.json, not part of the
+# default parcels -> join -> columns chain.
+STAGES = {
+    "parcels": {
+        "deps": (),
+        "inputs": lambda: [parcels_step.RAW_PARCEL_PATH, parcels_step.OSM_BBOX_PATH],
+        "outputs": lambda: [parcels_step.OUT_PARCELS_PATH],
+        "run": run_parcels,
+    },
+    "join": {
+        "deps": ("parcels",),
+        "inputs": lambda: [join.OSM_BUILDINGS_PATH, join.PARCELS_PATH],
+        "outputs": lambda: [join.OUT_BUILDINGS_PATH],
+        "run": run_join,
+    },
+    "columns": {
+        "deps": ("join",),
+        "inputs": lambda: [data_loader.DATA_PATH],
+        "outputs": lambda: [os.path.join(data_loader.COLUMNS_PATH, "schema.json")],
+        "run": run_columns,
+    },
+    "osm": {
+        "deps": (),
+        "inputs": lambda: [preprocess_osm.OSM_PATH, preprocess_osm.PARCEL_PATH],
+        "outputs": lambda: [preprocess_osm.OUTPUT_PATH],
+        "run": run_osm,
+    },
+    "citywide": {
+        "deps": (),
+        "inputs": lambda: [preprocess_buildings.RAW_PATH],
+        "outputs": lambda: [preprocess_buildings.OUT_PATH],
+        "run": run_citywide,
+    },
+}
+DEFAULT_TARGETS = ("columns",)
+
+
+def plan(targets, with_deps=True):
+    """
+    Stages to run for `targets`, dependencies first (depth-first topological
+    order, each stage once).
+    """
+    order = []
+
+    def visit(name, path):
+        if name in path:
+            raise ValueError(f"[pipeline] dependency cycle: {' -> '.join(path + (name,))}")
+        if name in order:
+            return
+        if with_deps:
+            for dep in STAGES[name]["deps"]:
+                visit(dep, path + (name,))
+        order.append(name)
+
+    for target in targets:
+        visit(target, ())
+    return order
+
+
+def _mb(value):
+    return None if value is None else round(value, 1)
+
+
+def run_stage(name, workers, force=False):
+    """
+    Run one stage (or skip it if the manifest says it's up to date) and
+    return its report entry: wall time, CPU time including pool workers,
+    peak RSS of the stage and of its workers, and record counts.
+    """
+    stage = STAGES[name]
+    inputs, outputs = stage["inputs"](), stage["outputs"]()
+    manifest = load_manifest()
+
+    t0 = time.perf_counter()
+    cpu0 = cpu_seconds()
+
+    if not force and stage_fresh(manifest, name, inputs, outputs):
+        print(f"[pipeline] {name} inputs unchanged, skipping")
+        status, counts = "skipped", {}
+    else:
+        status = "ran"
+        counts = stage["run"](workers, manifest, force) or {}
+        record_stage(manifest, name, inputs, outputs)
+
+    cpu1 = cpu_seconds()
+    return {
+        "stage": name,
+        "status": status,
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "cpu_s": None if cpu0 is None else round(cpu1 - cpu0, 3),
+        "peak_rss_mb": _mb(peak_rss_mb()),
+        "workers_peak_rss_mb": _mb(peak_rss_mb(children=True)),
+        "counts": counts,
+    }
+
+
+def run_isolated(name, workers, force=False):
+    """
+    run_stage in a fresh interpreter, so the stage's peak RSS and CPU time
+    aren't mixed up with earlier stages or with the driver itself.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as runner:
+        return runner.submit(run_stage, name, workers, force).result()
+
+
+def print_report(report):
+    print(f"{'stage':<10} {'status':<8} {'wall s':>8} {'cpu s':>8} {'peak MiB':>9} {'workers MiB':>12}  counts")
+    for r in report["stages"]:
+        counts = ", ".join(f"{k}={v}" for k, v in r["counts"].items())
+        print(
+            f"{r['stage']:<10} {r['status']:<8} {r['wall_s']:>8.2f} {r['cpu_s'] or 0:>8.2f} "
+            f"{r['peak_rss_mb'] or 0:>9.1f} {r['workers_peak_rss_mb'] or 0:>12.1f}  {counts}"
+        )
+    print(f"[pipeline] Total wall time {report['wall_s']:.2f}s")
+
+
+# -------------------------------------
+# MAIN
+# -------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "targets", nargs="*", default=list(DEFAULT_TARGETS),
+        help=f"stages to build, with their dependencies ({', '.join(STAGES)}; default: columns)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="ignore the manifest, rebuild everything")
+    parser.add_argument("--no-deps", action="store_true", help="run only the named stages")
+    parser.add_argument("--in-process", action="store_true", help="don't isolate stages in subprocesses")
+    parser.add_argument("--report", help="write the JSON run report to this path")
+    args = parser.parse_args()
+
+    unknown = set(args.targets) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    workers = max(args.workers, 1)
+    stages = plan(args.targets, with_deps=not args.no_deps)
+    print(f"[pipeline] Stages: {' -> '.join(stages)} ({workers} workers)")
+
+    run = run_stage if args.in_process else run_isolated
+    t0 = time.perf_counter()
+    report = {"workers": workers, "stages": []}
+    for name in stages:
+        report["stages"].append(run(name, workers, args.force))
+    report["wall_s"] = round(time.perf_counter() - t0, 3)
+    report["peak_rss_mb"] = _mb(peak_rss_mb())
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[✓] Saved pipeline report → {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,21 @@
-import json
 import os
 
-# Because you run the script from inside backend/, paths start with data/
-RAW_PATH = "data/raw/3D_Buildings_-_Citywide_20251205.geojson"
-OUT_PATH = "data/buildings.json"
+from geojson_stream import iter_features, write_json_array
 
-def preprocess():
-    if not os.path.exists(RAW_PATH):
-        raise FileNotFoundError(f"[ERROR] Raw file not found: {RAW_PATH}")
+BASE_DIR = os.path.dirname(__file__)
 
-    print("[preprocess] Loading raw GeoJSON…")
-    with open(RAW_PATH) as f:
-        data = json.load(f)
+RAW_PATH = os.path.join(BASE_DIR, "data", "raw", "3D_Buildings_-_Citywide_20251205.geojson")
+OUT_PATH = os.path.join(BASE_DIR, "data", "buildings.json")
 
-    features = data.get("features", [])
-    print(f"[preprocess] Total raw features: {len(features)}")
-
-    buildings = []
+def iter_buildings(features, stats):
+    """
+    Cleaned buildings from a stream of raw 3D-building features, one at a
+    time. stats["raw"] counts the features seen.
+    """
     next_id = 0
 
     for feat in features:
+        stats["raw"] += 1
         geom = feat.get("geometry", {})
         props = feat.get("properties", {})
 
@@ -43,25 +39,34 @@ def preprocess():
 
         stage = props.get("stage", "UNKNOWN")
 
-        buildings.append({
+        yield {
             "id": next_id,
             "footprint": footprint,
             "height": round(height, 2),
             "stage": stage,
             "struct_id": props.get("struct_id")
-        })
+        }
 
         next_id += 1
 
-    print(f"[preprocess] Processed buildings: {len(buildings)}")
+
+def preprocess():
+    if not os.path.exists(RAW_PATH):
+        raise FileNotFoundError(f"[ERROR] Raw file not found: {RAW_PATH}")
+
+    print("[preprocess] Streaming raw GeoJSON…")
 
     # Ensure output directory exists
     os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
 
-    with open(OUT_PATH, "w") as f:
-        json.dump(buildings, f)
+    stats = {"raw": 0}
+    count = write_json_array(OUT_PATH, iter_buildings(iter_features(RAW_PATH), stats))
+
+    print(f"[preprocess] Total raw features: {stats['raw']}")
+    print(f"[preprocess] Processed buildings: {count}")
 
     print(f"[✓] Saved cleaned dataset → {OUT_PATH}")
+    return {"raw": stats["raw"], "buildings": count}
 
 if __name__ == "__main__":
     preprocess()
\ No newline at end of file
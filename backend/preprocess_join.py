@@ -1,5 +1,11 @@
 import os
 import json
+import time
+
+import numpy as np
+
+from lod import LOD_TOLERANCES, build_lods
+from spatial_index import GridIndex, RingSet
 
 BASE_DIR = os.path.dirname(__file__)
 
@@ -8,56 +14,185 @@ PARCELS_PATH = os.path.join(BASE_DIR, "data", "parcels.json")
 OUT_BUILDINGS_PATH = os.path.join(BASE_DIR, "data", "buildings.json")
 
 
-def point_in_polygon(x, y, poly):
+def build_parcel_index(parcels):
+    """
+    Spatial index over the parcel bboxes stored by preprocess_parcels.py, plus
+    every parcel outer ring packed for batched point-in-polygon tests.
+    """
+    bounds = np.array(
+        [[p["min_lon"], p["min_lat"], p["max_lon"], p["max_lat"]] for p in parcels],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+
+    rings = []
+    ring_owner = []
+    ring_start = np.zeros(len(parcels) + 1, dtype=np.int64)
+    for i, p in enumerate(parcels):
+        rings.extend(p["polygons"])
+        ring_owner.extend([i] * len(p["polygons"]))
+        ring_start[i + 1] = len(rings)
+
+    return {
+        "grid": GridIndex(bounds),
+        "rings": RingSet(rings),
+        "ring_owner": np.array(ring_owner, dtype=np.int64),
+        "ring_start": ring_start,
+        "value": np.array(
+            [p.get("assessed_value") or 0.0 for p in parcels], dtype=np.float64
+        ),
+    }
+
+
+def save_parcel_index(index, path):
     """
-    Ray-casting algorithm to test if a point is inside a polygon.
-    poly: list of [lon, lat]
+    Write a parcel index as one .npy file per array (scalars in meta.json),
+    so worker processes can memory-map a single shared copy of it.
     """
-    inside = False
-    n = len(poly)
-    if n < 3:
-        return False
+    os.makedirs(path, exist_ok=True)
+    meta = {}
+    for name, part in index.items():
+        fields = vars(part) if not isinstance(part, np.ndarray) else {"": part}
+        meta[name] = {"class": type(part).__name__, "scalars": {}}
+        for field, value in fields.items():
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(path, f"{name}.{field}.npy"), value)
+            else:
+                meta[name]["scalars"][field] = value
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_parcel_index(path, mmap_mode="r"):
+    """
+    Inverse of save_parcel_index. With the default mmap_mode every process
+    shares the same page-cache copy of the arrays.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    classes = {"GridIndex": GridIndex, "RingSet": RingSet}
+    index = {}
+    for name, info in meta.items():
+        prefix = f"{name}."
+        arrays = {
+            fname[len(prefix):-len(".npy")]: np.load(os.path.join(path, fname), mmap_mode=mmap_mode)
+            for fname in os.listdir(path)
+            if fname.startswith(prefix) and fname.endswith(".npy")
+        }
+        if info["class"] == "ndarray":
+            index[name] = arrays[""]
+            continue
+        part = object.__new__(classes[info["class"]])
+        part.__dict__.update(info["scalars"])
+        part.__dict__.update(arrays)
+        index[name] = part
+    return index
 
-    for i in range(n):
-        x1, y1 = poly[i]
-        x2, y2 = poly[(i + 1) % n]
 
-        # Check if the horizontal ray intersects this edge
-        if ((y1 > y) != (y2 > y)) and (
-            x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1
-        ):
-            inside = not inside
+def match_parcels(lons, lats, index):
+    """
+    Parcel index (or -1) for every building centroid.
 
-    return inside
+    Candidates come from the grid index (bbox hits only), then every
+    (centroid, outer ring) pair is tested in one vectorized batch. If several
+    parcels contain a centroid, the highest assessed_value wins (ties go to
+    the earlier parcel).
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    match = np.full(len(lons), -1, dtype=np.int64)
+
+    points, parcels = index["grid"].point_candidates(lons, lats)
+
+    # Expand (point, parcel) candidates into (point, ring) pairs
+    first = index["ring_start"][parcels]
+    counts = index["ring_start"][parcels + 1] - first
+    pair_points = np.repeat(points, counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_rings = np.repeat(first, counts) + local
+
+    inside = index["rings"].contains(lons[pair_points], lats[pair_points], pair_rings)
+    hit_points = pair_points[inside]
+    hit_parcels = index["ring_owner"][pair_rings[inside]]
 
+    # Best parcel per point: sort by point, then value desc, then parcel order
+    order = np.lexsort((hit_parcels, -index["value"][hit_parcels], hit_points))
+    hit_points, hit_parcels = hit_points[order], hit_parcels[order]
+    if len(hit_points):
+        first = np.r_[True, hit_points[1:] != hit_points[:-1]]
+        match[hit_points[first]] = hit_parcels[first]
+    return match
 
-def find_parcel_for_building(lon, lat, parcels):
+
+def enrich_building(building, parcel, lods):
     """
-    Find the parcel that contains the building centroid (lon, lat).
-    If multiple parcels match, pick the one with the highest assessed_value.
+    Copy of `building` with its simplified footprints and the matched
+    parcel's attributes (or None placeholders when nothing matched).
     """
-    candidates = []
-    for p in parcels:
-        if not (
-            p["min_lon"] <= lon <= p["max_lon"]
-            and p["min_lat"] <= lat <= p["max_lat"]
-        ):
-            continue
+    merged = dict(building)  # copy base building data
+
+    # Simplified footprints for zoomed-out views (level 0 = footprint)
+    merged["footprint_lods"] = lods
+
+    if parcel:
+        merged.update(
+            {
+                "roll_number": parcel.get("roll_number"),
+                "address": parcel.get("address"),
+                "assessed_value": parcel.get("assessed_value"),
+                "assessment_class": parcel.get("assessment_class"),
+                "assessment_class_description": parcel.get(
+                    "assessment_class_description"
+                ),
+                "community": parcel.get("comm_name"),
+                "land_use_designation": parcel.get("land_use_designation"),
+                "property_type": parcel.get("property_type"),
+                "land_size_sm": parcel.get("land_size_sm"),
+                "land_size_ac": parcel.get("land_size_ac"),
+                "sub_property_use": parcel.get("sub_property_use"),
+            }
+        )
+    else:
+        # Still include the building; it just won't have assessment data
+        merged.setdefault("assessed_value", None)
+        merged.setdefault("address", None)
+        merged.setdefault("community", None)
+        merged.setdefault("land_use_designation", None)
+
+    return merged
+
+
+def save_buildings(enriched, matched_count, path=OUT_BUILDINGS_PATH):
+    print(
+        f"[join] Enriched {len(enriched)} buildings, "
+        f"matched parcels for {matched_count} of them"
+    )
+
+    vertices = [sum(len(b["footprint"]) for b in enriched)]
+    for level in range(1, len(LOD_TOLERANCES)):
+        vertices.append(sum(len(b["footprint_lods"][level - 1]) for b in enriched))
+    print(
+        "[join] Footprint vertices per LOD: "
+        + ", ".join(f"{lvl}={n}" for lvl, n in enumerate(vertices))
+    )
+
+    with open(path, "w") as f:
+        json.dump(enriched, f)
 
-        # Detailed point-in-polygon for each outer ring
-        for ring in p["polygons"]:
-            if point_in_polygon(lon, lat, ring):
-                candidates.append(p)
-                break
+    print(f"[✓] Saved final buildings dataset → {path}")
 
-    if not candidates:
-        return None
 
-    best = max(
-        candidates,
-        key=lambda p: p.get("assessed_value") if p.get("assessed_value") is not None else 0.0,
+def building_centroids(buildings):
+    """
+    (lons, lats) arrays of building centroids; NaN where a building has none,
+    which never falls inside a parcel.
+    """
+    lons = [b.get("centroid_lon") for b in buildings]
+    lats = [b.get("centroid_lat") for b in buildings]
+    return (
+        np.array([np.nan if v is None else v for v in lons], dtype=np.float64),
+        np.array([np.nan if v is None else v for v in lats], dtype=np.float64),
     )
-    return best
 
 
 def main():
@@ -76,56 +211,22 @@ def main():
         parcels = json.load(f)
     print(f"[join] Parcels: {len(parcels)}")
 
-    enriched = []
-    matched_count = 0
-
-    for b in buildings:
-        lon = b.get("centroid_lon")
-        lat = b.get("centroid_lat")
-
-        parcel = None
-        if lon is not None and lat is not None:
-            parcel = find_parcel_for_building(lon, lat, parcels)
-
-        merged = dict(b)  # copy base building data
-
-        if parcel:
-            matched_count += 1
-            merged.update(
-                {
-                    "roll_number": parcel.get("roll_number"),
-                    "address": parcel.get("address"),
-                    "assessed_value": parcel.get("assessed_value"),
-                    "assessment_class": parcel.get("assessment_class"),
-                    "assessment_class_description": parcel.get(
-                        "assessment_class_description"
-                    ),
-                    "community": parcel.get("comm_name"),
-                    "land_use_designation": parcel.get("land_use_designation"),
-                    "property_type": parcel.get("property_type"),
-                    "land_size_sm": parcel.get("land_size_sm"),
-                    "land_size_ac": parcel.get("land_size_ac"),
-                    "sub_property_use": parcel.get("sub_property_use"),
-                }
-            )
-        else:
-            # Still include the building; it just won't have assessment data
-            merged.setdefault("assessed_value", None)
-            merged.setdefault("address", None)
-            merged.setdefault("community", None)
-            merged.setdefault("land_use_designation", None)
-
-        enriched.append(merged)
+    t0 = time.perf_counter()
+    index = build_parcel_index(parcels)
+    t1 = time.perf_counter()
 
+    match = match_parcels(*building_centroids(buildings), index)
+    t2 = time.perf_counter()
     print(
-        f"[join] Enriched {len(enriched)} buildings, "
-        f"matched parcels for {matched_count} of them"
+        f"[join] Parcel index built in {t1 - t0:.3f}s, "
+        f"matched centroids in {t2 - t1:.3f}s"
     )
 
-    with open(OUT_BUILDINGS_PATH, "w") as f:
-        json.dump(enriched, f)
-
-    print(f"[✓] Saved final buildings dataset → {OUT_BUILDINGS_PATH}")
+    enriched = [
+        enrich_building(b, parcels[m] if m >= 0 else None, build_lods(b["footprint"]))
+        for b, m in zip(buildings, match)
+    ]
+    save_buildings(enriched, int((match >= 0).sum()))
 
 
 if __name__ == "__main__":
@@ -1,23 +1,39 @@
 import os
 import json
+import time
 import xml.etree.ElementTree as ET
 
-OSM_PATH = "backend/data/raw/map.osm"
-PARCEL_PATH = "backend/data/raw/Current_Year_Property_Assessments_(Parcel)_20251206.geojson"
-OUTPUT_PATH = "backend/data/buildings.json"
+import numpy as np
+
+from geojson_stream import iter_features
+from preprocess_join import build_parcel_index, match_parcels
+from profiling import peak_rss_mb
+
+try:
+    import osmium  # optional: pip install osmium (needed for .osm.pbf input)
+except ImportError:
+    osmium = None
+
+BASE_DIR = os.path.dirname(__file__)
+
+OSM_PATH = os.path.join(BASE_DIR, "data", "raw", "map.osm")
+PARCEL_PATH = os.path.join(
+    BASE_DIR,
+    "data",
+    "raw",
+    "Current_Year_Property_Assessments_(Parcel)_20251206.geojson",
+)
+OUTPUT_PATH = os.path.join(BASE_DIR, "data", "buildings.json")
 
 
 # ----------------------------------------
 # LOAD PARCELS FIRST (assessed values, zoning, lot size, address…)
 # ----------------------------------------
 def load_parcels():
-    print("[PARCEL] Loading parcel dataset...")
-
-    with open(PARCEL_PATH) as f:
-        gj = json.load(f)
+    print("[PARCEL] Streaming parcel dataset...")
 
     parcel_polygons = []
-    for feat in gj["features"]:
+    for feat in iter_features(PARCEL_PATH):
         geom = feat["geometry"]
         props = feat["properties"]
 
@@ -26,8 +42,25 @@ def load_parcels():
         if assessed is None:
             continue
 
+        # Outer ring of every polygon part + precomputed bounds, the same
+        # shape preprocess_parcels.py writes, so the join index can be shared
+        if geom["type"] == "Polygon":
+            rings = [geom["coordinates"][0]] if geom["coordinates"] else []
+        elif geom["type"] == "MultiPolygon":
+            rings = [poly[0] for poly in geom["coordinates"] if poly]
+        else:
+            continue
+        if not rings:
+            continue
+        lons = [pt[0] for ring in rings for pt in ring]
+        lats = [pt[1] for ring in rings for pt in ring]
+
         parcel_polygons.append({
-            "geometry": geom,
+            "polygons": rings,
+            "min_lon": min(lons),
+            "max_lon": max(lons),
+            "min_lat": min(lats),
+            "max_lat": max(lats),
             "assessed_value": float(props.get("assessed_value", 0) or 0),
             "land_use_designation": props.get("land_use_designation"),
             "community": props.get("comm_name"),
@@ -46,50 +79,128 @@ def load_parcels():
 # ----------------------------------------
 # PARSE OSM BUILDINGS (with height)
 # ----------------------------------------
-def load_osm_buildings():
-    print("[OSM] Parsing buildings from OSM...")
-
-    tree = ET.parse(OSM_PATH)
-    root = tree.getroot()
-
-    nodes = {}
-    buildings = []
-
-    # Node lookup
-    for node in root.findall("node"):
-        nid = node.get("id")
-        lat = float(node.get("lat"))
-        lon = float(node.get("lon"))
-        nodes[nid] = (lon, lat)
-
-    # Ways = building footprints
-    for way in root.findall("way"):
-        tags = {tag.get("k"): tag.get("v") for tag in way.findall("tag")}
-
+# Node ids/coords are buffered this many at a time before being filtered
+# down to the ones building ways reference
+NODE_CHUNK = 1_000_000
+
+
+def parse_height(tags):
+    height = tags.get("height") or tags.get("building:height")
+    if height:
+        try:
+            return float(height.replace("m", ""))
+        except:
+            return 5.0
+    return 5.0  # default
+
+
+def _iter_elements(path, tag):
+    """
+    Stream top-level <tag> elements, clearing everything already seen so
+    memory stays flat no matter how large the file is.
+    """
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or elem.tag not in ("node", "way", "relation"):
+            continue
+        if elem.tag == tag:
+            yield elem
+        elem.clear()
+        root.clear()
+
+
+class NodeStore:
+    """
+    Compact int64 node id -> (lon, lat) map: sorted id array plus parallel
+    float64 coordinate arrays, looked up by binary search.
+    """
+
+    def __init__(self, ids, lons, lats):
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        self.lons = lons[order]
+        self.lats = lats[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, refs):
+        """
+        Coordinates for the refs that exist, in ref order.
+        """
+        refs = np.asarray(refs, dtype=np.int64)
+        if not len(self.ids):
+            return []
+        idx = np.clip(np.searchsorted(self.ids, refs), 0, len(self.ids) - 1)
+        found = idx[self.ids[idx] == refs]
+        return list(zip(self.lons[found].tolist(), self.lats[found].tolist()))
+
+
+def _load_referenced_nodes(path, wanted):
+    """
+    Second pass: keep only the nodes in `wanted` (sorted, unique int64 ids).
+    """
+    kept_ids, kept_lons, kept_lats = [], [], []
+    ids, lons, lats = [], [], []
+
+    def flush():
+        chunk_ids = np.array(ids, dtype=np.int64)
+        keep = np.isin(chunk_ids, wanted)
+        kept_ids.append(chunk_ids[keep])
+        kept_lons.append(np.array(lons, dtype=np.float64)[keep])
+        kept_lats.append(np.array(lats, dtype=np.float64)[keep])
+        ids.clear()
+        lons.clear()
+        lats.clear()
+
+    for node in _iter_elements(path, "node"):
+        ids.append(int(node.get("id")))
+        lons.append(float(node.get("lon")))
+        lats.append(float(node.get("lat")))
+        if len(ids) >= NODE_CHUNK:
+            flush()
+    flush()
+
+    return NodeStore(
+        np.concatenate(kept_ids), np.concatenate(kept_lons), np.concatenate(kept_lats)
+    )
+
+
+def load_osm_buildings(path=OSM_PATH):
+    """
+    Streaming OSM XML parse in two passes:
+      1) ways: keep building ways (tags + node refs) and collect referenced ids
+      2) nodes: keep coordinates only for those ids, in a compact NodeStore
+    .osm.pbf input is handed to pyosmium when it is installed.
+    """
+    if path.endswith(".pbf"):
+        return load_osm_buildings_pbf(path)
+
+    print("[OSM] Parsing buildings from OSM (streaming)...")
+
+    ways = []
+    for way in _iter_elements(path, "way"):
+        tags = {tag.get("k"): tag.get("v") for tag in way.iter("tag")}
         if "building" not in tags:
             continue
+        refs = np.array([int(nd.get("ref")) for nd in way.iter("nd")], dtype=np.int64)
+        ways.append((way.get("id"), refs, parse_height(tags)))
+
+    wanted = np.unique(np.concatenate([refs for _, refs, _ in ways])) if ways else np.zeros(0, np.int64)
+    print(f"[OSM] {len(ways)} building ways reference {len(wanted)} nodes")
 
-        # Collect coords
-        coords = []
-        for nd in way.findall("nd"):
-            ref = nd.get("ref")
-            if ref in nodes:
-                coords.append(nodes[ref])
+    nodes = _load_referenced_nodes(path, wanted)
+    print(f"[OSM] Kept {len(nodes)} node coordinates")
 
+    buildings = []
+    for osm_id, refs, height in ways:
+        coords = nodes.lookup(refs)
         if len(coords) < 3:
             continue
 
-        height = tags.get("height") or tags.get("building:height")
-        if height:
-            try:
-                height = float(height.replace("m", ""))
-            except:
-                height = 5.0
-        else:
-            height = 5.0  # default
-
         buildings.append({
-            "osm_id": way.get("id"),
+            "osm_id": osm_id,
             "footprint": coords,
             "height": height
         })
@@ -98,52 +209,76 @@ def load_osm_buildings():
     return buildings
 
 
-# ----------------------------------------
-# POINT-IN-POLYGON (simple bounding box filter)
-# ----------------------------------------
-def bbox_contains(poly, point):
-    (x, y) = point
-    minx = min(p[0] for p in poly)
-    maxx = max(p[0] for p in poly)
-    miny = min(p[1] for p in poly)
-    maxy = max(p[1] for p in poly)
-    return (minx <= x <= maxx) and (miny <= y <= maxy)
+def load_osm_buildings_pbf(path):
+    """
+    Same output as load_osm_buildings, read from .osm.pbf via pyosmium, which
+    streams the file and keeps its own compact node-location index.
+    """
+    if osmium is None:
+        raise RuntimeError("[OSM] Reading .osm.pbf requires pyosmium: pip install osmium")
 
+    print("[OSM] Parsing buildings from OSM PBF...")
 
+    class BuildingHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.buildings = []
 
-# ----------------------------------------
-# MATCH BUILDING TO PARCEL
-# ----------------------------------------
-def match_parcel_to_building(building, parcels):
-    bx, by = building["footprint"][0]
-
-    for p in parcels:
-        geom = p["geometry"]
-
-        if geom["type"] == "MultiPolygon":
-            polygons = geom["coordinates"][0]  # outer shell
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if "building" not in tags:
+                return
+            coords = [(n.lon, n.lat) for n in w.nodes if n.location.valid()]
+            if len(coords) < 3:
+                return
+            self.buildings.append({
+                "osm_id": str(w.id),
+                "footprint": coords,
+                "height": parse_height(tags)
+            })
 
-            for poly in polygons:
-                poly2d = [(pt[0], pt[1]) for pt in poly]
+    handler = BuildingHandler()
+    handler.apply_file(path, locations=True)
 
-                if bbox_contains(poly2d, (bx, by)):
-                    return p
+    print(f"[OSM] Parsed {len(handler.buildings)} raw buildings")
+    return handler.buildings
 
-        elif geom["type"] == "Polygon":
-            poly = geom["coordinates"][0]
-            poly2d = [(pt[0], pt[1]) for pt in poly]
 
-            if bbox_contains(poly2d, (bx, by)):
-                return p
-
-    return None
+# ----------------------------------------
+# MATCH BUILDINGS TO PARCELS
+# ----------------------------------------
+def footprint_centroid(footprint):
+    """
+    Vertex-average centroid of a footprint ring (closing vertex ignored).
+    """
+    pts = footprint[:-1] if len(footprint) > 1 and footprint[0] == footprint[-1] else footprint
+    return (
+        sum(p[0] for p in pts) / len(pts),
+        sum(p[1] for p in pts) / len(pts),
+    )
+
+
+def match_parcels_to_buildings(buildings, parcels):
+    """
+    Parcel (or None) for every building: the parcel whose outer ring truly
+    contains the footprint centroid, found through the grid-indexed join
+    from preprocess_join.py. Every part of a MultiPolygon parcel is tested.
+    """
+    t0 = time.perf_counter()
+    index = build_parcel_index(parcels)
+    centroids = np.array(
+        [footprint_centroid(b["footprint"]) for b in buildings], dtype=np.float64
+    ).reshape(-1, 2)
+    match = match_parcels(centroids[:, 0], centroids[:, 1], index)
+    print(f"[JOIN] Matched {len(buildings)} buildings in {time.perf_counter() - t0:.3f}s")
+    return [parcels[m] if m >= 0 else None for m in match]
 
 
 
 # ----------------------------------------
 # MAIN PROCESSOR
 # ----------------------------------------
-if __name__ == "__main__":
+def main():
     parcels = load_parcels()
     buildings = load_osm_buildings()
 
@@ -151,9 +286,7 @@ if __name__ == "__main__":
     kept = 0
     dropped = 0
 
-    for b in buildings:
-        match = match_parcel_to_building(b, parcels)
-
+    for b, match in zip(buildings, match_parcels_to_buildings(buildings, parcels)):
         if not match:
             dropped += 1
             continue  # remove buildings with no parcel info
@@ -180,4 +313,10 @@ if __name__ == "__main__":
     with open(OUTPUT_PATH, "w") as f:
         json.dump(output, f)
 
-    print(f"[✓] Buildings saved → {OUTPUT_PATH}")
\ No newline at end of file
+    print(f"[✓] Buildings saved → {OUTPUT_PATH}")
+    print(f"[OSM] Peak RSS: {peak_rss_mb():.1f} MiB")
+    return {"buildings": kept, "dropped": dropped}
+
+
+if __name__ == "__main__":
+    main()
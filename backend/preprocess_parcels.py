@@ -1,6 +1,8 @@
 import os
 import json
 
+from geojson_stream import iter_features, write_json_array
+
 BASE_DIR = os.path.dirname(__file__)
 
 RAW_PARCEL_PATH = os.path.join(
@@ -39,22 +41,16 @@ def load_osm_bbox():
     return bbox
 
 
-def main():
-    if not os.path.exists(RAW_PARCEL_PATH):
-        raise FileNotFoundError(f"[parcels] {RAW_PARCEL_PATH} not found")
-
-    bbox = load_osm_bbox()
-
-    print("[parcels] Loading raw parcels GeoJSON…")
-    with open(RAW_PARCEL_PATH) as f:
-        gj = json.load(f)
-
-    features = gj.get("features", [])
-    print(f"[parcels] Total raw parcels: {len(features)}")
-
-    parcels = []
+def iter_parcels(features, bbox, stats):
+    """
+    Simplified parcels from a stream of raw GeoJSON features, bbox-filtered
+    one feature at a time. stats["raw"] counts the features seen.
+    """
+    kept = 0
 
     for feat in features:
+        stats["raw"] += 1
+
         geom = feat.get("geometry") or {}
         gtype = geom.get("type")
         coords = geom.get("coordinates")
@@ -111,7 +107,7 @@ def main():
         props = feat.get("properties", {})
 
         parcel = {
-            "id": len(parcels),
+            "id": kept,
             "roll_number": props.get("roll_number"),
             "address": props.get("address"),
             "assessed_value": to_float(props.get("assessed_value")),
@@ -133,15 +129,29 @@ def main():
             "polygons": polygons,
         }
 
-        parcels.append(parcel)
+        kept += 1
+        yield parcel
 
-    print(f"[parcels] Kept {len(parcels)} parcels after bbox filtering")
 
+def main():
+    if not os.path.exists(RAW_PARCEL_PATH):
+        raise FileNotFoundError(f"[parcels] {RAW_PARCEL_PATH} not found")
+
+    bbox = load_osm_bbox()
+
+    print("[parcels] Streaming raw parcels GeoJSON…")
     os.makedirs(os.path.join(BASE_DIR, "data"), exist_ok=True)
-    with open(OUT_PARCELS_PATH, "w") as f:
-        json.dump(parcels, f)
+
+    stats = {"raw": 0}
+    kept = write_json_array(
+        OUT_PARCELS_PATH, iter_parcels(iter_features(RAW_PARCEL_PATH), bbox, stats)
+    )
+
+    print(f"[parcels] Total raw parcels: {stats['raw']}")
+    print(f"[parcels] Kept {kept} parcels after bbox filtering")
 
     print(f"[✓] Saved simplified parcels → {OUT_PARCELS_PATH}")
+    return {"raw": stats["raw"], "kept": kept}
 
 
 if __name__ == "__main__":
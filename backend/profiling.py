@@ -0,0 +1,36 @@
+import sys
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size of this process so far, in MiB (None if the
+    platform can't report it). With children=True, the largest peak among
+    the child processes already waited for (e.g. pool workers).
+    ru_maxrss is KiB on Linux, bytes on macOS.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def cpu_seconds():
+    """
+    User + system CPU time of this process and its waited-for children, in
+    seconds (None if the platform can't report it).
+    """
+    if resource is None:
+        return None
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
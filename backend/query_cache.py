@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from building_store import NUMERIC_ATTRS, SPATIAL_ATTR, coerce_number
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after insert.
+    A ttl of 0 (or less) disables expiry; a maxsize of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Cached value for `key`, or None on a miss / expired entry.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if self.ttl <= 0 or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# -------------------------------------
+# KEY NORMALIZATION
+# -------------------------------------
+def normalize_query_text(text):
+    """
+    Key for the parse cache: lowercased, whitespace-collapsed query text.
+    """
+    return " ".join(text.lower().split())
+
+
+def _canonical_value(attr, value):
+    if attr in NUMERIC_ATTRS:
+        return coerce_number(value)
+    return None if value is None else str(value).lower()
+
+
+def _canonical_single(f):
+    attr = f.get("attribute")
+    op = (f.get("operator") or "").lower()
+    if op == "==":
+        op = "="
+    value = f.get("value")
+
+    if op in ["max", "min"]:
+        value = None
+    elif op == "top_k":
+        value = [coerce_number(value), str(f.get("order", "desc")).lower() == "asc"]
+    elif attr == SPATIAL_ATTR:
+        pass  # JSON operand, keys sorted when the key is serialized
+    elif op == "in" and isinstance(value, (list, tuple)):
+        value = sorted({json.dumps(_canonical_value(attr, v)) for v in value})
+    elif op == "between" and isinstance(value, (list, tuple)):
+        value = [_canonical_value(attr, v) for v in value]
+    else:
+        value = _canonical_value(attr, value)
+
+    return {"attribute": attr, "operator": op, "value": value}
+
+
+def _canonical(node):
+    """
+    Canonical form of a (possibly nested) filter. AND/OR children are sorted,
+    except rankings (max/min/top_k/nearest_k) inside an AND, which keep their
+    order after the other children since each one narrows the rows for the
+    next.
+    """
+    children = node.get("and", node.get("filters"))
+    if children is not None:
+        children = [_canonical(c) for c in children]
+        ranked = [c for c in children if c.get("operator") in ["max", "min", "top_k", "nearest_k"]]
+        normal = [c for c in children if c.get("operator") not in ["max", "min", "top_k", "nearest_k"]]
+        normal.sort(key=lambda c: json.dumps(c, sort_keys=True))
+        return {"filters": normal + ranked}
+    if "or" in node:
+        children = [_canonical(c) for c in node["or"]]
+        return {"or": sorted(children, key=lambda c: json.dumps(c, sort_keys=True))}
+    if "not" in node:
+        return {"not": _canonical(node["not"])}
+    return _canonical_single(node)
+
+
+def predicate_key(f):
+    """
+    Key of one {attribute, operator, value} predicate: predicates that select
+    the same rows share it (same normalization as canonical_filter_key).
+    """
+    return json.dumps(_canonical_single(f), sort_keys=True)
+
+
+def canonical_filter_key(filt):
+    """
+    Key for the result cache. Filters that select the same buildings map to
+    the same key: operators/strings are lowered, numeric values coerced, and
+    the children of AND ("filters"/"and") and OR sorted. Rankings keep their
+    order, since each one narrows the candidates for the next.
+    """
+    return json.dumps(_canonical(filt), sort_keys=True)
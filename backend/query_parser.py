@@ -0,0 +1,442 @@
+import re
+import threading
+from collections import namedtuple
+
+# Below this confidence a local parse is handed to the LLM (when configured)
+MIN_CONFIDENCE = 0.8
+
+ParseResult = namedtuple("ParseResult", ["filter", "confidence"])
+
+# -------------------------------------
+# VOCABULARY
+# -------------------------------------
+# Words that carry no filter meaning ("show me all buildings in ...")
+FILLER = {
+    "a", "all", "an", "and", "any", "are", "be", "building", "buildings", "by",
+    "can", "calgary", "display", "do", "every", "find", "for", "from", "get",
+    "give", "has", "have", "highlight", "i", "in", "is", "it", "its", "list",
+    "me", "of", "on", "one", "ones", "please", "properties", "property", "see",
+    "show", "some", "structure", "structures", "than", "that", "the", "their",
+    "there", "to", "tower", "towers", "want", "what", "where", "which", "who",
+    "whose", "with", "within", "you", "located", "area", "city", "zone",
+}
+
+# Words the compiler cannot express (negation, disjunction)
+UNSUPPORTED = {"not", "no", "except", "excluding", "without", "or", "nor", "neither", "but"}
+
+ATTRIBUTE_WORDS = {
+    "height": ("tall", "taller", "height", "heights", "high", "higher", "short", "shorter"),
+    "assessed_value": (
+        "value", "valued", "values", "worth", "expensive", "cost", "costs", "costing",
+        "price", "priced", "assessed", "assessment", "cheap", "cheaper", "pricier",
+    ),
+    "land_size_sm": ("lot", "lots", "land", "parcel", "parcels", "acreage", "size"),
+}
+KEYWORD_ATTR = {w: attr for attr, words in ATTRIBUTE_WORDS.items() for w in words}
+
+SUPERLATIVES = [
+    (r"most expensive|priciest|most valuable|highest (?:assessed )?value|highest assessment",
+     "assessed_value", "max"),
+    (r"cheapest|least expensive|least valuable|lowest (?:assessed )?value|lowest assessment",
+     "assessed_value", "min"),
+    (r"(?:largest|biggest) (?:lot|lots|parcel|land|lot size)", "land_size_sm", "max"),
+    (r"(?:smallest|tiniest) (?:lot|lots|parcel|land|lot size)", "land_size_sm", "min"),
+    (r"tallest|highest building", "height", "max"),
+    (r"shortest|lowest building", "height", "min"),
+]
+
+# Comparator phrases -> (operator, attribute they imply or None), longest first
+COMPARATORS = [
+    (r"no less than|not less than|at least|minimum of|a minimum of|>=", ">=", None),
+    (r"no more than|not more than|at most|up to|maximum of|a maximum of|<=", "<=", None),
+    (r"(?:taller|higher) than", ">", "height"),
+    (r"shorter than", "<", "height"),
+    (r"(?:pricier|more expensive|worth more|valued (?:at )?more) than", ">", "assessed_value"),
+    (r"(?:cheaper|less expensive|worth less|valued (?:at )?less) than", "<", "assessed_value"),
+    (r"(?:bigger|larger|greater|more) than|over|above|exceeding|>", ">", None),
+    (r"(?:smaller|less|fewer|lower) than|under|below|beneath|<", "<", None),
+    (r"exactly|equal to|equals|=", "=", None),
+]
+TRAILING_COMPARATORS = [
+    (r"or more|or higher|or above|or greater|and up|and above|\+", ">="),
+    (r"or less|or lower|or below|or fewer|and under|and below", "<="),
+]
+
+# Units -> (attribute, factor to the stored unit). "m" is decided in context.
+UNITS = [
+    (r"square met(?:er|re)s?|sq\.? ?m|sqm|m2|m²", "land_size_sm", 1.0),
+    (r"square (?:feet|foot)|sq\.? ?ft|sqft|ft2|ft²", "land_size_sm", 0.09290304),
+    (r"acres?|ac", "land_size_sm", 4046.8564224),
+    (r"hectares?|ha", "land_size_sm", 10000.0),
+    (r"met(?:er|re)s?", "height", 1.0),
+    (r"feet|foot|ft", "height", 0.3048),
+    (r"billion|bn", "assessed_value", 1e9),
+    (r"million|mil|mm", "assessed_value", 1e6),
+    (r"thousand|k", "assessed_value", 1e3),
+    (r"dollars?|cad|bucks", "assessed_value", 1.0),
+    (r"m", None, None),
+]
+
+NUMBER = (
+    r"(?P<cur>\$)?\s*(?P<num>\d[\d,]*(?:\.\d+)?|\.\d+)\s*"
+    r"(?P<unit>" + "|".join(u for u, _, _ in UNITS) + r")?(?![a-z0-9²])"
+)
+
+STREET_TYPES = {
+    "av": "av", "ave": "av", "avenue": "av", "st": "st", "street": "st",
+    "tr": "tr", "trail": "tr", "rd": "rd", "road": "rd", "dr": "dr", "drive": "dr",
+    "blvd": "blvd", "boulevard": "blvd", "way": "way", "cr": "cr", "crescent": "cr",
+}
+STREET = (
+    r"\b(?:on|along|at)\s+(?P<street>(?:\d+(?:st|nd|rd|th)?|[a-z]+)(?:\s+[a-z]+)?\s+"
+    r"(?:" + "|".join(STREET_TYPES) + r"))\b(?:\s+(?P<quad>ne|nw|se|sw)\b)?"
+)
+
+# Spatial phrases around a street address ("within 300 m of 800 3rd st se",
+# "5 nearest to 800 3 st se", "near 201 10 ave se")
+ADDRESS = (
+    r"(?P<number>\d+[a-z]?)\s+(?P<street>(?:\d+(?:st|nd|rd|th)?|[a-z]+)(?:\s+[a-z]+)?\s+"
+    r"(?:" + "|".join(STREET_TYPES) + r"))\b(?:\s+(?P<quad>ne|nw|se|sw)\b)?"
+)
+DISTANCE_UNITS = [
+    (r"m|met(?:er|re)s?", 1.0),
+    (r"km|kilomet(?:er|re)s?", 1000.0),
+    (r"ft|feet|foot", 0.3048),
+    (r"blocks?", 100.0),
+]
+RADIUS = (
+    r"\bwithin\s+(?P<dist>\d+(?:\.\d+)?)\s*(?P<unit>" + "|".join(u for u, _ in DISTANCE_UNITS) + r")"
+    r"\s+(?:of|from|around)\s+" + ADDRESS
+)
+NEAREST = (
+    r"\b(?:(?P<k>\d+)\s+(?:nearest|closest)|(?:nearest|closest)\s+(?P<k2>\d+))"
+    r"(?:\s+(?:buildings?|properties|ones))?\s+(?:to|from)\s+" + ADDRESS
+)
+NEAR = r"\b(?:near|nearby|close to|around)\s+" + ADDRESS
+# Radius for a bare "near <address>"
+NEAR_RADIUS = 250
+
+# Confidence of a clause, by how its attribute was decided
+CONF_EXPLICIT = 1.0
+CONF_IMPLIED = 0.95
+CONF_PARTIAL_NAME = 0.9
+CONF_UNKNOWN_CODE = 0.85
+CONF_GUESSED = 0.5
+
+
+def _number(text):
+    value = float(text.replace(",", ""))
+    return int(value) if value.is_integer() else value
+
+
+def _round(value):
+    value = round(value, 2)
+    return int(value) if float(value).is_integer() else value
+
+
+def _street(m):
+    # "3rd street se" -> "3 st se", the spelling of the dataset's addresses
+    words = m["street"].split()
+    words[0] = re.sub(r"^(\d+)(?:st|nd|rd|th)$", r"\1", words[0])
+    words[-1] = STREET_TYPES[words[-1]]
+    return " ".join(words + ([m["quad"]] if m["quad"] else []))
+
+
+def _phrase(words):
+    # Whole-phrase match that treats "-" and "/" as part of a token (zoning codes)
+    return r"(?<![\w/-])(?:" + words + r")(?![\w/-])"
+
+
+class QueryCompiler:
+    """
+    Rule-based natural-language -> filter JSON compiler, tried before the
+    LLM. Recognizes the attributes, comparatives, units ($, k/million, m,
+    ft, sqm, sqft, acres, ha), superlatives, streets, distances around an
+    address and the community / land-use / property-type values of one
+    dataset snapshot.
+
+    compile() returns a ParseResult whose confidence is the weakest clause's
+    confidence scaled by the share of meaningful words the rules consumed,
+    so a query with words it doesn't understand falls through to the LLM.
+    """
+
+    def __init__(self, store):
+        categories = store.categories
+        # Longest names first, so "downtown east village" beats "downtown"
+        self.communities = sorted(
+            (str(c) for c in categories.get("community", ()) if c), key=len, reverse=True
+        )
+        self.land_uses = sorted(
+            (str(c) for c in categories.get("land_use_designation", ()) if c), key=len, reverse=True
+        )
+        self.property_types = {str(c) for c in categories.get("property_type", ()) if c}
+        self.addresses = [str(c) for c in categories.get("address", ()) if c]
+        self._community_words = {w for c in self.communities for w in c.split()}
+
+    def compile(self, text):
+        text = " ".join(text.lower().replace("?", " ").replace("!", " ").split()).strip(" .")
+        taken = [False] * len(text)
+        clauses = []  # (filter, confidence)
+
+        def take(m, group=0):
+            for i in range(*m.span(group)):
+                taken[i] = True
+
+        def free(m):
+            return not any(taken[m.start():m.end()])
+
+        # Superlatives
+        for pattern, attr, op in SUPERLATIVES:
+            for m in re.finditer(_phrase(pattern), text):
+                if free(m):
+                    take(m)
+                    clauses.append(({"attribute": attr, "operator": op, "value": 0}, CONF_EXPLICIT))
+
+        # Distances around an address, before its numbers look like comparisons
+        self._spatial(text, take, free, clauses)
+
+        # Categorical values from the dataset
+        self._categorical(text, take, free, clauses)
+
+        # Numeric comparisons: "between A and B", "over A", "A or more"
+        for m in re.finditer(r"\bbetween\s+(?P<a>" + NUMBER.replace("?P<", "?P<a_") + r")\s+and\s+"
+                             r"(?P<b>" + NUMBER.replace("?P<", "?P<b_") + r")", text):
+            if not free(m):
+                continue
+            take(m)
+            lo, lo_attr, lo_conf, lo_factor = self._quantity(text, m, "a_")
+            hi, hi_attr, hi_conf, hi_factor = self._quantity(text, m, "b_")
+            # A unit on one side applies to both ("between 10 and 20m")
+            if lo_attr is None:
+                lo_attr, lo_conf, lo_factor = hi_attr, hi_conf, hi_factor
+            if hi_attr is None:
+                hi_attr, hi_conf, hi_factor = lo_attr, lo_conf, lo_factor
+            attr, conf = lo_attr, min(lo_conf, hi_conf)
+            if attr is None or attr != hi_attr:
+                attr, conf = self._guess_attribute(text, m.start(), lo)
+            clauses.append(({"attribute": attr, "operator": ">=", "value": _round(lo * lo_factor)}, conf))
+            clauses.append(({"attribute": attr, "operator": "<=", "value": _round(hi * hi_factor)}, conf))
+
+        for pattern, op, implied in COMPARATORS:
+            for m in re.finditer(_phrase(pattern) + r"\s*(?P<q>" + NUMBER + r")", text):
+                if free(m):
+                    take(m)
+                    clauses.append(self._comparison(text, m, op, implied))
+
+        for pattern, op in TRAILING_COMPARATORS:
+            for m in re.finditer(r"(?<![\w.])(?P<q>" + NUMBER + r")\s*(?:" + pattern + r")(?![a-z])", text):
+                if free(m):
+                    take(m)
+                    clauses.append(self._comparison(text, m, op, None))
+
+        if not clauses:
+            return ParseResult(None, 0.0)
+
+        # Attribute keywords are understood words too ("buildings with high value")
+        for m in re.finditer(r"[a-z]+", text):
+            if m.group() in KEYWORD_ATTR:
+                take(m)
+
+        covered = unknown = 0
+        leftover_place = False
+        for m in re.finditer(r"[a-z0-9$]+", text):
+            word = m.group()
+            if taken[m.start()]:
+                covered += 1
+            elif word in UNSUPPORTED:
+                return ParseResult(None, 0.0)
+            elif word not in FILLER:
+                unknown += 1
+                leftover_place = leftover_place or word in self._community_words
+
+        confidence = min(c for _, c in clauses) * covered / (covered + unknown)
+        if leftover_place:
+            # Part of some community name went unused ("commercial buildings
+            # in east village"): it may be a place or may mean something
+            # else, so leave it to the LLM
+            confidence = min(confidence, CONF_GUESSED)
+        filters = [f for f, _ in clauses]
+        # Rankings last: they narrow whatever the other filters matched
+        filters.sort(key=lambda f: f["operator"] in ("max", "min", "nearest_k"))
+        filt = filters[0] if len(filters) == 1 else {"filters": filters}
+        return ParseResult(filt, round(confidence, 3))
+
+    # -------------------------------------
+    # CLAUSES
+    # -------------------------------------
+    def _categorical(self, text, take, free, clauses):
+        # Full community / land-use names, then codes after "zoned"/"land use"
+        for name in self.communities:
+            for m in re.finditer(_phrase(re.escape(name)), text):
+                if free(m):
+                    take(m)
+                    clauses.append(({"attribute": "community", "operator": "=", "value": name}, CONF_EXPLICIT))
+        for code in self.land_uses:
+            for m in re.finditer(_phrase(re.escape(code)), text):
+                if free(m):
+                    take(m)
+                    clauses.append(({"attribute": "land_use_designation", "operator": "=", "value": code},
+                                    CONF_EXPLICIT))
+        for m in re.finditer(r"\b(?:zoned(?: as)?|zoning|land use(?: designation)?|designation)\s+"
+                             r"(?P<code>[a-z]+\d*(?:-[a-z0-9/]+)+|dc)(?![\w/-])", text):
+            if free(m):
+                take(m)
+                clauses.append(({"attribute": "land_use_designation", "operator": "=", "value": m["code"]},
+                                CONF_UNKNOWN_CODE))
+            else:
+                take(m)  # "zoned cc-x": the code itself was already matched above
+        for m in re.finditer(r"\bproperty type\s+(?P<code>[a-z0-9]+)\b", text):
+            if free(m):
+                take(m)
+                conf = CONF_EXPLICIT if m["code"] in self.property_types else CONF_UNKNOWN_CODE
+                clauses.append(({"attribute": "property_type", "operator": "=", "value": m["code"]}, conf))
+
+        # Streets ("on 10th ave se", "along macleod trail")
+        for m in re.finditer(STREET, text):
+            if free(m):
+                take(m)
+                clauses.append(({"attribute": "address", "operator": "contains", "value": _street(m)},
+                                CONF_EXPLICIT))
+
+        # Part of a community name ("in east village"): longest unclaimed word
+        # run, unless a full community name was already found. Only one
+        # community filter per query: clauses are ANDed, and two community
+        # tests can't both hold
+        if any(f.get("attribute") == "community" for f, _ in clauses):
+            return
+        words = [m for m in re.finditer(r"[a-z]+", text)
+                 if m.group() in self._community_words and m.group() not in FILLER]
+        runs, run = [], []
+        for m in words:
+            if run and text[run[-1].end():m.start()] != " ":
+                runs.append(run)
+                run = []
+            run.append(m)
+        if run:
+            runs.append(run)
+        best = None
+        for run in runs:
+            if not all(free(m) for m in run):
+                continue
+            phrase = " ".join(m.group() for m in run)
+            if len(phrase) >= 4 and any(f" {phrase} " in f" {c} " for c in self.communities):
+                if best is None or len(phrase) > len(best[1]):
+                    best = run, phrase
+        if best is not None:
+            run, phrase = best
+            for m in run:
+                take(m)
+            clauses.append(({"attribute": "community", "operator": "contains", "value": phrase},
+                            CONF_PARTIAL_NAME))
+
+    def _spatial(self, text, take, free, clauses):
+        for pattern in (RADIUS, NEAREST, NEAR):
+            for m in re.finditer(pattern, text):
+                if not free(m):
+                    continue
+                take(m)
+                address = f"{m['number']} {_street(m)}"
+                if address in self.addresses:
+                    conf = CONF_EXPLICIT
+                elif any(address in a for a in self.addresses):
+                    conf = CONF_PARTIAL_NAME
+                else:
+                    conf = CONF_UNKNOWN_CODE
+                center = {"address": address}
+
+                if pattern is NEAREST:
+                    op, value = "nearest_k", {"center": center, "k": int(m["k"] or m["k2"])}
+                elif pattern is RADIUS:
+                    factor = next(f for u, f in DISTANCE_UNITS if re.fullmatch(u, m["unit"]))
+                    op, value = "within_radius", {"center": center, "radius": _round(float(m["dist"]) * factor)}
+                else:
+                    op, value = "within_radius", {"center": center, "radius": NEAR_RADIUS}
+                    conf = min(conf, CONF_PARTIAL_NAME)
+                clauses.append(({"attribute": "location", "operator": op, "value": value}, conf))
+
+    def _quantity(self, text, m, prefix=""):
+        """
+        (number, attribute or None, confidence, factor) for a NUMBER match.
+        """
+        number = _number(m[prefix + "num"])
+        unit = m[prefix + "unit"]
+        if m[prefix + "cur"]:
+            if unit is None:
+                return number, "assessed_value", CONF_EXPLICIT, 1.0
+            if unit == "m":
+                return number, "assessed_value", CONF_EXPLICIT, 1e6
+        if unit is None:
+            return number, None, CONF_GUESSED, 1.0
+        for pattern, attr, factor in UNITS:
+            if re.fullmatch(pattern, unit):
+                if attr is None:
+                    # Bare "m": metres, unless the query is about money ("worth 2m")
+                    attr, _ = self._keyword_attribute(text, m.start())
+                    if attr == "assessed_value":
+                        return number, attr, CONF_EXPLICIT, 1e6
+                    return number, "height", CONF_EXPLICIT, 1.0
+                return number, attr, CONF_EXPLICIT, factor
+        return number, None, CONF_GUESSED, 1.0
+
+    def _comparison(self, text, m, op, implied):
+        number, attr, conf, factor = self._quantity(text, m)
+        if attr is None:
+            if implied:
+                attr, conf = implied, CONF_IMPLIED
+            else:
+                attr, conf = self._guess_attribute(text, m.start(), number)
+        return {"attribute": attr, "operator": op, "value": _round(number * factor)}, conf
+
+    def _keyword_attribute(self, text, pos):
+        """
+        Attribute named by the nearest keyword before `pos`, else the only
+        attribute named anywhere in the query; None if ambiguous or absent.
+        """
+        found = [(m.start(), KEYWORD_ATTR[m.group()]) for m in re.finditer(r"[a-z]+", text)
+                 if m.group() in KEYWORD_ATTR]
+        before = [attr for start, attr in found if start < pos]
+        if before:
+            return before[-1], CONF_IMPLIED
+        named = {attr for _, attr in found}
+        if len(named) == 1:
+            return named.pop(), CONF_IMPLIED
+        return None, CONF_GUESSED
+
+    def _guess_attribute(self, text, pos, number):
+        attr, conf = self._keyword_attribute(text, pos)
+        if attr is not None:
+            return attr, conf
+        # No unit, no keyword: big numbers are money, small ones heights
+        return ("assessed_value" if number >= 10000 else "height"), CONF_GUESSED
+
+
+# -------------------------------------
+# STATS
+# -------------------------------------
+class ParseStats:
+    """
+    Where /api/query parses came from: parse cache, the local compiler, the
+    LLM, or the fallback parser (LLM unavailable, failed or too slow).
+    """
+
+    SOURCES = ("cache", "local", "llm", "fallback")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.SOURCES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, source):
+        with self._lock:
+            self.counts[source] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        parsed = counts["local"] + counts["llm"] + counts["fallback"]
+        total = parsed + counts["cache"]
+        return {
+            **counts,
+            # Of the queries that needed parsing, share that skipped the LLM
+            "local_fraction": round(counts["local"] / parsed, 4) if parsed else 0.0,
+            "llm_fraction": round(counts["llm"] / total, 4) if total else 0.0,
+        }
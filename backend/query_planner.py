@@ -0,0 +1,274 @@
+import numpy as np
+
+from building_store import SPATIAL_ATTR, SPATIAL_OPS, as_bounds, as_list, as_spatial, coerce_number
+from query_cache import predicate_key
+
+# Filter JSON grammar:
+#   node := {"and": [node, ...]} | {"or": [node, ...]} | {"not": node}
+#         | {"filters": [node, ...]}            (AND, the original compound form)
+#         | {"attribute", "operator", "value"}  (leaf)
+# Leaf operators: > >= < <= = contains, in [v, ...], between [lo, hi], and the
+# ranking operators max / min / top_k (value k, "order": "desc" | "asc").
+# Spatial leaves use attribute "location": within_radius, within_polygon and
+# the ranking nearest_k (operands in building_store.as_spatial).
+BOOLEAN_KEYS = ("and", "or", "not", "filters")
+RANKING_OPS = ("max", "min", "top_k", "nearest_k")
+SPATIAL_USAGE = {
+    "within_radius": '{"center": point, "radius": metres}',
+    "within_polygon": "a list of at least 3 points",
+    "nearest_k": '{"center": point, "k": n}',
+}
+
+# A predicate expected to match more than this share of its input is
+# evaluated by scanning the column rather than through an index
+SCAN_FRACTION = 0.3
+# Probe the candidate rows directly unless the index result is expected to be
+# this many times smaller than the candidate set
+PROBE_RATIO = 8
+
+
+class FilterError(ValueError):
+    """
+    Filter JSON that doesn't fit the grammar above.
+    """
+
+
+def validate_filter(node, depth=0):
+    """
+    Raise FilterError if `node` isn't valid filter JSON. Unknown attributes
+    and operators are allowed (they match nothing), malformed structure isn't.
+    """
+    if depth > 32:
+        raise FilterError("Filter nested too deeply")
+    if not isinstance(node, dict):
+        raise FilterError("Each filter must be an object")
+    for key in ("and", "or", "filters"):
+        if key in node:
+            children = node[key]
+            if not isinstance(children, list):
+                raise FilterError(f'"{key}" must be a list of filters')
+            for child in children:
+                validate_filter(child, depth + 1)
+            return
+    if "not" in node:
+        validate_filter(node["not"], depth + 1)
+        return
+
+    if "attribute" not in node or "operator" not in node:
+        raise FilterError("A filter needs attribute and operator (or and/or/not)")
+    op = str(node["operator"]).lower()
+    value = node.get("value")
+    if op == "between" and as_bounds(value) is None:
+        raise FilterError('"between" takes a [low, high] pair of numbers')
+    if op == "in" and not isinstance(value, list):
+        raise FilterError('"in" takes a list of values')
+    if op == "top_k":
+        k = coerce_number(value)
+        if not isinstance(k, float) or k < 1 or not k.is_integer():
+            raise FilterError('"top_k" takes a positive integer value')
+    if (op in SPATIAL_OPS) != (node["attribute"] == SPATIAL_ATTR):
+        raise FilterError(f'Attribute "{SPATIAL_ATTR}" takes the spatial operators '
+                          f'({", ".join(SPATIAL_OPS)}), and only it does')
+    if op in SPATIAL_OPS and as_spatial(op, value) is None:
+        raise FilterError(f'"{op}" takes {SPATIAL_USAGE[op]}; a point is [x, y] in metres, '
+                          '{"lon", "lat"}, {"building": id} or {"address": text}')
+
+
+def is_ranking(node):
+    return "attribute" in node and str(node.get("operator", "")).lower() in RANKING_OPS
+
+
+class QueryPlanner:
+    """
+    Evaluates filter JSON against one BuildingStore.
+
+    Every node is first given a row estimate from column statistics gathered
+    once per dataset (the sorted numeric indexes, per-value row counts of
+    the string columns, and the centroid grid for spatial leaves), then
+    evaluated with the candidates its parent has already narrowed to:
+      - AND evaluates its children most selective first, so each one only
+        sees the rows that survived the previous ones; rankings (max/min/
+        top_k/nearest_k) apply last, in the order given.
+      - OR unions its children; NOT removes its child's rows from the input.
+      - Each leaf picks an access path: "index" (inverted / sorted index
+        lookup) for selective predicates, "scan" (vectorized test over the
+        whole column) for broad ones, and "probe" (test only the candidate
+        rows) once the candidates are fewer than the index would return.
+    Results are sorted row arrays.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = len(store)
+        # Rows per distinct value of each string column (CSR posting lengths)
+        self.value_counts = {
+            attr: np.diff(postings.start) for attr, postings in store.value_index.items()
+        }
+
+    # -------------------------------------
+    # ESTIMATES
+    # -------------------------------------
+    def estimate_leaf(self, node):
+        """
+        Rows expected to match a leaf over the whole dataset. Exact for
+        numeric ranges (binary search over the sorted values) and string
+        matches (sum of posting lengths of the matching values); spatial
+        regions scale the centroid count of their bounding window.
+        """
+        store = self.store
+        attr = node.get("attribute")
+        op = str(node.get("operator", "")).lower()
+        value = node.get("value")
+
+        if op in ("max", "min"):
+            return 1
+        if op == "top_k":
+            return int(coerce_number(value))
+        if attr == SPATIAL_ATTR:
+            return store.spatial_estimate(op, value)
+        if attr in store.numeric:
+            values = store.sorted_values[attr]
+            if op == "between":
+                lo, hi = as_bounds(value) or (1.0, 0.0)
+                return max(int(np.searchsorted(values, hi, "right") - np.searchsorted(values, lo, "left")), 0)
+            if op == "in":
+                return sum(self.estimate_leaf({**node, "operator": "=", "value": v}) for v in as_list(value))
+            v = coerce_number(value)
+            if not isinstance(v, float):
+                return 0
+            below = int(np.searchsorted(values, v, "left"))
+            upto = int(np.searchsorted(values, v, "right"))
+            return {">": len(values) - upto, ">=": len(values) - below, "<": below, "<=": upto,
+                    "=": upto - below, "==": upto - below}.get(op, 0)
+        if attr in store.strings:
+            return int(self.value_counts[attr][store.matching_codes(attr, op, value)].sum())
+        return 0
+
+    def estimate(self, node, base=None):
+        """
+        Rows expected to match `node` among `base` rows (default: all),
+        assuming predicates are independent.
+        """
+        base = self.size if base is None else base
+        if not self.size:
+            return 0
+        if "not" in node:
+            return base - self.estimate(node["not"], base)
+        children = node.get("and", node.get("filters"))
+        if children is not None:
+            fraction = 1.0
+            for child in children:
+                fraction *= self.estimate(child) / self.size
+            return base * fraction
+        if "or" in node:
+            miss = 1.0
+            for child in node["or"]:
+                miss *= 1.0 - self.estimate(child) / self.size
+            return base * (1.0 - miss)
+        return base * self.estimate_leaf(node) / self.size
+
+    # -------------------------------------
+    # EXECUTION
+    # -------------------------------------
+    def execute(self, node, memo=None, trace=None):
+        """
+        Sorted rows matching a filter. `memo` shares index/scan results of
+        identical predicates across calls (see /api/query/batch); `trace`, if
+        a list, receives one entry per evaluated leaf (for ?explain).
+        """
+        return self._eval(node, None, memo, trace)
+
+    def _eval(self, node, candidates, memo, trace):
+        children = node.get("and", node.get("filters"))
+        if children is not None:
+            return self._and(children, candidates, memo, trace)
+        if "or" in node:
+            return self._or(node["or"], candidates, memo, trace)
+        if "not" in node:
+            inner = self._eval(node["not"], candidates, memo, trace)
+            if candidates is None:
+                keep = np.ones(self.size, dtype=bool)
+                keep[inner] = False
+                return np.flatnonzero(keep)
+            return candidates[~np.isin(candidates, inner, assume_unique=True)]
+        if is_ranking(node):
+            rows = self.store.all_rows() if candidates is None else candidates
+            return self._rank(node, rows, trace)
+        return self._leaf(node, candidates, memo, trace)
+
+    def _and(self, children, candidates, memo, trace):
+        filters = [c for c in children if not is_ranking(c)]
+        rankings = [c for c in children if is_ranking(c)]
+
+        base = self.size if candidates is None else len(candidates)
+        for child in sorted(filters, key=lambda c: self.estimate(c, base)):
+            candidates = self._eval(child, candidates, memo, trace)
+            if not len(candidates):
+                return candidates
+
+        if candidates is None:
+            candidates = self.store.all_rows()
+        for child in rankings:
+            candidates = self._rank(child, candidates, trace)
+        return candidates
+
+    def _or(self, children, candidates, memo, trace):
+        parts = [self._eval(child, candidates, memo, trace) for child in children]
+        if not parts:
+            return self.store.all_rows()[:0]
+        if sum(len(p) for p in parts) > self.size * SCAN_FRACTION:
+            keep = np.zeros(self.size, dtype=bool)
+            for part in parts:
+                keep[part] = True
+            return np.flatnonzero(keep)
+        return np.unique(np.concatenate(parts))
+
+    def _leaf(self, node, candidates, memo, trace):
+        store = self.store
+        attr, op, value = node.get("attribute"), str(node.get("operator", "")).lower(), node.get("value")
+        estimate = self.estimate_leaf(node)
+
+        if candidates is not None and len(candidates) <= estimate * PROBE_RATIO:
+            method = "probe"
+            rows = store.rows_among(attr, op, value, candidates)
+        else:
+            method = "scan" if estimate > self.size * SCAN_FRACTION else "index"
+            key = predicate_key(node)
+            rows = None if memo is None else memo.get(key)
+            if rows is None:
+                if method == "scan":
+                    rows = store.rows_among(attr, op, value)
+                else:
+                    rows = np.sort(store.rows(attr, op, value))
+                if memo is not None:
+                    memo[key] = rows
+            if candidates is not None:
+                rows = candidates[np.isin(candidates, rows, assume_unique=True)]
+
+        if trace is not None:
+            trace.append({"filter": node, "method": method, "estimate": estimate, "rows": len(rows)})
+        return rows
+
+    def _rank(self, node, rows, trace):
+        store = self.store
+        attr, op = node.get("attribute"), str(node.get("operator", "")).lower()
+        before = len(rows)
+        if op == "nearest_k":
+            # Over every row the store searches its centroid grid instead
+            rows = np.sort(store.nearest(node.get("value"), None if before == self.size else rows))
+        elif op == "top_k":
+            if attr in store.numeric:
+                valued = rows[~np.isnan(store.numeric[attr][rows])]
+                descending = str(node.get("order", "desc")).lower() != "asc"
+                top, _ = store.page(valued, int(coerce_number(node.get("value"))), attr, descending)
+                rows = np.sort(top)
+            else:
+                rows = rows[:0]
+        else:
+            # A max/min with no values among the candidates leaves them as they are
+            winners, best = store.superlative(attr, op, rows)
+            if best is not None:
+                rows = np.sort(winners)
+        if trace is not None:
+            trace.append({"filter": node, "method": "rank", "estimate": before, "rows": len(rows)})
+        return rows
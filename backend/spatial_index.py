@@ -0,0 +1,258 @@
+import numpy as np
+
+# Grid resolution limits: aim for a handful of boxes per cell, but never let
+# the grid itself outgrow the data it indexes
+TARGET_PER_CELL = 4
+MAX_CELLS_PER_AXIS = 2048
+
+
+def footprint_bounds(coords, offsets):
+    """
+    (n, 4) array of [minx, miny, maxx, maxy] per footprint from a flat (m, 2)
+    coordinate array and its (n + 1) offsets. Empty footprints get NaN bounds.
+    """
+    n = len(offsets) - 1
+    bounds = np.full((n, 4), np.nan, dtype=np.float64)
+    starts = offsets[:-1]
+    nonempty = offsets[1:] > starts
+    if not nonempty.any():
+        return bounds
+
+    idx = starts[nonempty]
+    bounds[nonempty, 0] = np.minimum.reduceat(coords[:, 0], idx)
+    bounds[nonempty, 1] = np.minimum.reduceat(coords[:, 1], idx)
+    bounds[nonempty, 2] = np.maximum.reduceat(coords[:, 0], idx)
+    bounds[nonempty, 3] = np.maximum.reduceat(coords[:, 1], idx)
+    return bounds
+
+
+def footprint_centroids(coords, offsets):
+    """
+    (n, 2) vertex-average centroid per footprint (closing vertex ignored, as
+    in preprocess_osm.footprint_centroid). Empty footprints get NaN.
+    """
+    n = len(offsets) - 1
+    centroids = np.full((n, 2), np.nan, dtype=np.float64)
+    starts, ends = offsets[:-1], offsets[1:]
+    nonempty = ends > starts
+    if not nonempty.any():
+        return centroids
+
+    starts, ends = starts[nonempty], ends[nonempty]
+    sums = np.add.reduceat(coords, starts, axis=0)
+    counts = ends - starts
+    closed = (counts > 1) & (coords[starts] == coords[ends - 1]).all(axis=1)
+    sums[closed] -= coords[ends[closed] - 1]
+    counts = counts - closed
+    centroids[nonempty] = sums / counts[:, None]
+    return centroids
+
+
+def polygon_area(ring):
+    """
+    Area of a simple polygon ring ((m, 2) array, open or closed), shoelace formula.
+    """
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
+
+class GridIndex:
+    """
+    Uniform grid over axis-aligned boxes, stored CSR-style: items sorted by
+    cell with a start offset per cell. A box is registered in every cell it
+    overlaps; queries gather the cells under the window, dedupe, and finish
+    with an exact vectorized box-overlap test.
+    """
+
+    def __init__(self, bounds, cell_size=None):
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        valid = ~np.isnan(self.bounds).any(axis=1)
+        items = np.flatnonzero(valid)
+
+        if len(items):
+            b = self.bounds[items]
+            self.extent = (
+                float(b[:, 0].min()), float(b[:, 1].min()),
+                float(b[:, 2].max()), float(b[:, 3].max()),
+            )
+        else:
+            self.extent = (0.0, 0.0, 0.0, 0.0)
+
+        minx, miny, maxx, maxy = self.extent
+        width = max(maxx - minx, 1e-9)
+        height = max(maxy - miny, 1e-9)
+        if cell_size is None:
+            cell_size = np.sqrt(width * height * TARGET_PER_CELL / max(len(items), 1))
+        self.nx = int(min(max(np.ceil(width / cell_size), 1), MAX_CELLS_PER_AXIS))
+        self.ny = int(min(max(np.ceil(height / cell_size), 1), MAX_CELLS_PER_AXIS))
+        self.cell_w = width / self.nx
+        self.cell_h = height / self.ny
+
+        if not len(items):
+            self.cell_start = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+            self.cell_items = items
+            return
+
+        b = self.bounds[items]
+        ix0, iy0 = self._cell(b[:, 0], b[:, 1])
+        ix1, iy1 = self._cell(b[:, 2], b[:, 3])
+
+        # Expand every box into one (cell, item) pair per overlapped cell
+        span_x = ix1 - ix0 + 1
+        counts = span_x * (iy1 - iy0 + 1)
+        owner = np.repeat(np.arange(len(items)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (iy0[owner] + local // span_x[owner]) * self.nx + (ix0[owner] + local % span_x[owner])
+
+        order = np.argsort(cells, kind="stable")
+        self.cell_items = items[owner[order]]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.nx * self.ny + 1))
+
+    def __len__(self):
+        return int((~np.isnan(self.bounds).any(axis=1)).sum())
+
+    def _cell(self, x, y):
+        # Clip before the int cast: far-off / infinite coordinates would
+        # otherwise overflow int64 and wrap to cell 0
+        minx, miny, _, _ = self.extent
+        ix = np.clip((x - minx) / self.cell_w, 0, self.nx - 1).astype(np.int64)
+        iy = np.clip((y - miny) / self.cell_h, 0, self.ny - 1).astype(np.int64)
+        return ix, iy
+
+    def candidates(self, minx, miny, maxx, maxy):
+        """
+        Items registered in the grid cells under the window (may over-report).
+        An inverted (or NaN) window holds nothing.
+        """
+        if not (minx <= maxx and miny <= maxy):
+            return self.cell_items[:0]
+        eminx, eminy, emaxx, emaxy = self.extent
+        if maxx < eminx or minx > emaxx or maxy < eminy or miny > emaxy:
+            return self.cell_items[:0]
+
+        ix0, iy0 = self._cell(np.array([minx]), np.array([miny]))
+        ix1, iy1 = self._cell(np.array([maxx]), np.array([maxy]))
+        ix0, iy0, ix1, iy1 = int(ix0[0]), int(iy0[0]), int(ix1[0]), int(iy1[0])
+
+        # Cells of one grid row are contiguous in CSR order: one slice per row
+        chunks = [
+            self.cell_items[self.cell_start[row + ix0]:self.cell_start[row + ix1 + 1]]
+            for row in range(iy0 * self.nx, (iy1 + 1) * self.nx, self.nx)
+        ]
+        return np.unique(np.concatenate(chunks))
+
+    def query(self, minx, miny, maxx, maxy):
+        """
+        Sorted indices of every box intersecting the window.
+        """
+        items = self.candidates(minx, miny, maxx, maxy)
+        b = self.bounds[items]
+        hit = (b[:, 2] >= minx) & (b[:, 0] <= maxx) & (b[:, 3] >= miny) & (b[:, 1] <= maxy)
+        return items[hit]
+
+    def point_candidates(self, xs, ys):
+        """
+        Vectorized point lookup for many points at once: (point, item) index
+        pairs for every box whose bounds contain the point.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(self.cell_items) or not len(xs):
+            return empty, empty
+
+        finite = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+        ix, iy = self._cell(xs[finite], ys[finite])
+        cells = iy * self.nx + ix
+        starts = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - starts
+
+        points = np.repeat(finite, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        items = self.cell_items[np.repeat(starts, counts) + local]
+
+        b = self.bounds[items]
+        px, py = xs[points], ys[points]
+        hit = (b[:, 0] <= px) & (px <= b[:, 2]) & (b[:, 1] <= py) & (py <= b[:, 3])
+        return points[hit], items[hit]
+
+
+# -------------------------------------
+# POINT IN POLYGON
+# -------------------------------------
+class RingSet:
+    """
+    Many polygon rings packed into flat edge arrays, for batched
+    point-in-ring tests over (point, ring) pairs.
+    """
+
+    def __init__(self, rings):
+        lengths = np.array([len(r) for r in rings], dtype=np.int64)
+        self.offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+
+        coords = np.array(
+            [pt[:2] for r in rings for pt in r], dtype=np.float64
+        ).reshape(-1, 2)
+
+        # Edge i of a ring runs from vertex i to vertex i + 1, wrapping around
+        nxt = np.arange(len(coords)) + 1
+        ends = self.offsets[1:][lengths > 0]
+        starts = self.offsets[:-1][lengths > 0]
+        nxt[ends - 1] = starts
+        self.x1, self.y1 = coords[:, 0], coords[:, 1]
+        self.x2, self.y2 = coords[nxt, 0], coords[nxt, 1]
+        self.valid = lengths >= 3
+
+    def contains(self, xs, ys, rings, chunk=1_000_000):
+        """
+        Ray-casting test for point i against ring rings[i], vectorized over
+        all pairs (processed in chunks of roughly `chunk` edge tests).
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        rings = np.asarray(rings, dtype=np.int64)
+        inside = np.zeros(len(rings), dtype=bool)
+
+        pairs = np.flatnonzero(self.valid[rings])
+        if not len(pairs):
+            return inside
+
+        counts = self.offsets[rings[pairs] + 1] - self.offsets[rings[pairs]]
+        total = np.cumsum(counts)
+        cuts = np.searchsorted(total, np.arange(chunk, total[-1], chunk))
+        bounds = np.unique(np.concatenate([[0], cuts, [len(pairs)]]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            self._contains_batch(xs, ys, rings, pairs[lo:hi], counts[lo:hi], inside)
+        return inside
+
+    def _contains_batch(self, xs, ys, rings, pairs, counts, inside):
+        owner = np.repeat(np.arange(len(pairs)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = self.offsets[rings[pairs]][owner] + local
+
+        x = xs[pairs][owner]
+        y = ys[pairs][owner]
+        x1, y1, x2, y2 = self.x1[edges], self.y1[edges], self.x2[edges], self.y2[edges]
+
+        # Does the horizontal ray from the point cross this edge? (1e-12 guards
+        # horizontal edges, which can't satisfy the first clause anyway)
+        crossing = ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1)
+        crossings = np.add.reduceat(crossing.astype(np.int64), np.cumsum(counts) - counts)
+        inside[pairs] = crossings % 2 == 1
+
+
+# -------------------------------------
+# QUADTREE TILES
+# -------------------------------------
+def tile_bounds(extent, z, x, y):
+    """
+    Window covered by quadtree tile z/x/y. Tile 0/0/0 is the square around the
+    dataset extent; each zoom level splits every tile into four. x grows with
+    the footprint x axis and y with the footprint y axis.
+    """
+    minx, miny, maxx, maxy = extent
+    side = max(maxx - minx, maxy - miny) / (2 ** z)
+    tminx = minx + x * side
+    tminy = miny + y * side
+    return tminx, tminy, tminx + side, tminy + side
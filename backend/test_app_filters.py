@@ -0,0 +1,22 @@
+import pytest
+
+import app
+
+
+@pytest.fixture(scope="module")
+def ds():
+    return app.datasets.current
+
+
+def test_superlative_fields_on_compound_node(ds):
+    compound = {"filters": [{"attribute": "height", "operator": ">", "value": 10}]}
+    mixed = {**compound, "attribute": "height", "operator": "max"}
+    expected = ds.planner.execute(compound)
+
+    app.result_cache.clear()
+    mixed_result = app.handle_filter(mixed, ds)
+    plain_result = app.handle_filter(compound, ds)
+
+    assert sorted(mixed_result["rows"]) == sorted(expected)
+    assert sorted(plain_result["rows"]) == sorted(expected)
+    assert "filter" not in plain_result
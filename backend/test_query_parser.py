@@ -0,0 +1,34 @@
+import pytest
+
+from data_loader import load_store
+from query_parser import MIN_CONFIDENCE, QueryCompiler
+
+
+@pytest.fixture(scope="module")
+def compiler():
+    return QueryCompiler(load_store())
+
+
+def community_filters(filt):
+    filters = filt["filters"] if "filters" in filt else [filt]
+    return [f for f in filters if f["attribute"] == "community"]
+
+
+@pytest.mark.parametrize("query", [
+    "commercial buildings in east village",
+    "commercial buildings in beltline",
+])
+def test_leftover_community_words_go_to_llm(compiler, query):
+    result = compiler.compile(query)
+    assert len(community_filters(result.filter)) == 1
+    assert result.confidence < MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("query, value", [
+    ("buildings in east village", "east village"),
+    ("buildings in beltline", "beltline"),
+])
+def test_community_parsed_locally(compiler, query, value):
+    result = compiler.compile(query)
+    assert [f["value"] for f in community_filters(result.filter)] == [value]
+    assert result.confidence >= MIN_CONFIDENCE
@@ -0,0 +1,41 @@
+import pytest
+
+from data_loader import load_store
+from query_planner import FilterError, QueryPlanner, validate_filter
+
+
+@pytest.fixture(scope="module")
+def planner():
+    return QueryPlanner(load_store())
+
+
+def location(op, value):
+    return {"attribute": "location", "operator": op, "value": value}
+
+
+def test_huge_radius_matches_everything(planner):
+    filt = location("within_radius", {"center": [0, 0], "radius": 1e25})
+    validate_filter(filt)
+    assert len(planner.execute(filt)) == len(planner.store)
+
+
+@pytest.mark.parametrize("x", [1e25, -1e25, 1e18])
+@pytest.mark.parametrize("k", [1, 5, 55])
+def test_nearest_to_far_point(planner, x, k):
+    filt = location("nearest_k", {"center": [x, 0], "k": k})
+    validate_filter(filt)
+    assert len(planner.execute(filt)) == k
+
+
+@pytest.mark.parametrize("center", [[float("inf"), 0], [0, float("nan")], [1e400, 0]])
+def test_non_finite_center_rejected(center):
+    for filt in (location("within_radius", {"center": center, "radius": 100}),
+                 location("nearest_k", {"center": center, "k": 1})):
+        with pytest.raises(FilterError):
+            validate_filter(filt)
+
+
+@pytest.mark.parametrize("radius", [float("inf"), float("nan"), -1])
+def test_bad_radius_rejected(radius):
+    with pytest.raises(FilterError):
+        validate_filter(location("within_radius", {"center": [0, 0], "radius": radius}))
@@ -9,6 +9,7 @@ export const API_BASE_URL =
 
   export const API_ROUTES = {
     BUILDINGS: "https://urban-3d-dashboard.onrender.com/api/buildings",
+    BUILDINGS_BINARY: "https://urban-3d-dashboard.onrender.com/api/buildings?format=binary",
     QUERY: "https://urban-3d-dashboard.onrender.com/api/query",
     HEALTH: "https://urban-3d-dashboard.onrender.com/api/health",
   };
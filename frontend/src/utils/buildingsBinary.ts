@@ -0,0 +1,51 @@
+import { Building } from "@/types/building";
+
+const MAGIC = "UB3D";
+const HEADER_BYTES = 20;
+
+export interface BuildingsBuffer {
+  count: number;
+  offsets: Uint32Array; // first vertex of each footprint (count + 1 entries)
+  heights: Float32Array;
+  vertices: Float32Array; // flat x, y pairs, ready for a BufferAttribute
+  attributes: Omit<Building, "footprint" | "height">[];
+}
+
+/**
+ * Decode the compact /api/buildings?format=binary payload.
+ * Typed arrays are views over the response buffer, no copies are made.
+ */
+export function decodeBuildingsBinary(buffer: ArrayBuffer): BuildingsBuffer {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) throw new Error("Not a UB3D buildings payload");
+
+  const count = view.getUint32(8, true);
+  const vertexCount = view.getUint32(12, true);
+  const tableBytes = view.getUint32(16, true);
+
+  let offset = HEADER_BYTES;
+  const offsets = new Uint32Array(buffer, offset, count + 1);
+  offset += offsets.byteLength;
+  const heights = new Float32Array(buffer, offset, count);
+  offset += heights.byteLength;
+  const vertices = new Float32Array(buffer, offset, vertexCount * 2);
+  offset += vertices.byteLength;
+
+  const table = new TextDecoder().decode(new Uint8Array(buffer, offset, tableBytes));
+
+  return { count, offsets, heights, vertices, attributes: JSON.parse(table) };
+}
+
+/**
+ * Expand a decoded buffer back into Building objects (footprint as [x, y][]).
+ */
+export function toBuildings(data: BuildingsBuffer): Building[] {
+  return data.attributes.map((attrs, i) => {
+    const footprint: number[][] = [];
+    for (let v = data.offsets[i]; v < data.offsets[i + 1]; v++) {
+      footprint.push([data.vertices[v * 2], data.vertices[v * 2 + 1]]);
+    }
+    return { ...attrs, footprint, height: data.heights[i] } as Building;
+  });
+}